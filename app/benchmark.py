@@ -0,0 +1,454 @@
+import os
+# The benchmark owns its index in-process; set before app modules read it
+os.environ.setdefault("INDEX_SERVICE_URL", "local")
+from app import runtime
+runtime.configure("worker")
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import datetime
+import platform
+import tempfile
+import subprocess
+from io import BytesIO
+import numpy as np
+from PIL import Image, ImageDraw, ImageOps, ImageEnhance
+from app.memory_redis import MemoryRedis, AsyncMemoryRedis
+from app import results
+from app import versions
+
+# End-to-end benchmark for ingest -> embed -> match -> write-back, run entirely
+# on one box: synthetic photos, an in-process Redis stand-in and an in-process
+# index, so numbers are comparable between commits. Reports:
+#   stages      per-image decode, preprocess, 8-variant inference, FAISS search,
+#               index save and Redis write-back latency
+#   worker      jobs/sec through dequeue -> process_job -> ack
+#   index_io    faiss.index + metadata.pkl save/load time against index size
+#   listing     admin/user listing handler latency against number of jobs
+#
+#   python -m app.benchmark --corpus 200 --out bench.json
+#   python -m app.benchmark --baseline bench.json --tolerance 0.2
+#
+# With --baseline the run exits 1 if any tracked metric regressed by more than
+# the tolerance, so it can gate a change.
+
+LOCATIONS = ["Library", "Hostel J", "Mess B", "Auditorium", "Sports Complex", "Main Gate", "Lab Block", "Cafeteria"]
+ITEMS = ["Black wallet", "Blue water bottle", "Phone", "Keys", "Backpack", "Earphones", "Umbrella", "Calculator", "ID card", "Watch"]
+
+# -- synthetic data ---------------------------------------------------------
+
+def synthetic_image(seed: int, size=(640, 480)) -> Image.Image:
+    # A coloured background with a few random shapes: distinct enough between
+    # seeds that unrelated photos don't match, cheap enough to make thousands
+    rng = random.Random(seed)
+    img = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    w, h = size
+    for _ in range(rng.randint(3, 8)):
+        x0, y0 = rng.randrange(w), rng.randrange(h)
+        x1, y1 = min(w, x0 + rng.randint(40, w // 2)), min(h, y0 + rng.randint(40, h // 2))
+        colour = tuple(rng.randrange(256) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.ellipse([x0, y0, x1, y1], fill=colour)
+        else:
+            draw.rectangle([x0, y0, x1, y1], fill=colour)
+    return img
+
+def photographed_again(img: Image.Image, seed: int) -> Image.Image:
+    # The same object seen by a different person: rotated, cropped, lit differently
+    rng = random.Random(seed)
+    w, h = img.size
+    dx, dy = int(w * rng.uniform(0, 0.1)), int(h * rng.uniform(0, 0.1))
+    out = img.crop((dx, dy, w - dx, h - dy))
+    out = out.rotate(rng.choice([0, 90, 180, 270]), expand=True)
+    if rng.random() < 0.5:
+        out = ImageOps.mirror(out)
+    return ImageEnhance.Brightness(out).enhance(rng.uniform(0.8, 1.2))
+
+def encode_jpeg(img: Image.Image, quality: int = 85) -> bytes:
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+def synthetic_jobs(n: int, seed: int = 0, match_fraction: float = 0.5) -> list:
+    """n reports, found items first; match_fraction of the lost reports are
+    re-photographs of a found item so the matching branches are exercised."""
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    n_found = n // 2
+    jobs = []
+    for i in range(n):
+        found = i < n_found
+        if not found and n_found and rng.random() < match_fraction:
+            source = rng.randrange(n_found)
+            image = photographed_again(synthetic_image(seed * 100003 + source), seed + i)
+        else:
+            image = synthetic_image(seed * 100003 + i)
+        jobs.append({
+            "job_id": f"bench-{seed}-{i}",
+            "type": "admin_found" if found else "user_complaint",
+            "location": rng.choice(LOCATIONS),
+            "date": (today - datetime.timedelta(days=rng.randrange(20))).isoformat(),
+            "itemName": rng.choice(ITEMS),
+            "user_id": None if found else f"user-{rng.randrange(max(1, n // 10))}",
+            "user_name": "bench",
+            "timestamp": time.time(),
+            "image_bytes": encode_jpeg(image),
+        })
+    return jobs
+
+def random_unit_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def synthetic_metas(n: int, seed: int = 0, exemplars: int = 8) -> list:
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    metas = []
+    for i in range(n):
+        metas.append({
+            "job_id": f"synthetic-{i // exemplars}",
+            "exemplar": i % exemplars,
+            "type": "found_report" if (i // exemplars) % 2 == 0 else "lost_report",
+            "location": rng.choice(LOCATIONS),
+            "date": (today - datetime.timedelta(days=rng.randrange(60))).isoformat(),
+            "itemName": rng.choice(ITEMS),
+            "timestamp": time.time(),
+        })
+    return metas
+
+# -- measurement ------------------------------------------------------------
+
+class Stages:
+    def __init__(self):
+        self.samples = {}
+
+    def record(self, name: str, started: float):
+        self.samples.setdefault(name, []).append((time.perf_counter() - started) * 1000.0)
+
+    def summary(self) -> dict:
+        return {name: summarize(ms) for name, ms in self.samples.items()}
+
+def summarize(ms: list) -> dict:
+    arr = np.asarray(ms, dtype=np.float64)
+    return {
+        "n": int(arr.size),
+        "mean_ms": float(arr.mean()),
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p95_ms": float(np.percentile(arr, 95)),
+        "max_ms": float(arr.max()),
+    }
+
+def _embed_stages(image_bytes: bytes, stages: Stages):
+    # Mirrors get_resnet_embeddings_variants_from_bytes with a clock around each step
+    from app import embeddings_resnet as er
+    import torch
+    started = time.perf_counter()
+    img = Image.open(BytesIO(image_bytes)).convert("RGB")
+    img = ImageOps.autocontrast(img, cutoff=2)
+    stages.record("decode", started)
+
+    started = time.perf_counter()
+    flip = ImageOps.mirror(img)
+    variants = [img, img.rotate(90, expand=True), img.rotate(180, expand=True), img.rotate(270, expand=True),
+                flip, flip.rotate(90, expand=True), flip.rotate(180, expand=True), flip.rotate(270, expand=True)]
+    tensors = [er._PREPROCESS(v).unsqueeze(0).to(er._DEVICE) for v in variants]
+    stages.record("preprocess", started)
+
+    started = time.perf_counter()
+    vecs = []
+    with torch.no_grad():
+        for t in tensors:
+            vec = er._extract_features(t, er._MODEL).cpu().numpy().flatten()
+            norm = np.linalg.norm(vec)
+            vecs.append(vec if norm == 0 else vec / norm)
+    stages.record("inference_8_variants", started)
+    return vecs
+
+def _embed_stages_fallback(image_bytes: bytes, stages: Stages):
+    # Without ResNet: time decode for real and the fake or hash embedder as "inference"
+    from app.embedding import get_image_embeddings_variants_from_bytes
+    started = time.perf_counter()
+    ImageOps.autocontrast(Image.open(BytesIO(image_bytes)).convert("RGB"), cutoff=2)
+    stages.record("decode", started)
+    started = time.perf_counter()
+    vecs = get_image_embeddings_variants_from_bytes(image_bytes)
+    stages.record("inference_8_variants", started)
+    return vecs
+
+def _embedder_name() -> str:
+    from app.embedding import EMBEDDER_NAME
+    return EMBEDDER_NAME
+
+def _write_back(r, job: dict, result: dict):
+    # Same calls process_job makes to publish a result
+    job_id = job["job_id"]
+    job_info_str = r.get(f"job:{job_id}")
+    if job_info_str:
+        job_info = json.loads(job_info_str)
+        job_info["status"] = result["status"]
+        job_info["processed_at"] = time.time()
+        r.set(f"job:{job_id}", json.dumps(job_info))
+        r.expire(f"job:{job_id}", 60*60*24*30)
+    results.write(r, job_id, result["status"], result.get("matches"), result.get("message", ""))
+    versions.bump_job(r, job_id, job)
+
+def _job_record(job: dict) -> dict:
+    return {k: v for k, v in job.items() if k != "image_bytes"} | {"status": "queued"}
+
+def bench_stages(jobs: list, index_rows: int, workdir: str, redis_client) -> dict:
+    from app.faiss_db import FaissImageDB, get_best_matches
+    from app.metadata_filters import match_filters
+    stages = Stages()
+    db = FaissImageDB(dim=2048)
+    db.add_rows(random_unit_vectors(index_rows, 2048), synthetic_metas(index_rows))
+    resnet = _embedder_name() == "resnet50"
+    for job in jobs:
+        redis_client.set(f"job:{job['job_id']}", json.dumps(_job_record(job)))
+        vecs = _embed_stages(job["image_bytes"], stages) if resnet else _embed_stages_fallback(job["image_bytes"], stages)
+        target = "found_report" if job["type"] == "user_complaint" else "lost_report"
+        started = time.perf_counter()
+        matches = db.query_batch(np.asarray(vecs, dtype=np.float32), target, k=5,
+                                 query_location=job["location"], filters=match_filters(job))
+        stages.record("faiss_search", started)
+        high, med = get_best_matches(matches)
+        result = {"status": "matched" if (high or med) else "no_match", "matches": high or med}
+        started = time.perf_counter()
+        _write_back(redis_client, job, result)
+        stages.record("redis_write_back", started)
+
+    # One full snapshot write; the index service does these in the background
+    index_path = os.path.join(workdir, "stages.index")
+    meta_path = os.path.join(workdir, "stages_metadata.pkl")
+    for _ in range(max(3, min(10, len(jobs)))):
+        started = time.perf_counter()
+        db.save(index_path, meta_path)
+        stages.record("index_save", started)
+    return {"index_rows": index_rows, "per_stage": stages.summary()}
+
+def bench_worker(jobs: list, workdir: str, redis_client) -> dict:
+    from app import queue_config, offline_processor, index_client, storage
+    from app.index_service import IndexService
+    from app import retention
+    retention.ARCHIVE_INDEX_PATH = os.path.join(workdir, "archive.index")
+    retention.ARCHIVE_METADATA_PATH = os.path.join(workdir, "archive_metadata.pkl")
+    storage.UPLOAD_DIR = os.path.join(workdir, "uploads")
+    os.makedirs(storage.UPLOAD_DIR, exist_ok=True)
+    index_client._local = IndexService(
+        index_path=os.path.join(workdir, "worker.index"),
+        metadata_path=os.path.join(workdir, "worker_metadata.pkl"),
+    )
+    for job in jobs:
+        record = _job_record(job)
+        record["image_path"] = storage.save_stream(BytesIO(job["image_bytes"]), job["job_id"])
+        redis_client.set(f"job:{job['job_id']}", json.dumps(record))
+        queue_config.enqueue_job(record, queue_config.lane_for_job_type(job["type"]))
+
+    latencies = []
+    statuses = {}
+    started = time.perf_counter()
+    for _ in range(len(jobs)):
+        job = queue_config.dequeue_job()
+        if not job:
+            break
+        job_started = time.perf_counter()
+        offline_processor.process_job(job)
+        queue_config.ack_job(job)
+        latencies.append((time.perf_counter() - job_started) * 1000.0)
+        status = results.decode(redis_client.view(False).get(f"result:{job['job_id']}"))["status"]
+        statuses[status] = statuses.get(status, 0) + 1
+    elapsed = time.perf_counter() - started
+    # The index files live in workdir, which the caller removes next
+    index_client.close()
+    return {
+        "jobs": len(latencies),
+        "elapsed_s": elapsed,
+        "jobs_per_s": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "job_latency": summarize(latencies) if latencies else None,
+        "results": statuses,
+    }
+
+def bench_index_io(sizes: list, workdir: str, repeats: int = 3) -> list:
+    from app.faiss_db import FaissImageDB
+    rows = []
+    for n in sizes:
+        db = FaissImageDB(dim=2048)
+        db.add_rows(random_unit_vectors(n, 2048, seed=n), synthetic_metas(n, seed=n))
+        index_path = os.path.join(workdir, f"io_{n}.index")
+        meta_path = os.path.join(workdir, f"io_{n}_metadata.pkl")
+        save_ms, load_ms = [], []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            db.save(index_path, meta_path)
+            save_ms.append((time.perf_counter() - started) * 1000.0)
+            started = time.perf_counter()
+            FaissImageDB(dim=2048).load(index_path, meta_path)
+            load_ms.append((time.perf_counter() - started) * 1000.0)
+        rows.append({
+            "vectors": n,
+            "bytes": os.path.getsize(index_path) + os.path.getsize(meta_path),
+            "save_ms": float(np.median(save_ms)),
+            "load_ms": float(np.median(load_ms)),
+        })
+        os.remove(index_path)
+        os.remove(meta_path)
+    return rows
+
+def _seed_listing(redis_client, n: int, user_id: str):
+    pipe = redis_client.pipeline(transaction=False)
+    now = time.time()
+    for i in range(n):
+        job_id = f"listing-{i}"
+        lost = i % 2 == 0
+        job_info = {
+            "job_id": job_id,
+            "type": "user_complaint" if lost else "admin_found",
+            "location": LOCATIONS[i % len(LOCATIONS)],
+            "date": datetime.date.today().isoformat(),
+            "itemName": ITEMS[i % len(ITEMS)],
+            "user_id": user_id if lost else None,
+            "status": "processed",
+            "timestamp": now - i,
+        }
+        pipe.set(f"job:{job_id}", json.dumps(job_info))
+        results.write(pipe, job_id, "matched", [{"meta": {"job_id": f"listing-{i + 1}"}, "score": 0.93}], "Match found!")
+        pipe.sadd("jobs:all", job_id)
+        if lost:
+            pipe.sadd("jobs:lost_all", job_id)
+            pipe.sadd(f"user:jobs:{user_id}", job_id)
+    pipe.execute()
+
+def bench_listing(sizes: list, repeats: int = 5) -> list:
+    from fastapi import Response
+    from app import routes
+    rows = []
+    for n in sizes:
+        client = MemoryRedis()
+        routes.ar = AsyncMemoryRedis(client)
+        routes.arb = AsyncMemoryRedis(client.view(False))
+        _seed_listing(client, n, "bench-user")
+        row = {"jobs": n}
+        handlers = {
+            "admin_lost_items": lambda: routes.admin_list_lost_items(Response(), if_none_match=None),
+            "admin_found_items": lambda: routes.admin_list_found_items(Response(), if_none_match=None),
+            "user_complaints": lambda: routes.get_user_complaints(Response(), authorization=None, userId="bench-user", if_none_match=None),
+        }
+        # A dashboard refresh with nothing changed: answered from the versions hash
+        first = Response()
+        asyncio.run(routes.get_user_complaints(first, authorization=None, userId="bench-user", if_none_match=None))
+        etag = first.headers.get("etag")
+        handlers["user_complaints_304"] = lambda: routes.get_user_complaints(Response(), authorization=None, userId="bench-user", if_none_match=etag)
+        for name, call in handlers.items():
+            ms = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                asyncio.run(call())
+                ms.append((time.perf_counter() - started) * 1000.0)
+            row[name] = summarize(ms)
+        rows.append(row)
+    return rows
+
+# -- baseline comparison ----------------------------------------------------
+
+def tracked_metrics(report: dict) -> dict:
+    """Flat name -> (value, higher_is_better) for the numbers a change should not regress."""
+    metrics = {}
+    for name, s in (report.get("stages") or {}).get("per_stage", {}).items():
+        metrics[f"stages.{name}.p50_ms"] = (s["p50_ms"], False)
+    worker = report.get("worker") or {}
+    if worker.get("jobs"):
+        metrics["worker.jobs_per_s"] = (worker["jobs_per_s"], True)
+    for row in report.get("index_io") or []:
+        metrics[f"index_io.{row['vectors']}.save_ms"] = (row["save_ms"], False)
+        metrics[f"index_io.{row['vectors']}.load_ms"] = (row["load_ms"], False)
+    for row in report.get("listing") or []:
+        for name, s in row.items():
+            if isinstance(s, dict):
+                metrics[f"listing.{row['jobs']}.{name}.p50_ms"] = (s["p50_ms"], False)
+    return metrics
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    current = tracked_metrics(report)
+    regressions = []
+    for name, (old, higher_is_better) in tracked_metrics(baseline).items():
+        if name not in current or not old:
+            continue
+        new = current[name][0]
+        change = (new - old) / old
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            regressions.append({"metric": name, "baseline": old, "current": new, "change": change})
+    return regressions
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def _sizes(text: str) -> list:
+    return [int(s) for s in text.split(",") if s.strip()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end benchmark for the matching pipeline")
+    parser.add_argument("--corpus", type=int, default=40, help="synthetic reports run through the stage timings and the worker")
+    parser.add_argument("--index-rows", type=int, default=20000, help="vectors in the index the stage timings search")
+    parser.add_argument("--index-sizes", default="1000,10000,50000", help="index sizes for the save/load timings")
+    parser.add_argument("--listing-sizes", default="100,1000,5000", help="job counts for the listing timings")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip", default="", help="comma list of sections to skip: stages,worker,index_io,listing")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression against the baseline")
+    args = parser.parse_args(argv)
+    skip = {s.strip() for s in args.skip.split(",") if s.strip()}
+
+    from app import queue_config, offline_processor
+    redis_client = MemoryRedis()
+    queue_config.r = offline_processor.r = redis_client
+    queue_config.ar = AsyncMemoryRedis(redis_client)
+    queue_config.rb = redis_client.view(False)
+    queue_config.arb = AsyncMemoryRedis(redis_client.view(False))
+    queue_config._group_ready = False
+
+    jobs = synthetic_jobs(args.corpus, seed=args.seed)
+    report = {"meta": {
+        "timestamp": time.time(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "embedder": _embedder_name(),
+        "args": vars(args),
+    }}
+    with tempfile.TemporaryDirectory(prefix="lostandfound-bench-") as workdir:
+        if "stages" not in skip:
+            report["stages"] = bench_stages(jobs, args.index_rows, workdir, redis_client)
+        if "worker" not in skip:
+            report["worker"] = bench_worker(jobs, workdir, redis_client)
+        if "index_io" not in skip:
+            report["index_io"] = bench_index_io(_sizes(args.index_sizes), workdir)
+        if "listing" not in skip:
+            report["listing"] = bench_listing(_sizes(args.listing_sizes))
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+        status = 1 if report["regressions"] else 0
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    for reg in report.get("regressions", []):
+        print(f"REGRESSION {reg['metric']}: {reg['baseline']:.3f} -> {reg['current']:.3f} ({reg['change']:+.0%})", file=sys.stderr)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,71 +1,249 @@
-import os
-import socket
-import ssl
-
-REDIS_HOST = os.getenv("REDIS_HOST", "redis-14696.c330.asia-south1-1.gce.redns.redis-cloud.com")
-REDIS_PORT = int(os.getenv("REDIS_PORT", "14696"))
-REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", "6CWoI4fVTA1WVSDZibKXuqGgeW3RfxnT")
-
-def resp_command(*args):
-    parts = [f"*{len(args)}\r\n".encode()]
-    for a in args:
-        val = str(a).encode()
-        parts.append(f"${len(val)}\r\n".encode())
-        parts.append(val + b"\r\n")
-    return b"".join(parts)
-
-def read_reply(sock):
-    # Simple RESP reader for status/integer replies
-    data = b""
-    while True:
-        chunk = sock.recv(4096)
-        if not chunk:
-            break
-        data += chunk
-        if b"\r\n" in data:
-            break
-    return data.decode(errors="ignore")
-
-def flush(redis_host, redis_port, password):
-    # Try TLS first, fallback to plain TCP
-    for use_tls in (True, False):
-        try:
-            raw_sock = socket.create_connection((redis_host, redis_port), timeout=10)
-            sock = ssl.create_default_context().wrap_socket(raw_sock, server_hostname=redis_host) if use_tls else raw_sock
-
-            sock.sendall(resp_command("AUTH", password))
-            auth_reply = read_reply(sock)
-            if not auth_reply.startswith("+"):
-                raise RuntimeError(f"AUTH failed: {auth_reply}")
-
-            sock.sendall(resp_command("DBSIZE"))
-            before = read_reply(sock)
-
-            sock.sendall(resp_command("FLUSHALL"))
-            flush_reply = read_reply(sock)
-            if not flush_reply.startswith("+"):
-                raise RuntimeError(f"FLUSHALL failed: {flush_reply}")
-
-            sock.sendall(resp_command("DBSIZE"))
-            after = read_reply(sock)
-            try:
-                before_n = int(before.strip().lstrip(":"))
-            except Exception:
-                before_n = -1
+import sys
+import json
+import time
+import argparse
+from app.queue_config import r, rb
+from app import results
+from app import versions
+
+# Audit and compact the Redis key space and the FAISS index against each other.
+# Replaces the old FLUSHALL script: nothing live is wiped, and everything is
+# walked with SCAN/SSCAN in batches with pipelined lookups, so Redis is never
+# blocked by KEYS or SMEMBERS on a huge set. Finds:
+#
+#   orphan_results     result:{id} with no job:{id}            -> deleted
+#   dangling_matches   result matches pointing at a deleted job -> stripped
+#   legacy_results     result:{id} still in the old inline-JSON format
+#                                                               -> rewritten compact
+#   unindexed_jobs     job:{id} missing from jobs:all / jobs:lost_all / user:jobs:{uid}
+#                                                               -> re-added
+#   jobs_without_ttl   job:/result: keys that never got their 30-day TTL
+#                                                               -> TTL set
+#   stale_members      jobs:all, jobs:lost_all, user:jobs:*, batch:jobs:*
+#                      members whose job:{id} is gone           -> SREM
+#   stale_versions     versions hash fields of jobs whose job:{id} is gone
+#                                                               -> HDEL
+#   index_orphans      index reports with no job:{id}           -> deleted from the index
+#
+# Dry run by default; pass --apply to fix what it finds.
+#
+#   python -m app.clean_redis
+#   python -m app.clean_redis --apply --batch 500 --pause-ms 5
+
+JOB_TTL_S = 60*60*24*30
+SCAN_BATCH = 500
+
+class Audit:
+    def __init__(self, apply: bool = False, batch: int = SCAN_BATCH, pause_ms: int = 0, sample: int = 20):
+        self.apply = apply
+        self.batch = batch
+        self.pause_s = pause_ms / 1000.0
+        self.sample = sample
+        self.report = {}
+
+    def _found(self, check: str, items):
+        entry = self.report.setdefault(check, {"count": 0, "sample": []})
+        entry["count"] += len(items)
+        room = self.sample - len(entry["sample"])
+        if room > 0:
+            entry["sample"].extend(list(items)[:room])
+
+    def _batches(self, iterable):
+        batch = []
+        for item in iterable:
+            batch.append(item)
+            if len(batch) >= self.batch:
+                yield batch
+                batch = []
+                if self.pause_s:
+                    # Leave room for live traffic between batches
+                    time.sleep(self.pause_s)
+        if batch:
+            yield batch
+
+    def _existing_jobs(self, job_ids) -> set:
+        pipe = r.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.exists(f"job:{job_id}")
+        return {j for j, exists in zip(job_ids, pipe.execute()) if exists}
+
+    def _job_types(self, job_ids) -> dict:
+        pipe = r.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.get(f"job:{job_id}")
+        types = {}
+        for job_id, value in zip(job_ids, pipe.execute()):
             try:
-                after_n = int(after.strip().lstrip(":"))
-            except Exception:
-                after_n = -1
-
-            print(f"Redis cleared (TLS={use_tls}). Before DB size: {before_n}, After DB size: {after_n}")
-            sock.close()
-            return True
-        except Exception as e:
-            if use_tls:
-                continue
-            else:
-                print(f"Failed to clear Redis: {e}")
-                return False
+                types[job_id] = json.loads(value).get("type") if value else None
+            except (ValueError, AttributeError):
+                types[job_id] = None
+        return types
+
+    def check_results(self):
+        for keys in self._batches(r.scan_iter(match="result:*", count=self.batch)):
+            job_ids = [k.split(":", 1)[1] for k in keys]
+            # Result records are msgpack, so they are read with the binary client
+            pipe = rb.pipeline(transaction=False)
+            for key in keys:
+                pipe.get(key)
+                pipe.ttl(key)
+            replies = pipe.execute()
+            values, ttls = replies[0::2], replies[1::2]
+
+            # One EXISTS round-trip covers both the result owners and every job they match
+            parsed = []
+            legacy = set()
+            for key, value in zip(keys, values):
+                try:
+                    record = results.decode(value)
+                    if value and results.is_legacy(value):
+                        legacy.add(key)
+                except (ValueError, TypeError):
+                    record = None
+                parsed.append(record)
+            existing = self._existing_jobs(sorted(set(job_ids) | results.referenced_ids(parsed)))
+
+            orphans = [k for k, j in zip(keys, job_ids) if j not in existing]
+            no_ttl = [k for k, j, t in zip(keys, job_ids, ttls) if j in existing and t == -1]
+            rewrites = {}
+            dangling = {}
+            for key, job_id, record in zip(keys, job_ids, parsed):
+                if job_id not in existing or not record:
+                    continue
+                gone = {ref[0] for ref in record["refs"]} - existing
+                if gone:
+                    dangling[key] = gone
+                elif key in legacy:
+                    rewrites[key] = record
+            # The owner's type picks the no_match message, as the delete handlers do
+            owners = self._job_types([k.split(":", 1)[1] for k in dangling])
+            records = dict(zip(keys, parsed))
+            for key, gone in dangling.items():
+                rewrites[key] = results.without(records[key], gone, owners.get(key.split(":", 1)[1]))
+            self._found("orphan_results", orphans)
+            self._found("dangling_matches", list(dangling))
+            self._found("legacy_results", [k for k in rewrites if k in legacy])
+            self._found("jobs_without_ttl", no_ttl)
+
+            if self.apply and (orphans or rewrites or no_ttl):
+                pipe = r.pipeline(transaction=False)
+                if orphans:
+                    pipe.delete(*orphans)
+                for key, record in rewrites.items():
+                    pipe.set(key, results.encode(record), keepttl=True)
+                for key in no_ttl:
+                    pipe.expire(key, JOB_TTL_S)
+                pipe.execute()
+
+    def check_jobs(self):
+        for keys in self._batches(r.scan_iter(match="job:*", count=self.batch)):
+            pipe = r.pipeline(transaction=False)
+            for key in keys:
+                pipe.get(key)
+                pipe.ttl(key)
+            replies = pipe.execute()
+
+            expected = []
+            no_ttl = []
+            for key, value, ttl in zip(keys, replies[0::2], replies[1::2]):
+                if ttl == -1:
+                    no_ttl.append(key)
+                try:
+                    job = json.loads(value) if value else None
+                except ValueError:
+                    job = None
+                if not isinstance(job, dict):
+                    continue
+                job_id = key.split(":", 1)[1]
+                if job.get("type") == "user_complaint":
+                    expected.append((job_id, "jobs:lost_all"))
+                    if job.get("user_id"):
+                        expected.append((job_id, f"user:jobs:{job['user_id']}"))
+                else:
+                    expected.append((job_id, "jobs:all"))
+
+            pipe = r.pipeline(transaction=False)
+            for job_id, set_name in expected:
+                pipe.sismember(set_name, job_id)
+            missing = [(j, s) for (j, s), member in zip(expected, pipe.execute()) if not member]
+            self._found("unindexed_jobs", [f"{s} <- {j}" for j, s in missing])
+            self._found("jobs_without_ttl", no_ttl)
+
+            if self.apply and (missing or no_ttl):
+                pipe = r.pipeline(transaction=False)
+                for job_id, set_name in missing:
+                    pipe.sadd(set_name, job_id)
+                for key in no_ttl:
+                    pipe.expire(key, JOB_TTL_S)
+                pipe.execute()
+
+    def _check_set(self, set_name: str):
+        for members in self._batches(r.sscan_iter(set_name, count=self.batch)):
+            stale = sorted(set(members) - self._existing_jobs(members))
+            self._found("stale_members", [f"{set_name} -> {m}" for m in stale])
+            if self.apply and stale:
+                r.srem(set_name, *stale)
+
+    def check_sets(self):
+        for set_name in ("jobs:all", "jobs:lost_all"):
+            self._check_set(set_name)
+        for pattern in ("user:jobs:*", "batch:jobs:*"):
+            for set_name in r.scan_iter(match=pattern, count=self.batch):
+                self._check_set(set_name)
+
+    def check_versions(self):
+        # Per-job ETag counters outlive jobs dropped by their TTL; user and
+        # listing counters are kept, they are few and must never restart
+        fields = (f for f, _ in r.hscan_iter(versions.VERSIONS_KEY, match="job:*", count=self.batch))
+        for batch in self._batches(fields):
+            owners = {f: versions.job_of_field(f) for f in batch}
+            existing = self._existing_jobs(sorted(set(owners.values())))
+            stale = sorted(f for f, job_id in owners.items() if job_id not in existing)
+            self._found("stale_versions", stale)
+            if self.apply and stale:
+                r.hdel(versions.VERSIONS_KEY, *stale)
+
+    def check_index(self):
+        from app import index_client
+        from app.faiss_db import REPORT_TYPES
+        job_ids = []
+        for report_type in REPORT_TYPES:
+            job_ids.extend(m.get("job_id") for m in index_client.list_reports(report_type) if m.get("job_id"))
+        for batch in self._batches(job_ids):
+            orphans = sorted(set(batch) - self._existing_jobs(batch))
+            self._found("index_orphans", orphans)
+            if self.apply:
+                for job_id in orphans:
+                    index_client.delete(job_id)
+
+    def run(self, checks) -> dict:
+        started = time.time()
+        for check in checks:
+            getattr(self, f"check_{check}")()
+        if self.apply and any(entry["count"] for entry in self.report.values()):
+            # Fixes touch many jobs at once; invalidate every cached listing and result
+            pipe = r.pipeline(transaction=False)
+            versions.bump(pipe, [versions.EPOCH])
+            pipe.execute()
+        return {"applied": self.apply, "elapsed_s": round(time.time() - started, 2), "findings": self.report}
+
+CHECKS = ("results", "jobs", "sets", "versions", "index")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Audit and compact the Redis key space and the FAISS index")
+    parser.add_argument("--apply", action="store_true", help="fix what is found (default: report only)")
+    parser.add_argument("--checks", default=",".join(CHECKS), help=f"comma list of: {', '.join(CHECKS)}")
+    parser.add_argument("--batch", type=int, default=SCAN_BATCH, help="SCAN COUNT and pipeline size")
+    parser.add_argument("--pause-ms", type=int, default=0, help="sleep between batches")
+    parser.add_argument("--sample", type=int, default=20, help="example keys to list per finding")
+    args = parser.parse_args(argv)
+    checks = [c.strip() for c in args.checks.split(",") if c.strip()]
+    unknown = set(checks) - set(CHECKS)
+    if unknown:
+        parser.error(f"unknown checks: {', '.join(sorted(unknown))}")
+    audit = Audit(apply=args.apply, batch=args.batch, pause_ms=args.pause_ms, sample=args.sample)
+    print(json.dumps(audit.run(checks), indent=2))
+    return 0
 
 if __name__ == "__main__":
-    flush(REDIS_HOST, REDIS_PORT, REDIS_PASSWORD)
\ No newline at end of file
+    sys.exit(main())
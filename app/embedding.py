@@ -1,23 +1,63 @@
+import os
 from io import BytesIO
 import base64
 
+# EMBEDDER picks the backend: "resnet" (default, ResNet50 via torch; falls back
+# to "hash" if torch can't be imported), "fake" (app/embeddings_fake.py, fast
+# and deterministic with realistic similarity, for load tests) or "hash".
+# EMBEDDER_NAME is the backend actually in use.
+EMBEDDER = os.getenv("EMBEDDER", "resnet")
+# Checked up front: only a missing torch may fall back to "hash", never a typo
+# or a broken fake backend
+if EMBEDDER not in ("resnet", "fake", "hash"):
+    raise ValueError(f"Unknown EMBEDDER={EMBEDDER!r}; expected resnet, fake or hash")
+
 try:
-    from .embeddings_resnet import get_resnet_embedding, get_resnet_embedding_from_bytes, get_resnet_embeddings_variants_from_bytes
+    if EMBEDDER == "fake":
+        from .embeddings_fake import (
+            get_fake_embedding_from_bytes as _from_bytes,
+            get_fake_embeddings_variants_from_bytes as _variants_from_bytes,
+            get_fake_embedding_single_from_bytes as _single_from_bytes,
+            get_fake_embeddings_remaining_variants_from_bytes as _remaining_from_bytes,
+        )
+        EMBEDDER_NAME = "fake"
+    elif EMBEDDER == "resnet":
+        from .embeddings_resnet import (
+            get_resnet_embedding_from_bytes as _from_bytes,
+            get_resnet_embeddings_variants_from_bytes as _variants_from_bytes,
+            get_resnet_embedding_single_from_bytes as _single_from_bytes,
+            get_resnet_embeddings_remaining_variants_from_bytes as _remaining_from_bytes,
+        )
+        EMBEDDER_NAME = "resnet50"
+    else:
+        raise ImportError("EMBEDDER=hash")
     EMBEDDING_DIM = 2048
 
     # Safe wrapper: use from_bytes if possible, else fallback
     def get_image_embedding_from_base64(image_b64: str):
         image_bytes = base64.b64decode(image_b64)
-        return get_resnet_embedding_from_bytes(image_bytes)
+        return _from_bytes(image_bytes)
 
     def get_image_embeddings_variants_from_base64(image_b64: str):
         image_bytes = base64.b64decode(image_b64)
-        return get_resnet_embeddings_variants_from_bytes(image_bytes)
+        return _variants_from_bytes(image_bytes)
+
+    def get_image_embeddings_variants_from_bytes(image_bytes: bytes):
+        return _variants_from_bytes(image_bytes)
+
+    def get_image_embedding_single_from_bytes(image_bytes: bytes):
+        return _single_from_bytes(image_bytes)
+
+    def get_image_embeddings_remaining_variants_from_bytes(image_bytes: bytes):
+        return _remaining_from_bytes(image_bytes)
 
 except Exception:
+    if EMBEDDER == "fake":
+        raise
     import hashlib
     import numpy as np
     EMBEDDING_DIM = 2048
+    EMBEDDER_NAME = "hash"
 
     def _hash_embed(image_bytes: bytes, dim: int = EMBEDDING_DIM) -> np.ndarray:
         h = hashlib.sha256(image_bytes).digest()
@@ -35,3 +75,14 @@ except Exception:
         image_bytes = base64.b64decode(image_b64)
         v = _hash_embed(image_bytes)
         return [v] * 8
+
+    def get_image_embeddings_variants_from_bytes(image_bytes: bytes):
+        v = _hash_embed(image_bytes)
+        return [v] * 8
+
+    def get_image_embedding_single_from_bytes(image_bytes: bytes):
+        return _hash_embed(image_bytes)
+
+    def get_image_embeddings_remaining_variants_from_bytes(image_bytes: bytes):
+        v = _hash_embed(image_bytes)
+        return [v] * 7
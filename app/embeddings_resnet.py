@@ -1,4 +1,6 @@
 import torch
+from app import runtime
+runtime.apply_torch()
 from torchvision import models, transforms
 from PIL import Image, ImageOps
 import numpy as np
@@ -50,6 +52,12 @@ def _embed_img(img: Image.Image) -> np.ndarray:
     norm = np.linalg.norm(vec)
     return vec if norm == 0 else vec / norm
 
+def get_resnet_embedding_single_from_bytes(image_bytes: bytes):
+    # Upright view only: one forward pass for the interactive search path
+    img = Image.open(BytesIO(image_bytes)).convert("RGB")
+    img = ImageOps.autocontrast(img, cutoff=2)
+    return _embed_img(img)
+
 def get_resnet_embedding_from_bytes(image_bytes: bytes):
     img = Image.open(BytesIO(image_bytes)).convert("RGB")
     img = ImageOps.autocontrast(img, cutoff=2)
@@ -70,12 +78,11 @@ def get_resnet_embedding_from_bytes(image_bytes: bytes):
     norm = np.linalg.norm(avg)
     return avg if norm == 0 else avg / norm
 
-def get_resnet_embeddings_variants_from_bytes(image_bytes: bytes):
-    img = Image.open(BytesIO(image_bytes)).convert("RGB")
-    img = ImageOps.autocontrast(img, cutoff=2)
+def _variants(img: Image.Image) -> list:
+    # Upright view first, then the other rotations and their mirror images
     base = img
     flip = ImageOps.mirror(base)
-    variants = [
+    return [
         base,
         base.rotate(90, expand=True),
         base.rotate(180, expand=True),
@@ -85,5 +92,20 @@ def get_resnet_embeddings_variants_from_bytes(image_bytes: bytes):
         flip.rotate(180, expand=True),
         flip.rotate(270, expand=True),
     ]
-    vecs = [_embed_img(v) for v in variants]
+
+def get_resnet_embeddings_variants_from_bytes(image_bytes: bytes):
+    img = Image.open(BytesIO(image_bytes)).convert("RGB")
+    img = ImageOps.autocontrast(img, cutoff=2)
+    vecs = [_embed_img(v) for v in _variants(img)]
     return vecs
+
+def get_resnet_embeddings_remaining_variants_from_bytes(image_bytes: bytes):
+    # The 7 non-upright views, in one batched forward pass. Together with
+    # get_resnet_embedding_single_from_bytes this gives the same 8 vectors.
+    img = Image.open(BytesIO(image_bytes)).convert("RGB")
+    img = ImageOps.autocontrast(img, cutoff=2)
+    batch = torch.stack([_PREPROCESS(v) for v in _variants(img)[1:]]).to(_DEVICE)
+    feats = _extract_features(batch, _MODEL).cpu().numpy()
+    norms = np.linalg.norm(feats, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return list(feats / norms)
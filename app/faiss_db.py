@@ -1,21 +1,270 @@
 import faiss
+from app import runtime
+runtime.apply_faiss()
 import numpy as np
 import pickle
 import os
+import json
+import glob
+import time
+import shutil
+import threading
+from app.metadata_filters import item_category, location_zone, day_ordinal
+from app.results import HIGH_CONFIDENCE, MEDIUM_CONFIDENCE
 
 def normalize(vec):
     norm = np.linalg.norm(vec)
     return vec if norm == 0 else vec / norm
 
+def get_best_matches(matches):
+    # Sort by score descending, then select by thresholds
+    matches = sorted(matches, key=lambda x: x["score"], reverse=True)
+    high_conf = [m for m in matches if m["score"] >= HIGH_CONFIDENCE]
+    med_conf = [m for m in matches if MEDIUM_CONFIDENCE <= m["score"] < HIGH_CONFIDENCE]
+    return high_conf, med_conf
+
+REPORT_TYPES = {"lost_report": 0, "found_report": 1}
+
+# Vector storage: "fp32" (IndexFlatIP), "fp16" (2x smaller) or "sq8" (8-bit
+# scalar quantized, 4x smaller). sq8 needs training, so an sq8 index stays
+# fp32 until it holds SQ_TRAIN_MIN vectors and is then trained and converted.
+INDEX_STORAGE = os.getenv("INDEX_STORAGE", "fp32")
+SQ_TRAIN_MIN = int(os.getenv("SQ_TRAIN_MIN", "1024"))
+
+def make_index(dim: int, storage: str = "fp32"):
+    if storage == "fp16":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+    if storage == "sq8":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    if storage != "fp32":
+        raise ValueError(f"Unknown index storage: {storage}")
+    return faiss.IndexFlatIP(dim)
+
+def index_storage(index) -> str:
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "fp32"
+
+# Snapshots are written as versioned files (faiss.index.v7, metadata.pkl.v7),
+# each fsynced, then committed by atomically replacing faiss.index.manifest.json
+# which names the pair. A crash at any point leaves the previous manifest and
+# its complete pair in place. The plain faiss.index/metadata.pkl names are
+# re-pointed at the newest pair for tools that read them directly.
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "2"))
+
+def manifest_path(index_path: str) -> str:
+    return index_path + ".manifest.json"
+
+def read_manifest(index_path: str):
+    try:
+        with open(manifest_path(index_path)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _fsync_dir(path: str):
+    try:
+        fd = os.open(path or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _write_durable(path: str, data):
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def _point_at(versioned: str, plain: str):
+    tmp = f"{plain}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        os.link(versioned, tmp)
+    except OSError:
+        shutil.copyfile(versioned, tmp)
+    os.replace(tmp, plain)
+
+def _prune_versions(path: str, keep_from: int):
+    for old in glob.glob(glob.escape(path) + ".v*"):
+        suffix = old.rsplit(".v", 1)[-1]
+        if suffix.isdigit() and int(suffix) < keep_from:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+def write_snapshot(index_path: str, metadata_path: str, index_bytes, metadata_bytes: bytes, ntotal: int) -> dict:
+    """Durably write one index/metadata pair and commit it via the manifest."""
+    previous = read_manifest(index_path) or {}
+    version = int(previous.get("version", 0)) + 1
+    index_file = f"{index_path}.v{version}"
+    metadata_file = f"{metadata_path}.v{version}"
+    _write_durable(index_file, index_bytes)
+    _write_durable(metadata_file, metadata_bytes)
+    manifest = {
+        "version": version,
+        "index_file": index_file,
+        "metadata_file": metadata_file,
+        "index_bytes": os.path.getsize(index_file),
+        "metadata_bytes": os.path.getsize(metadata_file),
+        "ntotal": int(ntotal),
+        "saved_at": time.time(),
+    }
+    dirs = {os.path.dirname(index_path), os.path.dirname(metadata_path)}
+    for d in dirs:
+        _fsync_dir(d)
+    _write_durable(manifest_path(index_path), json.dumps(manifest).encode("utf-8"))
+    _point_at(index_file, index_path)
+    _point_at(metadata_file, metadata_path)
+    for d in dirs:
+        _fsync_dir(d)
+    _prune_versions(index_path, version - SNAPSHOT_KEEP + 1)
+    _prune_versions(metadata_path, version - SNAPSHOT_KEEP + 1)
+    return manifest
+
+def _manifest_files(index_path: str):
+    # The committed pair, if the manifest exists and both files are intact
+    manifest = read_manifest(index_path)
+    if not manifest:
+        return None
+    try:
+        if (os.path.getsize(manifest["index_file"]) != manifest["index_bytes"]
+                or os.path.getsize(manifest["metadata_file"]) != manifest["metadata_bytes"]):
+            return None
+    except (OSError, KeyError):
+        return None
+    return manifest["index_file"], manifest["metadata_file"]
+
+def _location_key(loc):
+    if not loc:
+        return None
+    return str(loc).strip().lower() or None
+
 class FaissImageDB:
-    def __init__(self, dim=2048):
-        self.index = faiss.IndexFlatIP(dim)
+    def __init__(self, dim=2048, storage=None):
+        self.storage = storage or INDEX_STORAGE
+        self.index = make_index(dim, "fp32" if self.storage == "sq8" else self.storage)
         self.metadata = []
+        self._reset_columns()
+
+    def convert_storage(self, storage: str):
+        # Re-encode every vector into the target storage, training it if needed
+        current = index_storage(self.index)
+        if current == storage:
+            return
+        vectors = self.index.reconstruct_n(0, self.index.ntotal) if self.index.ntotal else None
+        new_index = make_index(self.index.d, storage)
+        if not new_index.is_trained:
+            if vectors is None or len(vectors) < SQ_TRAIN_MIN:
+                return
+            new_index.train(vectors)
+        if vectors is not None:
+            new_index.add(vectors)
+        self.index = new_index
+
+    def _maybe_convert_storage(self):
+        if index_storage(self.index) != self.storage:
+            self.convert_storage(self.storage)
+
+    # Per-row integer columns parallel to metadata (location, report type, job,
+    # live flag, day, zone, category) so filtering, scoring and collapsing can
+    # run in NumPy. They are appended as Python lists and turned into arrays
+    # lazily on the next query.
+    def _reset_columns(self):
+        self._loc_vocab = {}
+        self._job_vocab = {}
+        self._zone_vocab = {}
+        self._cat_vocab = {}
+        self._col_loc = []
+        self._col_type = []
+        self._col_job = []
+        self._col_live = []
+        self._col_day = []
+        self._col_ingested = []
+        self._col_zone = []
+        self._col_cat = []
+        self._arrays = None
+
+    @staticmethod
+    def _code(vocab, key):
+        return -1 if key is None else vocab.setdefault(key, len(vocab))
+
+    def _append_columns(self, meta):
+        if not isinstance(meta, dict):
+            meta = {"deleted": True}
+        day = day_ordinal(meta.get("date"), meta.get("timestamp"))
+        self._col_loc.append(self._code(self._loc_vocab, _location_key(meta.get("location"))))
+        self._col_type.append(REPORT_TYPES.get(meta.get("type"), -1))
+        self._col_job.append(self._code(self._job_vocab, meta.get("job_id") or None))
+        self._col_live.append(not meta.get("deleted"))
+        self._col_day.append(-1 if day is None else day)
+        # Retention ages reports by when they were filed, like the Redis TTL;
+        # the user-entered date above only feeds the match window
+        ingested = day_ordinal(None, meta.get("timestamp")) or day
+        self._col_ingested.append(-1 if ingested is None else ingested)
+        self._col_zone.append(self._code(self._zone_vocab, location_zone(meta.get("location"))))
+        self._col_cat.append(self._code(self._cat_vocab, item_category(meta.get("itemName"))))
+        self._arrays = None
+
+    def _rebuild_columns(self):
+        self._reset_columns()
+        for meta in self.metadata:
+            self._append_columns(meta)
+
+    def _columns(self):
+        if self._arrays is None:
+            self._arrays = {
+                "loc": np.array(self._col_loc, dtype=np.int32),
+                "type": np.array(self._col_type, dtype=np.int8),
+                "job": np.array(self._col_job, dtype=np.int64),
+                "live": np.array(self._col_live, dtype=bool),
+                "day": np.array(self._col_day, dtype=np.int32),
+                "ingested": np.array(self._col_ingested, dtype=np.int32),
+                "zone": np.array(self._col_zone, dtype=np.int32),
+                "cat": np.array(self._col_cat, dtype=np.int32),
+                "bitmaps": {},
+            }
+        return self._arrays
+
+    def _bitmap(self, attr, code):
+        # Cached per-attribute-value membership bitmap; unknown values (-1) always pass
+        cols = self._columns()
+        key = (attr, code)
+        if key not in cols["bitmaps"]:
+            col = cols[attr]
+            cols["bitmaps"][key] = (col == code) | (col < 0)
+        return cols["bitmaps"][key]
+
+    def candidate_mask(self, search_type, filters=None):
+        """Boolean row mask of live rows of search_type that pass the metadata filters."""
+        cols = self._columns()
+        mask = (cols["type"] == REPORT_TYPES.get(search_type, -2)) & cols["live"] & (cols["job"] >= 0)
+        filters = filters or {}
+        if filters.get("day") is not None and filters.get("date_window_days"):
+            day = cols["day"]
+            window = int(filters["date_window_days"])
+            mask = mask & ((day < 0) | (np.abs(day - int(filters["day"])) <= window))
+        if filters.get("zone"):
+            code = self._zone_vocab.get(filters["zone"])
+            mask = mask & (self._bitmap("zone", code) if code is not None else (cols["zone"] < 0))
+        if filters.get("category"):
+            code = self._cat_vocab.get(filters["category"])
+            mask = mask & (self._bitmap("cat", code) if code is not None else (cols["cat"] < 0))
+        return mask
 
     def add_embedding(self, embedding, meta: dict):
         embedding = normalize(embedding)
         self.index.add(np.array([embedding]).astype(np.float32))
         self.metadata.append(meta)
+        self._append_columns(meta)
+        if self.storage == "sq8" and self.index.ntotal >= SQ_TRAIN_MIN and index_storage(self.index) == "fp32":
+            self._maybe_convert_storage()
 
     def location_similarity(self, loc1, loc2):
         if not loc1 or not loc2:
@@ -47,19 +296,64 @@ class FaissImageDB:
             matches.append({"meta": meta, "score": float(combined_score)})
         return matches
 
+    def query_batch(self, embeddings, search_type, k=5, query_location=None, w_embed=0.9, w_loc=0.1, filters=None):
+        # Search all query vectors (e.g. the 8 TTA variants) in one call and
+        # return the best-scoring hit per matched job, highest score first.
+        # Type, tombstone and metadata filters are pushed into FAISS as an
+        # IDSelectorBitmap, so excluded rows are never scored.
+        if self.index.ntotal == 0 or len(self.metadata) == 0:
+            return []
+        x = np.asarray(embeddings, dtype=np.float32)
+        if x.ndim == 1:
+            x = x.reshape(1, -1)
+        norms = np.linalg.norm(x, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        x = np.ascontiguousarray(x / norms, dtype=np.float32)
+        cols = self._columns()
+        mask = self.candidate_mask(search_type, filters)
+        n_candidates = int(mask.sum())
+        if n_candidates == 0:
+            return []
+        # bits and sel must stay referenced until the search returns
+        bits = np.packbits(mask, bitorder="little")
+        sel = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bits))
+        params = faiss.SearchParameters(sel=sel)
+        D, I = self.index.search(x, min(k, n_candidates), params=params)
+        rows = I.ravel()
+        sims = D.ravel()
+        valid = (rows >= 0) & (rows < len(mask))
+        rows, sims = rows[valid], sims[valid]
+        if rows.size == 0:
+            return []
+        qloc = _location_key(query_location)
+        if qloc is None or qloc not in self._loc_vocab:
+            loc_score = np.full(rows.shape, 0.7, dtype=np.float32)
+        else:
+            loc_score = np.where(cols["loc"][rows] == self._loc_vocab[qloc], 1.0, 0.7).astype(np.float32)
+        scores = np.clip(w_embed * (sims + 1) / 2 + w_loc * loc_score, 0.0, 1.0)
+        # Collapse to one hit per job: sort by score, keep each job's first row
+        order = np.argsort(-scores, kind="stable")
+        _, first = np.unique(cols["job"][rows[order]], return_index=True)
+        best = order[np.sort(first)]
+        return [{"meta": self.metadata[int(rows[b])], "score": float(scores[b])} for b in best]
+
     def get_best_matches(self, matches):
-        # Sort by score descending, then select by thresholds
-        matches = sorted(matches, key=lambda x: x["score"], reverse=True)
-        high_conf = [m for m in matches if m["score"] >= 0.92]
-        med_conf = [m for m in matches if 0.72 <= m["score"] < 0.92]
-        return high_conf, med_conf
+        return get_best_matches(matches)
+
+    def serialize(self):
+        # In-memory copy of the current state, so a snapshot can be written
+        # to disk without holding the index lock
+        index_bytes = faiss.serialize_index(self.index)
+        metadata_bytes = pickle.dumps(self.metadata, protocol=pickle.HIGHEST_PROTOCOL)
+        return index_bytes, metadata_bytes, int(self.index.ntotal)
 
     def save(self, index_path: str, metadata_path: str):
-        faiss.write_index(self.index, index_path)
-        with open(metadata_path, "wb") as f:
-            pickle.dump(self.metadata, f)
+        return write_snapshot(index_path, metadata_path, *self.serialize())
 
     def load(self, index_path: str, metadata_path: str):
+        committed = _manifest_files(index_path)
+        if committed:
+            index_path, metadata_path = committed
         if os.path.exists(index_path):
             self.index = faiss.read_index(index_path)
         else:
@@ -79,6 +373,17 @@ class FaissImageDB:
                     self.metadata.extend([{"deleted": True}] * pad)
         except Exception:
             pass
+        self._rebuild_columns()
+        # Migrate an index saved with a different storage setting
+        self._maybe_convert_storage()
+
+    def has_job_id(self, job_id: str) -> bool:
+        if job_id not in self._job_vocab:
+            return False
+        for m in self.metadata:
+            if isinstance(m, dict) and m.get("job_id") == job_id and not m.get("deleted"):
+                return True
+        return False
 
     def remove_by_job_id(self, job_id: str) -> bool:
         # Soft-delete: mark metadata entries as deleted to keep index positions stable
@@ -87,31 +392,68 @@ class FaissImageDB:
             if isinstance(m, dict) and m.get("job_id") == job_id and not m.get("deleted"):
                 m["deleted"] = True
                 self.metadata[i] = m
+                self._col_live[i] = False
                 changed = True
+        if changed:
+            self._arrays = None
         return changed
 
     def purge_by_job_id(self, job_id: str) -> bool:
+        ids = [i for i, m in enumerate(self.metadata) if isinstance(m, dict) and m.get("job_id") == job_id]
+        if not ids:
+            return False
+        return self.remove_rows(ids) > 0
+
+    def remove_rows(self, rows) -> int:
+        # Hard-delete in place: remove_ids compacts the index keeping row order,
+        # so the matching metadata rows are dropped the same way.
         try:
-            ntotal = getattr(self.index, 'ntotal', 0)
-            new_index = faiss.IndexFlatIP(self.index.d)
-            new_metadata = []
-            for i in range(ntotal):
-                if i >= len(self.metadata):
-                    break
-                meta = self.metadata[i]
-                if not isinstance(meta, dict):
-                    continue
-                if meta.get("job_id") == job_id:
-                    continue
-                vec = None
-                if hasattr(self.index, 'reconstruct'):
-                    vec = self.index.reconstruct(i)
-                if vec is None:
-                    return False
-                new_index.add(np.array([vec]).astype(np.float32))
-                new_metadata.append(meta)
-            self.index = new_index
-            self.metadata = new_metadata
-            return True
+            rows = np.unique(np.asarray(rows, dtype=np.int64))
+            if rows.size == 0:
+                return 0
+            self.index.remove_ids(rows)
+            drop = set(rows.tolist())
+            self.metadata = [m for i, m in enumerate(self.metadata) if i not in drop]
+            self._rebuild_columns()
+            return int(rows.size)
         except Exception:
-            return False
+            return 0
+
+    def take_rows(self, rows):
+        # Vectors and metadata for the given rows, e.g. to move them to another index
+        rows = [int(i) for i in rows]
+        if not rows:
+            return np.zeros((0, self.index.d), dtype=np.float32), []
+        vectors = np.vstack([self.index.reconstruct(i) for i in rows]).astype(np.float32)
+        return vectors, [self.metadata[i] for i in rows]
+
+    def add_rows(self, vectors, metas):
+        vectors = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+        if len(metas) == 0:
+            return
+        self.index.add(vectors)
+        for meta in metas:
+            self.metadata.append(meta)
+            self._append_columns(meta)
+        if self.storage == "sq8":
+            self._maybe_convert_storage()
+
+    def rows_older_than(self, cutoff_day: int) -> np.ndarray:
+        cols = self._columns()
+        return np.nonzero(cols["live"] & (cols["ingested"] >= 0) & (cols["ingested"] < cutoff_day))[0]
+
+    def tombstone_rows(self) -> np.ndarray:
+        return np.nonzero(~self._columns()["live"])[0]
+
+    def live_job_ids(self) -> list:
+        seen = set()
+        for m in self.metadata:
+            if isinstance(m, dict) and not m.get("deleted") and m.get("job_id"):
+                seen.add(m["job_id"])
+        return list(seen)
+
+    def rows_for_job_ids(self, job_ids) -> np.ndarray:
+        codes = [self._job_vocab[j] for j in job_ids if j in self._job_vocab]
+        if not codes:
+            return np.zeros(0, dtype=np.int64)
+        return np.nonzero(np.isin(self._columns()["job"], codes))[0]
@@ -0,0 +1,146 @@
+import os
+import json
+import base64
+import urllib.request
+import urllib.error
+import threading
+import numpy as np
+
+# The worker and the API talk to the long-lived index service (app/index_service.py)
+# over HTTP. Set INDEX_SERVICE_URL=local to run the index in-process instead, which
+# is only meant for tests and benchmarks on a single box. With INDEX_SHARDS set,
+# calls go through the scatter/gather coordinator in app/index_shards.py instead.
+INDEX_SERVICE_URL = os.getenv("INDEX_SERVICE_URL", "http://127.0.0.1:8100")
+INDEX_SERVICE_TIMEOUT = float(os.getenv("INDEX_SERVICE_TIMEOUT", "30"))
+INDEX_SHARDED = bool(os.getenv("INDEX_SHARDS", "").strip())
+
+_local = None
+_local_lock = threading.Lock()
+
+def encode_vectors(vectors) -> dict:
+    arr = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+    if arr.ndim == 1:
+        arr = arr.reshape(1, -1)
+    return {"shape": list(arr.shape), "data": base64.b64encode(arr.tobytes()).decode("ascii")}
+
+def decode_vectors(payload: dict) -> np.ndarray:
+    data = base64.b64decode(payload["data"])
+    return np.frombuffer(data, dtype=np.float32).reshape(payload["shape"])
+
+def _local_service():
+    global _local
+    # Worker threads and the API threadpool may all reach here first; a second
+    # IndexService would leak its snapshot thread
+    with _local_lock:
+        if _local is None:
+            from app.index_service import IndexService
+            _local = IndexService()
+    return _local
+
+def close():
+    """Flush and stop the in-process index service, if one was started."""
+    global _local
+    with _local_lock:
+        if _local is not None:
+            _local.close()
+            _local = None
+
+def _sharded():
+    from app.index_shards import get_sharded_index
+    return get_sharded_index()
+
+def _request(method: str, path: str, payload=None, base_url: str = None):
+    body = json.dumps(payload).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(
+        (base_url or INDEX_SERVICE_URL).rstrip("/") + path,
+        data=body,
+        method=method,
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=INDEX_SERVICE_TIMEOUT) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(f"Index service {path} failed: {e.code} {e.read()[:200]!r}")
+
+def add_report(job_id: str, meta: dict, vectors, first_exemplar: int = 0) -> int:
+    """Index all exemplar vectors of one report. Re-adding a known job_id is a no-op.
+
+    first_exemplar > 0 appends the views from that exemplar on to a report
+    already indexed; meta must still carry its location for sharding.
+    """
+    if INDEX_SHARDED:
+        return _sharded().add_report(job_id, meta, vectors, first_exemplar)
+    if INDEX_SERVICE_URL == "local":
+        return _local_service().add_report(job_id, meta, np.asarray(vectors, dtype=np.float32), first_exemplar)
+    resp = _request("POST", "/add", {"job_id": job_id, "meta": meta, "vectors": encode_vectors(vectors),
+                                     "first_exemplar": first_exemplar})
+    return resp.get("added", 0)
+
+def search(vectors, search_type: str, k: int = 5, query_location=None, filters=None, include_archive=False,
+           partial_ok: bool = False) -> list:
+    """Best match per job over all query vectors, highest score first.
+
+    filters restricts candidates before scoring: {"day", "date_window_days"},
+    {"zone"} and/or {"category"} as built by metadata_filters.match_filters.
+    include_archive also searches reports aged out of the hot index.
+    partial_ok lets a sharded index answer from the healthy shards when one
+    fails; leave it off where the result is stored.
+    """
+    if INDEX_SHARDED:
+        return _sharded().search(vectors, search_type, k, query_location, filters, include_archive, partial_ok)
+    if INDEX_SERVICE_URL == "local":
+        return _local_service().search(np.asarray(vectors, dtype=np.float32), search_type, k, query_location, filters, include_archive)
+    resp = _request("POST", "/search", {
+        "vectors": encode_vectors(vectors),
+        "search_type": search_type,
+        "k": k,
+        "query_location": query_location,
+        "filters": filters,
+        "include_archive": include_archive,
+    })
+    return resp.get("matches", [])
+
+def delete(job_id: str) -> bool:
+    if INDEX_SHARDED:
+        return _sharded().delete(job_id)
+    if INDEX_SERVICE_URL == "local":
+        return _local_service().delete(job_id)
+    return _request("POST", "/delete", {"job_id": job_id}).get("deleted", False)
+
+def has_job(job_id: str) -> bool:
+    if INDEX_SHARDED:
+        return _sharded().has_job(job_id)
+    if INDEX_SERVICE_URL == "local":
+        return _local_service().has_job(job_id)
+    return _request("GET", f"/jobs/{job_id}").get("exists", False)
+
+def list_reports(report_type: str) -> list:
+    if INDEX_SHARDED:
+        return _sharded().list_reports(report_type)
+    if INDEX_SERVICE_URL == "local":
+        return _local_service().list_reports(report_type)
+    return _request("GET", f"/reports?type={report_type}").get("reports", [])
+
+def export(job_ids) -> list:
+    """Live vectors and metadata per job: [{"job_id", "meta", "vectors"}]."""
+    if INDEX_SHARDED:
+        return _sharded().export(job_ids)
+    if INDEX_SERVICE_URL == "local":
+        return _local_service().export_jobs(list(job_ids))
+    reports = _request("POST", "/export", {"job_ids": list(job_ids)}).get("reports", [])
+    return [{**r, "vectors": decode_vectors(r["vectors"])} for r in reports]
+
+def run_retention() -> dict:
+    if INDEX_SHARDED:
+        return _sharded().run_retention()
+    if INDEX_SERVICE_URL == "local":
+        return _local_service().run_retention()
+    return _request("POST", "/retention/run", {})
+
+def stats() -> dict:
+    if INDEX_SHARDED:
+        return _sharded().stats()
+    if INDEX_SERVICE_URL == "local":
+        return _local_service().stats()
+    return _request("GET", "/stats")
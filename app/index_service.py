@@ -0,0 +1,331 @@
+from app import runtime
+runtime.configure("index")
+import os
+import atexit
+import threading
+import time
+import numpy as np
+from fastapi import FastAPI, Body, HTTPException
+from app.faiss_db import FaissImageDB, INDEX_STORAGE, index_storage, write_snapshot, read_manifest
+from app.index_client import decode_vectors, encode_vectors
+from app import retention
+from app import metrics
+from fastapi.responses import Response
+
+# Single long-lived owner of the FAISS index. The API and the workers send
+# add/search/delete calls here, so the index stays hot in memory and every
+# mutation is applied in place instead of reloading faiss.index from disk.
+#
+#   uvicorn app.index_service:app --host 127.0.0.1 --port 8100 --workers 1
+#
+# Run exactly one process per index files: it is the only writer.
+INDEX_PATH = os.getenv("INDEX_PATH", "faiss.index")
+METADATA_PATH = os.getenv("METADATA_PATH", "metadata.pkl")
+INDEX_SERVICE_PORT = int(os.getenv("INDEX_SERVICE_PORT", "8100"))
+# Mutations are persisted by a background snapshot at most SNAPSHOT_INTERVAL_S
+# after they happen, or sooner once SNAPSHOT_MAX_PENDING have piled up. A crash
+# loses at most that window. SNAPSHOT_INTERVAL_S=0 saves inline after every
+# mutation, as before.
+SNAPSHOT_INTERVAL_S = float(os.getenv("SNAPSHOT_INTERVAL_S", "30"))
+SNAPSHOT_MAX_PENDING = int(os.getenv("SNAPSHOT_MAX_PENDING", "200"))
+
+class Snapshotter:
+    """Persists the hot and archive indexes off the request path.
+
+    The state is copied to bytes under the service lock (a memcpy), and the
+    slow part, writing and fsyncing files, happens after the lock is released.
+    """
+    def __init__(self, service: "IndexService"):
+        self.service = service
+        self.pending = {"hot": 0, "archive": 0}
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.write_lock = threading.Lock()
+        self.last = {}
+        self.thread = None
+        if SNAPSHOT_INTERVAL_S > 0:
+            self.thread = threading.Thread(target=self._loop, name="index-snapshot", daemon=True)
+            self.thread.start()
+            atexit.register(self.flush)
+
+    def _targets(self):
+        return {
+            "hot": (self.service.db, self.service.index_path, self.service.metadata_path),
+            "archive": (self.service.archive, retention.ARCHIVE_INDEX_PATH, retention.ARCHIVE_METADATA_PATH),
+        }
+
+    def mark(self, target: str = "hot", mutations: int = 1):
+        """Record mutations; callers hold the service lock."""
+        if self.thread is None:
+            db, index_path, metadata_path = self._targets()[target]
+            self.last[target] = db.save(index_path, metadata_path)
+            return
+        self.pending[target] += mutations
+        if self.pending[target] >= SNAPSHOT_MAX_PENDING:
+            self.wake.set()
+
+    def flush(self):
+        # One writer at a time, so manifest versions are written in order
+        with self.write_lock:
+            copies = []
+            with self.service.lock:
+                for target, (db, index_path, metadata_path) in self._targets().items():
+                    if self.pending[target]:
+                        copies.append((target, index_path, metadata_path, db.serialize()))
+                        self.pending[target] = 0
+            for target, index_path, metadata_path, state in copies:
+                started = time.time()
+                try:
+                    with metrics.span("index_snapshot", target=target):
+                        self.last[target] = write_snapshot(index_path, metadata_path, *state)
+                except Exception as e:
+                    # Put the mutations back so the next pass retries
+                    with self.service.lock:
+                        self.pending[target] += 1
+                    print(f"Snapshot of {target} index failed: {e}")
+                    continue
+                self.last[target]["write_s"] = round(time.time() - started, 3)
+
+    def _loop(self):
+        while not self.stopped.is_set():
+            self.wake.wait(SNAPSHOT_INTERVAL_S)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Snapshot pass failed: {e}")
+
+    def stop(self):
+        """Write what is pending and end the background thread, e.g. before the
+        index files' directory is removed."""
+        if self.thread is not None:
+            self.stopped.set()
+            self.wake.set()
+            self.thread.join()
+            atexit.unregister(self.flush)
+            self.thread = None
+        self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending_mutations": dict(self.pending),
+            "hot_version": (self.last.get("hot") or read_manifest(self.service.index_path) or {}).get("version"),
+            "last_write_s": {t: m.get("write_s") for t, m in self.last.items()},
+        }
+
+class IndexService:
+    def __init__(self, index_path: str = INDEX_PATH, metadata_path: str = METADATA_PATH, dim: int = 2048):
+        self.index_path = index_path
+        self.metadata_path = metadata_path
+        self.db = FaissImageDB(dim=dim, storage=INDEX_STORAGE)
+        self.lock = threading.RLock()
+        try:
+            self.db.load(index_path, metadata_path)
+            print(f"Loaded FAISS database ({self.db.index.ntotal} vectors).")
+        except FileNotFoundError:
+            print("No existing FAISS DB found; starting new one.")
+        self.archive = retention.load_archive(dim)
+        self.snapshots = Snapshotter(self)
+
+    def save(self):
+        # Write anything not yet snapshotted now, e.g. before shutdown
+        self.snapshots.flush()
+
+    def close(self):
+        self.snapshots.stop()
+
+    def run_retention(self) -> dict:
+        from app.queue_config import r
+        with self.lock:
+            report = retention.apply_retention(self.db, self.archive, redis_client=r)
+            if retention.report_changed(report):
+                self.snapshots.mark("hot")
+                self.snapshots.mark("archive")
+            return report
+
+    def add_report(self, job_id: str, meta: dict, vectors: np.ndarray, first_exemplar: int = 0) -> int:
+        """Index a report's vectors. first_exemplar > 0 appends further views to a
+        report already indexed (the cascade backfill) and is a no-op if the
+        report is gone or already has them."""
+        with self.lock:
+            live = [int(i) for i in self.db.rows_for_job_ids([job_id]) if not self.db.metadata[int(i)].get("deleted")]
+            if first_exemplar == 0:
+                # A redelivered job may already have been indexed before the worker died
+                if live:
+                    return 0
+            else:
+                if not live or max(self.db.metadata[i].get("exemplar", 0) for i in live) >= first_exemplar:
+                    return 0
+                # The backfilled rows copy the stored report's metadata
+                meta = {k: v for k, v in self.db.metadata[live[0]].items() if k not in ("job_id", "exemplar")}
+            for idx, embedding in enumerate(vectors, start=first_exemplar):
+                row = dict(meta)
+                row["job_id"] = job_id
+                row["exemplar"] = idx
+                self.db.add_embedding(embedding, row)
+            self.snapshots.mark("hot")
+            return len(vectors)
+
+    def search(self, vectors: np.ndarray, search_type: str, k: int = 5, query_location=None, filters=None, include_archive=False) -> list:
+        # One batched FAISS call for all query vectors; already collapsed per job
+        with self.lock:
+            matches = self.db.query_batch(vectors, search_type=search_type, k=k, query_location=query_location, filters=filters)
+            if not include_archive or self.archive.index.ntotal == 0:
+                return matches
+            archived = self.archive.query_batch(vectors, search_type=search_type, k=k, query_location=query_location, filters=filters)
+        best = {}
+        for m in matches + archived:
+            jid = m["meta"].get("job_id")
+            if jid not in best or m["score"] > best[jid]["score"]:
+                best[jid] = m
+        return sorted(best.values(), key=lambda m: m["score"], reverse=True)
+
+    def delete(self, job_id: str) -> bool:
+        with self.lock:
+            changed = self.db.purge_by_job_id(job_id)
+            if not changed:
+                changed = self.db.remove_by_job_id(job_id)
+            if changed:
+                self.snapshots.mark("hot")
+            if self.archive.purge_by_job_id(job_id):
+                self.snapshots.mark("archive")
+                changed = True
+            return changed
+
+    def export_jobs(self, job_ids) -> list:
+        # Live vectors and metadata per job, e.g. to move reports to another shard
+        with self.lock:
+            rows = [int(i) for i in self.db.rows_for_job_ids(job_ids) if not self.db.metadata[int(i)].get("deleted")]
+            vectors, metas = self.db.take_rows(rows)
+        by_job = {}
+        for vec, meta in zip(vectors, metas):
+            entry = by_job.setdefault(meta["job_id"], {"meta": meta, "vectors": []})
+            entry["vectors"].append(vec)
+        return [{
+            "job_id": job_id,
+            "meta": {k: v for k, v in entry["meta"].items() if k not in ("job_id", "exemplar")},
+            "vectors": np.asarray(entry["vectors"], dtype=np.float32),
+        } for job_id, entry in by_job.items()]
+
+    def has_job(self, job_id: str) -> bool:
+        with self.lock:
+            return self.db.has_job_id(job_id)
+
+    def list_reports(self, report_type: str) -> list:
+        # First live metadata row per job, in insertion order
+        with self.lock:
+            seen = set()
+            reports = []
+            for m in self.db.metadata:
+                if not isinstance(m, dict) or m.get("deleted") or m.get("type") != report_type:
+                    continue
+                job_id = m.get("job_id")
+                if job_id in seen:
+                    continue
+                seen.add(job_id)
+                reports.append(m)
+            return reports
+
+    def stats(self) -> dict:
+        with self.lock:
+            live = [m for m in self.db.metadata if isinstance(m, dict) and not m.get("deleted")]
+            return {
+                "vectors": int(self.db.index.ntotal),
+                "live_rows": len(live),
+                "tombstones": len(self.db.metadata) - len(live),
+                "jobs": len({m.get("job_id") for m in live}),
+                "archive_vectors": int(self.archive.index.ntotal),
+                "storage": index_storage(self.db.index),
+                "snapshot": self.snapshots.stats(),
+            }
+
+service = None
+
+def get_service() -> IndexService:
+    global service
+    if service is None:
+        service = IndexService()
+    return service
+
+app = FastAPI(title="Lost & Found FAISS index service")
+
+def _retention_loop():
+    while True:
+        time.sleep(retention.RETENTION_INTERVAL_S)
+        try:
+            report = get_service().run_retention()
+            if retention.report_changed(report):
+                print(f"Retention pass: {report}")
+        except Exception as e:
+            print(f"Retention pass failed: {e}")
+
+@app.on_event("startup")
+def _load_index():
+    get_service()
+    if retention.RETENTION_INTERVAL_S > 0:
+        threading.Thread(target=_retention_loop, name="retention", daemon=True).start()
+
+@app.on_event("shutdown")
+def _flush_index():
+    if service is not None:
+        service.save()
+
+# Handlers are plain `def` so FastAPI runs them in its threadpool; the service
+# lock serialises access to the index.
+
+@app.post("/add")
+def add(payload: dict = Body(...)):
+    job_id = payload.get("job_id")
+    if not job_id:
+        raise HTTPException(status_code=400, detail="job_id is required")
+    vectors = decode_vectors(payload["vectors"])
+    return {"added": get_service().add_report(job_id, payload.get("meta") or {}, vectors, int(payload.get("first_exemplar", 0)))}
+
+@app.post("/search")
+def search(payload: dict = Body(...)):
+    vectors = decode_vectors(payload["vectors"])
+    matches = get_service().search(
+        vectors,
+        payload["search_type"],
+        int(payload.get("k", 5)),
+        payload.get("query_location"),
+        payload.get("filters"),
+        bool(payload.get("include_archive")),
+    )
+    return {"matches": matches}
+
+@app.post("/delete")
+def delete(payload: dict = Body(...)):
+    return {"deleted": get_service().delete(payload["job_id"])}
+
+@app.post("/export")
+def export(payload: dict = Body(...)):
+    reports = get_service().export_jobs(payload.get("job_ids") or [])
+    for report in reports:
+        report["vectors"] = encode_vectors(report["vectors"])
+    return {"reports": reports}
+
+@app.get("/jobs/{job_id}")
+def has_job(job_id: str):
+    return {"exists": get_service().has_job(job_id)}
+
+@app.get("/reports")
+def list_reports(type: str):
+    return {"reports": get_service().list_reports(type)}
+
+@app.post("/retention/run")
+def run_retention():
+    return get_service().run_retention()
+
+@app.get("/stats")
+def stats():
+    return get_service().stats()
+
+@app.get("/metrics")
+def prometheus_metrics():
+    metrics.update_index_stats(get_service().stats())
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=INDEX_SERVICE_PORT, workers=1)
@@ -0,0 +1,269 @@
+import os
+import sys
+import json
+import time
+import zlib
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from app.metadata_filters import location_zone
+
+# Sharded index: reports are partitioned across several index service
+# processes (app/index_service.py, one per shard, on any host), and this
+# coordinator scatters each call to them and gathers the results. Set
+#
+#   INDEX_SHARDS=http://10.0.0.5:8101,http://10.0.0.6:8101,http://10.0.0.7:8101
+#
+# and index_client routes through it instead of INDEX_SERVICE_URL.
+# INDEX_SHARD_BY picks the partitioning:
+#   hash       crc32(job_id) mod N: even spread, every search fans out to all shards
+#   location   campus zone of the report (metadata_filters.location_zone), so all
+#              reports from one zone share a shard and a zone-filtered search
+#              touches one shard. INDEX_SHARD_ZONES may pin zones to shards,
+#              e.g. {"library": 0, "hostels": 1}; other zones are hashed.
+#
+# To run N shards on one machine:
+#   python -m app.index_shards serve --shards 3 --base-port 8101 --data-dir shards
+# After changing INDEX_SHARDS or the partitioning, move reports to their new owners:
+#   python -m app.index_shards rebalance [--dry-run]
+INDEX_SHARDS = [u.strip() for u in os.getenv("INDEX_SHARDS", "").split(",") if u.strip()]
+INDEX_SHARD_BY = os.getenv("INDEX_SHARD_BY", "hash")
+INDEX_SHARD_ZONES = json.loads(os.getenv("INDEX_SHARD_ZONES", "{}") or "{}")
+# Return what the healthy shards found when one shard fails a search. Off by
+# default: a worker matching a new report against part of the index would store
+# a permanent no_match, whereas a failed search fails the job and it is
+# redelivered. Interactive photo search asks for partial results per call.
+INDEX_SHARD_PARTIAL_OK = os.getenv("INDEX_SHARD_PARTIAL_OK", "0") == "1"
+REBALANCE_BATCH = 100
+
+def _stable_hash(text: str) -> int:
+    return zlib.crc32(str(text).encode("utf-8"))
+
+class ShardedIndex:
+    def __init__(self, urls: list, shard_by: str = INDEX_SHARD_BY, zones: dict = None):
+        if not urls:
+            raise ValueError("ShardedIndex needs at least one shard URL")
+        if shard_by not in ("hash", "location"):
+            raise ValueError(f"Unknown shard partitioning: {shard_by}")
+        self.urls = list(urls)
+        self.shard_by = shard_by
+        self.zones = INDEX_SHARD_ZONES if zones is None else zones
+        self.pool = ThreadPoolExecutor(max_workers=len(self.urls), thread_name_prefix="index-shard")
+
+    # -- partitioning ---------------------------------------------------
+
+    def _zone_shard(self, zone) -> int:
+        if zone in self.zones:
+            return int(self.zones[zone]) % len(self.urls)
+        return _stable_hash(zone or "") % len(self.urls)
+
+    def shard_for(self, job_id: str, meta: dict) -> int:
+        if self.shard_by == "location":
+            return self._zone_shard(location_zone((meta or {}).get("location")))
+        return _stable_hash(job_id) % len(self.urls)
+
+    def _search_targets(self, filters) -> list:
+        # A zone filter under location partitioning means only one shard can match
+        if self.shard_by == "location" and filters and filters.get("zone"):
+            return [self._zone_shard(filters["zone"])]
+        return list(range(len(self.urls)))
+
+    # -- scatter/gather ---------------------------------------------------
+
+    def _call(self, shard: int, method: str, path: str, payload=None):
+        from app.index_client import _request
+        return _request(method, path, payload, base_url=self.urls[shard])
+
+    def _fan_out(self, shards, method: str, path: str, payload=None, partial_ok: bool = False) -> list:
+        futures = [(s, self.pool.submit(self._call, s, method, path, payload)) for s in shards]
+        results = []
+        for shard, future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                if not partial_ok:
+                    raise
+                print(f"Index shard {self.urls[shard]} {path} failed: {e}")
+        return results
+
+    def add_report(self, job_id: str, meta: dict, vectors, first_exemplar: int = 0) -> int:
+        from app.index_client import encode_vectors
+        shard = self.shard_for(job_id, meta)
+        resp = self._call(shard, "POST", "/add", {"job_id": job_id, "meta": meta, "vectors": encode_vectors(vectors),
+                                                  "first_exemplar": first_exemplar})
+        return resp.get("added", 0)
+
+    def search(self, vectors, search_type: str, k: int = 5, query_location=None, filters=None, include_archive=False,
+               partial_ok: bool = False) -> list:
+        from app.index_client import encode_vectors
+        payload = {
+            "vectors": encode_vectors(vectors),
+            "search_type": search_type,
+            "k": k,
+            "query_location": query_location,
+            "filters": filters,
+            "include_archive": include_archive,
+        }
+        responses = self._fan_out(self._search_targets(filters), "POST", "/search", payload,
+                                    partial_ok=partial_ok or INDEX_SHARD_PARTIAL_OK)
+        # Each shard returns, like an unsharded IndexService, every job among
+        # its k nearest rows per query vector, collapsed to one hit per job and
+        # not truncated. The union therefore holds every job a single index
+        # would return, and callers apply their own thresholds and limits.
+        # A job mid-rebalance can briefly live on two shards; keep its best score.
+        best = {}
+        for resp in responses:
+            for m in resp.get("matches", []):
+                jid = m["meta"].get("job_id")
+                if jid not in best or m["score"] > best[jid]["score"]:
+                    best[jid] = m
+        return sorted(best.values(), key=lambda m: m["score"], reverse=True)
+
+    def delete(self, job_id: str) -> bool:
+        # The owner can't be derived from the id alone under location partitioning
+        return any(r.get("deleted") for r in self._fan_out(range(len(self.urls)), "POST", "/delete", {"job_id": job_id}))
+
+    def has_job(self, job_id: str) -> bool:
+        return any(r.get("exists") for r in self._fan_out(range(len(self.urls)), "GET", f"/jobs/{job_id}"))
+
+    def list_reports(self, report_type: str) -> list:
+        reports = []
+        for resp in self._fan_out(range(len(self.urls)), "GET", f"/reports?type={report_type}"):
+            reports.extend(resp.get("reports", []))
+        return reports
+
+    def export(self, job_ids) -> list:
+        from app.index_client import decode_vectors
+        reports = []
+        for resp in self._fan_out(range(len(self.urls)), "POST", "/export", {"job_ids": list(job_ids)}):
+            reports.extend({**r, "vectors": decode_vectors(r["vectors"])} for r in resp.get("reports", []))
+        return reports
+
+    def run_retention(self) -> dict:
+        totals = {}
+        for resp in self._fan_out(range(len(self.urls)), "POST", "/retention/run", {}):
+            for key, value in resp.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def stats(self) -> dict:
+        shards = self._fan_out(range(len(self.urls)), "GET", "/stats")
+        totals = {key: sum(s.get(key, 0) for s in shards) for key in ("vectors", "live_rows", "tombstones", "jobs", "archive_vectors")}
+        totals["shard_by"] = self.shard_by
+        totals["shards"] = [{"url": url, **s} for url, s in zip(self.urls, shards)]
+        return totals
+
+    # -- rebalancing ----------------------------------------------------
+
+    def misplaced(self) -> list:
+        """(job_id, current shard, owner shard) for every report on the wrong shard."""
+        moves = []
+        for shard in range(len(self.urls)):
+            for report_type in ("lost_report", "found_report"):
+                for meta in self._call(shard, "GET", f"/reports?type={report_type}").get("reports", []):
+                    owner = self.shard_for(meta.get("job_id"), meta)
+                    if owner != shard:
+                        moves.append((meta["job_id"], shard, owner))
+        return moves
+
+    def rebalance(self, dry_run: bool = False) -> dict:
+        """Copy each misplaced report to its owner, then drop it from the old shard.
+
+        Copy-then-delete means a report is never missing from search while it
+        moves; the coordinator de-duplicates the brief overlap.
+        """
+        moves = self.misplaced()
+        report = {"misplaced": len(moves), "moved": 0, "moved_rows": 0, "by_route": {}}
+        for job_id, source, owner in moves:
+            route = f"{source}->{owner}"
+            report["by_route"][route] = report["by_route"].get(route, 0) + 1
+        if dry_run:
+            return report
+        by_source = {}
+        for job_id, source, owner in moves:
+            by_source.setdefault(source, []).append((job_id, owner))
+        for source, jobs in by_source.items():
+            for start in range(0, len(jobs), REBALANCE_BATCH):
+                batch = dict(jobs[start:start + REBALANCE_BATCH])
+                exported = self._call(source, "POST", "/export", {"job_ids": list(batch)}).get("reports", [])
+                for item in exported:
+                    # Vectors stay in their wire encoding from one shard to the other
+                    self._call(batch[item["job_id"]], "POST", "/add", {
+                        "job_id": item["job_id"], "meta": item["meta"], "vectors": item["vectors"],
+                    })
+                    self._call(source, "POST", "/delete", {"job_id": item["job_id"]})
+                    report["moved"] += 1
+                    report["moved_rows"] += item["vectors"]["shape"][0]
+        return report
+
+_sharded = None
+
+def get_sharded_index() -> ShardedIndex:
+    global _sharded
+    if _sharded is None:
+        _sharded = ShardedIndex(INDEX_SHARDS)
+    return _sharded
+
+def serve(shards: int, base_port: int, data_dir: str, host: str = "127.0.0.1"):
+    """Run N index service processes on one machine, each with its own files."""
+    procs = []
+    urls = []
+    for i in range(shards):
+        shard_dir = os.path.join(data_dir, f"shard-{i}")
+        os.makedirs(shard_dir, exist_ok=True)
+        port = base_port + i
+        env = dict(os.environ)
+        env.update({
+            "INDEX_PATH": os.path.join(shard_dir, "faiss.index"),
+            "METADATA_PATH": os.path.join(shard_dir, "metadata.pkl"),
+            "ARCHIVE_INDEX_PATH": os.path.join(shard_dir, "archive.index"),
+            "ARCHIVE_METADATA_PATH": os.path.join(shard_dir, "archive_metadata.pkl"),
+            "INDEX_SERVICE_PORT": str(port),
+        })
+        env.pop("INDEX_SHARDS", None)
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.index_service:app", "--host", host, "--port", str(port), "--workers", "1"],
+            env=env,
+        ))
+        urls.append(f"http://{host}:{port}")
+    print(f"INDEX_SHARDS={','.join(urls)}")
+    try:
+        while all(p.poll() is None for p in procs):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sharded index: local launcher and rebalancing")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_serve = sub.add_parser("serve", help="run N index shards on this machine")
+    p_serve.add_argument("--shards", type=int, default=2)
+    p_serve.add_argument("--base-port", type=int, default=8101)
+    p_serve.add_argument("--data-dir", default="shards")
+    p_rebalance = sub.add_parser("rebalance", help="move reports to the shard that owns them under INDEX_SHARDS/INDEX_SHARD_BY")
+    p_rebalance.add_argument("--dry-run", action="store_true")
+    sub.add_parser("stats", help="per-shard and total index stats")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        serve(args.shards, args.base_port, args.data_dir)
+        return 0
+    if not INDEX_SHARDS:
+        parser.error("INDEX_SHARDS is not set")
+    index = get_sharded_index()
+    if args.command == "rebalance":
+        started = time.time()
+        report = index.rebalance(dry_run=args.dry_run)
+        report["elapsed_s"] = round(time.time() - started, 2)
+        print(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(index.stats(), indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
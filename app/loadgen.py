@@ -0,0 +1,296 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import contextlib
+import traceback
+
+# Load generator for the upload and listing routes. A fixed number of virtual
+# users loop over a weighted mix of requests for a set duration; the report has
+# throughput and p50/p95/p99/max latency per operation, plus status codes.
+#
+# By default everything runs in this process on one box: REDIS_BACKEND=memory,
+# EMBEDDER=fake, an in-process index and temporary upload/index files. The
+# FastAPI app is driven through httpx's ASGI transport (no sockets) and worker
+# threads drain the queue alongside, so queue growth and 429s show up the way
+# they would against a real deployment. With --url the same mix is sent to a
+# running API instead (its worker and Redis are whatever that deployment uses).
+#
+#   python -m app.loadgen --duration 30 --concurrency 32
+#   python -m app.loadgen --mix upload_lost=1,list_user=8 --no-etag
+#   python -m app.loadgen --url http://127.0.0.1:8000 --concurrency 64 --out load.json
+
+DEFAULT_MIX = "upload_lost=2,upload_found=2,list_user=4,list_admin=1,poll_result=3"
+OPERATIONS = ("upload_lost", "upload_found", "list_user", "list_admin", "poll_result")
+
+def _isolate(workdir: str):
+    # Must run before any app module reads its configuration
+    os.environ.setdefault("REDIS_BACKEND", "memory")
+    os.environ.setdefault("EMBEDDER", "fake")
+    os.environ.setdefault("INDEX_SERVICE_URL", "local")
+    os.environ.setdefault("UPLOAD_DIR", os.path.join(workdir, "uploads"))
+    os.environ.setdefault("INDEX_PATH", os.path.join(workdir, "faiss.index"))
+    os.environ.setdefault("METADATA_PATH", os.path.join(workdir, "metadata.pkl"))
+    os.environ.setdefault("ARCHIVE_INDEX_PATH", os.path.join(workdir, "archive.index"))
+    os.environ.setdefault("ARCHIVE_METADATA_PATH", os.path.join(workdir, "archive_metadata.pkl"))
+    os.makedirs(os.environ["UPLOAD_DIR"], exist_ok=True)
+
+def _mix(text: str) -> dict:
+    weights = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation {name!r}; expected one of {', '.join(OPERATIONS)}")
+        weights[name] = float(weight or 1)
+    if not any(weights.values()):
+        raise SystemExit("The mix needs at least one operation with a positive weight")
+    return weights
+
+def percentiles(ms: list) -> dict:
+    import numpy as np
+    arr = np.asarray(ms, dtype=np.float64)
+    return {
+        "mean_ms": float(arr.mean()),
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p95_ms": float(np.percentile(arr, 95)),
+        "p99_ms": float(np.percentile(arr, 99)),
+        "max_ms": float(arr.max()),
+    }
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+
+    def record(self, op: str, status, started: float):
+        self.latencies.setdefault(op, []).append((time.perf_counter() - started) * 1000.0)
+        counts = self.statuses.setdefault(op, {})
+        counts[str(status)] = counts.get(str(status), 0) + 1
+
+    def summary(self, elapsed: float) -> dict:
+        out = {}
+        for op, ms in sorted(self.latencies.items()):
+            errors = sum(n for code, n in self.statuses[op].items() if not code.isdigit() or int(code) >= 400)
+            out[op] = {
+                "requests": len(ms),
+                "errors": errors,
+                "req_per_s": len(ms) / elapsed if elapsed > 0 else 0.0,
+                "statuses": self.statuses[op],
+                **percentiles(ms),
+            }
+        return out
+
+class VirtualUser:
+    """One closed-loop client: its own user id, last uploads and ETags."""
+
+    def __init__(self, index: int, client, args, pool: dict, weights: dict, recorder: Recorder):
+        self.rng = random.Random(args.seed * 7919 + index)
+        self.user_id = f"load-user-{index}"
+        self.client = client
+        self.args = args
+        self.pool = pool
+        self.ops = list(weights)
+        self.weights = [weights[op] for op in self.ops]
+        self.recorder = recorder
+        self.job_ids = []
+        self.etags = {}
+        self.admin_page = 0
+
+    async def run(self, deadline: float, budget: list):
+        while time.perf_counter() < deadline:
+            if budget is not None:
+                if budget[0] <= 0:
+                    return
+                budget[0] -= 1
+            op = self.rng.choices(self.ops, self.weights)[0]
+            if op == "poll_result" and not self.job_ids:
+                op = "upload_lost"
+            started = time.perf_counter()
+            try:
+                status = await getattr(self, op)()
+            except Exception as e:
+                status = type(e).__name__
+            self.recorder.record(op, status, started)
+            if self.args.think_ms:
+                await asyncio.sleep(self.rng.expovariate(1000.0 / self.args.think_ms))
+
+    async def _upload(self, path: str, job: dict, extra: dict):
+        files = {"file": (f"{job['job_id']}.jpg", job["image_bytes"], "image/jpeg")}
+        data = {"location": job["location"], "date": job["date"], "itemName": job["itemName"], **extra}
+        response = await self.client.post(path, files=files, data=data)
+        if response.status_code == 200:
+            job_id = response.json().get("job_id")
+            if job_id:
+                self.job_ids = (self.job_ids + [job_id])[-8:]
+        return response.status_code
+
+    async def upload_lost(self):
+        job = self.rng.choice(self.pool["user_complaint"])
+        return await self._upload("/api/user/complaint", job, {"userId": self.user_id, "userName": "load"})
+
+    async def upload_found(self):
+        job = self.rng.choice(self.pool["admin_found"])
+        return await self._upload("/api/admin/found", job, {})
+
+    async def _get(self, path: str, params: dict = None):
+        # Dashboards re-poll with the ETag of their last response
+        headers = {}
+        key = (path, tuple(sorted((params or {}).items())))
+        if self.args.etag and key in self.etags:
+            headers["If-None-Match"] = self.etags[key]
+        response = await self.client.get(path, params=params, headers=headers)
+        if response.headers.get("etag"):
+            self.etags[key] = response.headers["etag"]
+        return response.status_code
+
+    async def list_user(self):
+        return await self._get("/api/user/complaints", {"userId": self.user_id})
+
+    async def list_admin(self):
+        self.admin_page += 1
+        return await self._get("/api/admin/lost-items" if self.admin_page % 2 else "/api/admin/found-items")
+
+    async def poll_result(self):
+        return await self._get(f"/api/results/{self.rng.choice(self.job_ids)}")
+
+def _worker_loop(stop: threading.Event, processed: list):
+    from app import queue_config, offline_processor
+    while not stop.is_set():
+        job = queue_config.dequeue_job()
+        if not job:
+            continue
+        try:
+            offline_processor.process_job(job)
+            queue_config.ack_job(job)
+            processed.append(time.perf_counter())
+        except Exception:
+            traceback.print_exc()
+
+def _backlog() -> int:
+    from app import queue_config
+    return sum(lane["depth"] for lane in queue_config.queue_stats().values())
+
+async def _drive(client, args, pool: dict, weights: dict) -> dict:
+    recorder = Recorder()
+    users = [VirtualUser(i, client, args, pool, weights, recorder) for i in range(args.concurrency)]
+    budget = [args.requests] if args.requests else None
+    started = time.perf_counter()
+    deadline = started + (args.duration if not args.requests else float("inf"))
+    await asyncio.gather(*(user.run(deadline, budget) for user in users))
+    elapsed = time.perf_counter() - started
+    total = sum(len(ms) for ms in recorder.latencies.values())
+    return {
+        "elapsed_s": elapsed,
+        "requests": total,
+        "req_per_s": total / elapsed if elapsed > 0 else 0.0,
+        "operations": recorder.summary(elapsed),
+    }
+
+async def _run_remote(args, pool: dict, weights: dict) -> dict:
+    import httpx
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        return await _drive(client, args, pool, weights)
+
+async def _run_local(args, pool: dict, weights: dict) -> dict:
+    import httpx
+    from app.main import app
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadgen", timeout=args.timeout) as client:
+        return await _drive(client, args, pool, weights)
+
+def _run_in_process(args, pool: dict, weights: dict) -> dict:
+    # Imported here, not first inside the worker threads
+    from app import offline_processor  # noqa: F401
+    stop = threading.Event()
+    processed = []
+    workers = [threading.Thread(target=_worker_loop, args=(stop, processed), daemon=True)
+               for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    report = asyncio.run(_run_local(args, pool, weights))
+    report["backlog_at_end"] = _backlog()
+    if args.drain:
+        drain_started = time.perf_counter()
+        while _backlog() and time.perf_counter() - drain_started < args.drain:
+            time.sleep(0.2)
+        report["backlog_after_drain"] = _backlog()
+    stop.set()
+    for worker in workers:
+        # dequeue_job blocks for up to 5 s on an empty queue before seeing stop
+        worker.join(timeout=10)
+    # Stop the index snapshots before the temporary directory goes away
+    from app import index_client
+    index_client.close()
+    if processed:
+        span = processed[-1] - processed[0] if len(processed) > 1 else 0.0
+        report["worker"] = {
+            "workers": args.workers,
+            "jobs": len(processed),
+            "jobs_per_s": (len(processed) - 1) / span if span > 0 else 0.0,
+        }
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Async load generator for the upload and listing routes")
+    parser.add_argument("--url", help="base URL of a running API (default: run the API, Redis stand-in and worker in-process)")
+    parser.add_argument("--concurrency", type=int, default=16, help="virtual users, each with one request in flight")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests instead of --duration")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted operations (default {DEFAULT_MIX})")
+    parser.add_argument("--pool", type=int, default=200, help="synthetic photos to upload from; half are re-photographs of found items")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="mean pause between a virtual user's requests")
+    parser.add_argument("--no-etag", dest="etag", action="store_false", help="don't send If-None-Match on repeat GETs")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request timeout in seconds")
+    parser.add_argument("--workers", type=int, default=1, help="in-process worker threads")
+    parser.add_argument("--drain", type=float, default=0.0, help="after the run, wait up to this many seconds for the queue to empty")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="keep the API and worker logging on stdout")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    weights = _mix(args.mix)
+
+    with tempfile.TemporaryDirectory(prefix="lostandfound-load-") as workdir:
+        if not args.url:
+            _isolate(workdir)
+        from app import runtime
+        runtime.configure("worker")
+        from app.benchmark import synthetic_jobs
+        pool = {"admin_found": [], "user_complaint": []}
+        for job in synthetic_jobs(args.pool, seed=args.seed):
+            pool[job["type"]].append(job)
+
+        with contextlib.ExitStack() as quiet:
+            if not args.verbose:
+                quiet.enter_context(contextlib.redirect_stdout(quiet.enter_context(open(os.devnull, "w"))))
+            if args.url:
+                report = asyncio.run(_run_remote(args, pool, weights))
+            else:
+                report = _run_in_process(args, pool, weights)
+
+    report["meta"] = {
+        "timestamp": time.time(),
+        "target": args.url or "in-process",
+        "args": vars(args),
+    }
+    if not args.url:
+        from app.embedding import EMBEDDER_NAME
+        report["meta"].update(redis_backend=os.environ["REDIS_BACKEND"], embedder=EMBEDDER_NAME)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,46 @@
-import os
-os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
-from fastapi import FastAPI
+from app import runtime
+runtime.configure("api")
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+import time
 from app.routes import router
+from app.storage import MAX_UPLOAD_BYTES
+from app import metrics
 
 app = FastAPI(title="Lost & Found AI Upload with ResNet Embeddings")
 
+# Single-image upload routes; anything declaring a body bigger than one image
+# plus form fields is refused before the multipart parser reads it.
+SINGLE_UPLOAD_PATHS = ("/api/user/complaint", "/api/admin/found")
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# Registered before CORS so rejections still carry CORS headers
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    if request.method == "POST" and request.url.path in SINGLE_UPLOAD_PATHS:
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES:
+            return JSONResponse(status_code=413, content={"detail": "Image too large (max 10MB)"})
+    return await call_next(request)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template, not raw path, so job ids don't explode the series
+        route = request.scope.get("route")
+        metrics.HTTP_SECONDS.labels(
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status),
+        ).observe(time.perf_counter() - started)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -23,8 +58,35 @@ app.add_middleware(
     max_age=600,
 )
 
+@app.on_event("startup")
+async def warm_search_model():
+    # Load the embedding model before the first /search request, not during it
+    from app import search
+    if search.SEARCH_ENABLED:
+        try:
+            from starlette.concurrency import run_in_threadpool
+            await run_in_threadpool(search.warm_up)
+        except Exception as e:
+            print(f"Search warm-up failed: {e}")
+
 @app.get("/")
 async def root():
     return {"message": "Lost and Found AI Backend is running with ResNet embeddings"}
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    # Gauges come from Redis and the index service, so refresh them per scrape
+    from starlette.concurrency import run_in_threadpool
+    from app import index_client
+    from app.queue_config import queue_stats_async
+    try:
+        metrics.update_queue_depth(await queue_stats_async())
+    except Exception as e:
+        print(f"Queue depth for /metrics failed: {e}")
+    try:
+        metrics.update_index_stats(await run_in_threadpool(index_client.stats))
+    except Exception as e:
+        print(f"Index stats for /metrics failed: {e}")
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
+
 app.include_router(router, prefix="/api", tags=["api"])
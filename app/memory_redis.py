@@ -0,0 +1,456 @@
+import time
+import fnmatch
+import threading
+
+# In-process stand-in for the subset of redis-py the app uses (strings, sets,
+# hashes, streams with consumer groups, pipelines, SCAN). It exists so the
+# benchmarks and load tests can drive the API and worker on one box without a
+# Redis server. Several client views can share one store, e.g. a text view
+# (decode_responses=True) and a binary one, like two real connections would.
+
+class MemoryStore:
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.lock = threading.RLock()
+        self.stream_added = threading.Condition(self.lock)
+        self.seq = [0, 0]
+
+def _parse_id(stream_id):
+    if stream_id in ("-", "0"):
+        return (0, 0)
+    if stream_id == "+":
+        return (float("inf"), float("inf"))
+    ms, _, seq = str(stream_id).partition("-")
+    return (int(ms), int(seq or 0))
+
+class _Stream:
+    def __init__(self):
+        self.entries = []
+        self.groups = {}
+
+class MemoryRedis:
+    def __init__(self, store: MemoryStore = None, decode_responses: bool = True):
+        self.store = store or MemoryStore()
+        self.decode_responses = decode_responses
+
+    def view(self, decode_responses: bool):
+        return MemoryRedis(self.store, decode_responses)
+
+    # -- value encoding -------------------------------------------------
+
+    def _in(self, value):
+        if isinstance(value, (bytes, str)):
+            return value
+        return str(value)
+
+    def _out(self, value):
+        if value is None:
+            return None
+        if self.decode_responses:
+            return value.decode("utf-8") if isinstance(value, bytes) else value
+        return value.encode("utf-8") if isinstance(value, str) else value
+
+    def _live(self, key):
+        exp = self.store.expires.get(key)
+        if exp is not None and exp <= time.time():
+            self.store.data.pop(key, None)
+            self.store.expires.pop(key, None)
+        return self.store.data.get(key)
+
+    def _typed(self, key, kind):
+        value = self._live(key)
+        if value is None:
+            value = kind()
+            self.store.data[key] = value
+        return value
+
+    # -- keys -----------------------------------------------------------
+
+    def exists(self, *keys):
+        with self.store.lock:
+            return sum(1 for k in keys if self._live(k) is not None)
+
+    def delete(self, *keys):
+        with self.store.lock:
+            n = 0
+            for k in keys:
+                if self._live(k) is not None:
+                    n += 1
+                self.store.data.pop(k, None)
+                self.store.expires.pop(k, None)
+            return n
+
+    def expire(self, key, seconds):
+        with self.store.lock:
+            if self._live(key) is None:
+                return False
+            self.store.expires[key] = time.time() + int(seconds)
+            return True
+
+    def ttl(self, key):
+        with self.store.lock:
+            if self._live(key) is None:
+                return -2
+            exp = self.store.expires.get(key)
+            return -1 if exp is None else int(exp - time.time())
+
+    def type(self, key):
+        with self.store.lock:
+            value = self._live(key)
+            kinds = {str: "string", bytes: "string", set: "set", dict: "hash", list: "list", _Stream: "stream"}
+            return self._out("none" if value is None else kinds.get(type(value), "string"))
+
+    def scan_iter(self, match=None, count=None, _type=None):
+        with self.store.lock:
+            keys = [k for k in list(self.store.data) if self._live(k) is not None]
+        for k in keys:
+            if match is None or fnmatch.fnmatchcase(k, match):
+                yield self._out(k)
+
+    def dbsize(self):
+        with self.store.lock:
+            return sum(1 for k in list(self.store.data) if self._live(k) is not None)
+
+    def flushall(self):
+        with self.store.lock:
+            self.store.data.clear()
+            self.store.expires.clear()
+            return True
+
+    def ping(self):
+        return True
+
+    # -- strings --------------------------------------------------------
+
+    def get(self, key):
+        with self.store.lock:
+            value = self._live(key)
+            return self._out(value) if isinstance(value, (str, bytes)) else None
+
+    def mget(self, keys, *args):
+        keys = list(keys) if not isinstance(keys, (str, bytes)) else [keys]
+        keys.extend(args)
+        return [self.get(k) for k in keys]
+
+    def set(self, key, value, ex=None, nx=False, keepttl=False):
+        with self.store.lock:
+            if nx and self._live(key) is not None:
+                return None
+            self.store.data[key] = self._in(value)
+            if not keepttl:
+                self.store.expires.pop(key, None)
+            if ex:
+                self.store.expires[key] = time.time() + int(ex)
+            return True
+
+    def incr(self, key, amount=1):
+        with self.store.lock:
+            value = int(self._live(key) or 0) + int(amount)
+            self.store.data[key] = str(value)
+            return value
+
+    # -- lists (legacy queue only) --------------------------------------
+
+    def rpush(self, key, *values):
+        with self.store.lock:
+            lst = self._typed(key, list)
+            lst.extend(self._in(v) for v in values)
+            return len(lst)
+
+    def lpop(self, key):
+        with self.store.lock:
+            lst = self._live(key)
+            if not lst:
+                return None
+            return self._out(lst.pop(0))
+
+    # -- sets -----------------------------------------------------------
+
+    def sadd(self, key, *members):
+        with self.store.lock:
+            s = self._typed(key, set)
+            before = len(s)
+            s.update(str(m) for m in members)
+            return len(s) - before
+
+    def srem(self, key, *members):
+        with self.store.lock:
+            s = self._live(key)
+            if not s:
+                return 0
+            n = 0
+            for m in members:
+                if str(m) in s:
+                    s.discard(str(m))
+                    n += 1
+            return n
+
+    def smembers(self, key):
+        with self.store.lock:
+            return {self._out(m) for m in (self._live(key) or set())}
+
+    def scard(self, key):
+        with self.store.lock:
+            return len(self._live(key) or set())
+
+    def sismember(self, key, member):
+        with self.store.lock:
+            return str(member) in (self._live(key) or set())
+
+    def sscan_iter(self, key, match=None, count=None):
+        for m in self.smembers(key):
+            if match is None or fnmatch.fnmatchcase(m, match):
+                yield m
+
+    # -- hashes ---------------------------------------------------------
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        with self.store.lock:
+            h = self._typed(key, dict)
+            items = dict(mapping or {})
+            if field is not None:
+                items[field] = value
+            added = sum(1 for f in items if f not in h)
+            for f, v in items.items():
+                h[f] = self._in(v)
+            return added
+
+    def hget(self, key, field):
+        with self.store.lock:
+            return self._out((self._live(key) or {}).get(field))
+
+    def hmget(self, key, keys, *args):
+        fields = list(keys) if not isinstance(keys, (str, bytes)) else [keys]
+        fields.extend(args)
+        with self.store.lock:
+            h = self._live(key) or {}
+            return [self._out(h.get(f)) for f in fields]
+
+    def hgetall(self, key):
+        with self.store.lock:
+            return {self._out(f): self._out(v) for f, v in (self._live(key) or {}).items()}
+
+    def hscan_iter(self, key, match=None, count=None):
+        for field, value in self.hgetall(key).items():
+            if match is None or fnmatch.fnmatchcase(field, match):
+                yield field, value
+
+    def hdel(self, key, *fields):
+        with self.store.lock:
+            h = self._live(key) or {}
+            removed = sum(1 for f in fields if h.pop(f, None) is not None)
+            if not h:
+                self.store.data.pop(key, None)
+            return removed
+
+    def hincrby(self, key, field, amount=1):
+        with self.store.lock:
+            h = self._typed(key, dict)
+            value = int(h.get(field, 0)) + int(amount)
+            h[field] = str(value)
+            return value
+
+    # -- streams --------------------------------------------------------
+
+    def _next_id(self):
+        ms = int(time.time() * 1000)
+        if ms <= self.store.seq[0]:
+            self.store.seq[1] += 1
+        else:
+            self.store.seq = [ms, 0]
+        return f"{self.store.seq[0]}-{self.store.seq[1]}"
+
+    def _fields_out(self, fields):
+        return {self._out(k): self._out(v) for k, v in fields.items()}
+
+    def xadd(self, name, fields, id="*", maxlen=None, approximate=True):
+        with self.store.lock:
+            stream = self._typed(name, _Stream)
+            msg_id = self._next_id()
+            stream.entries.append((msg_id, {k: self._in(v) for k, v in fields.items()}))
+            if maxlen is not None and len(stream.entries) > maxlen:
+                del stream.entries[: len(stream.entries) - maxlen]
+            self.store.stream_added.notify_all()
+            return self._out(msg_id)
+
+    def xlen(self, name):
+        with self.store.lock:
+            stream = self._live(name)
+            return len(stream.entries) if stream else 0
+
+    def xrange(self, name, min="-", max="+", count=None):
+        with self.store.lock:
+            stream = self._live(name)
+            lo, hi = _parse_id(min), _parse_id(max)
+            out = []
+            for msg_id, fields in (stream.entries if stream else []):
+                if lo <= _parse_id(msg_id) <= hi:
+                    out.append((self._out(msg_id), self._fields_out(fields)))
+                    if count and len(out) >= count:
+                        break
+            return out
+
+    def xdel(self, name, *ids):
+        with self.store.lock:
+            stream = self._live(name)
+            if not stream:
+                return 0
+            drop = set(ids)
+            before = len(stream.entries)
+            stream.entries = [e for e in stream.entries if e[0] not in drop]
+            return before - len(stream.entries)
+
+    def xgroup_create(self, name, groupname, id="$", mkstream=False):
+        with self.store.lock:
+            stream = self._live(name)
+            if stream is None:
+                if not mkstream:
+                    raise RuntimeError("ERR The XGROUP subcommand requires the key to exist")
+                stream = self._typed(name, _Stream)
+            if groupname in stream.groups:
+                import redis
+                raise redis.exceptions.ResponseError("BUSYGROUP Consumer Group name already exists")
+            last = stream.entries[-1][0] if (id == "$" and stream.entries) else "0-0"
+            stream.groups[groupname] = {"last": last, "pending": {}}
+            return True
+
+    def _read_group(self, groupname, consumername, streams, count):
+        out = []
+        now_ms = int(time.time() * 1000)
+        for name, start in streams.items():
+            stream = self._live(name)
+            if not stream or groupname not in stream.groups:
+                continue
+            group = stream.groups[groupname]
+            if start != ">":
+                continue
+            last = _parse_id(group["last"])
+            batch = []
+            for msg_id, fields in stream.entries:
+                if _parse_id(msg_id) > last:
+                    batch.append((self._out(msg_id), self._fields_out(fields)))
+                    group["pending"][msg_id] = [consumername, now_ms, 1]
+                    group["last"] = msg_id
+                    if count and len(batch) >= count:
+                        break
+            if batch:
+                out.append([self._out(name), batch])
+        return out
+
+    def xreadgroup(self, groupname, consumername, streams, count=None, block=None, noack=False):
+        deadline = None if block is None else time.time() + block / 1000.0
+        with self.store.lock:
+            while True:
+                out = self._read_group(groupname, consumername, streams, count)
+                if out or deadline is None:
+                    return out
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return []
+                self.store.stream_added.wait(remaining)
+
+    def xack(self, name, groupname, *ids):
+        with self.store.lock:
+            stream = self._live(name)
+            if not stream or groupname not in stream.groups:
+                return 0
+            pending = stream.groups[groupname]["pending"]
+            return sum(1 for i in ids if pending.pop(i, None) is not None)
+
+    def xautoclaim(self, name, groupname, consumername, min_idle_time, start_id="0-0", count=None, justid=False):
+        with self.store.lock:
+            stream = self._live(name)
+            if not stream or groupname not in stream.groups:
+                return ["0-0", [], []]
+            pending = stream.groups[groupname]["pending"]
+            entries = dict(stream.entries)
+            now_ms = int(time.time() * 1000)
+            claimed, deleted = [], []
+            for msg_id in sorted(pending, key=_parse_id):
+                if _parse_id(msg_id) < _parse_id(start_id):
+                    continue
+                consumer, delivered_ms, times = pending[msg_id]
+                if now_ms - delivered_ms < min_idle_time:
+                    continue
+                if msg_id not in entries:
+                    pending.pop(msg_id)
+                    deleted.append(self._out(msg_id))
+                    continue
+                pending[msg_id] = [consumername, now_ms, times + 1]
+                claimed.append((self._out(msg_id), self._fields_out(entries[msg_id])))
+                if count and len(claimed) >= count:
+                    break
+            return ["0-0", claimed, deleted]
+
+    def xpending_range(self, name, groupname, min, max, count, consumername=None, idle=None):
+        with self.store.lock:
+            stream = self._live(name)
+            if not stream or groupname not in stream.groups:
+                return []
+            lo, hi = _parse_id(min), _parse_id(max)
+            now_ms = int(time.time() * 1000)
+            out = []
+            for msg_id, (consumer, delivered_ms, times) in sorted(stream.groups[groupname]["pending"].items(), key=lambda kv: _parse_id(kv[0])):
+                if not (lo <= _parse_id(msg_id) <= hi):
+                    continue
+                if consumername and consumer != consumername:
+                    continue
+                out.append({
+                    "message_id": self._out(msg_id),
+                    "consumer": self._out(consumer),
+                    "time_since_delivered": now_ms - delivered_ms,
+                    "times_delivered": times,
+                })
+                if len(out) >= count:
+                    break
+            return out
+
+    # -- pipelines ------------------------------------------------------
+
+    def pipeline(self, transaction=True):
+        return MemoryPipeline(self)
+
+class MemoryPipeline:
+    # Buffers commands and runs them under the store lock on execute()
+    def __init__(self, client: MemoryRedis):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((method, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        with self.client.store.lock:
+            commands, self.commands = self.commands, []
+            return [method(*args, **kwargs) for method, args, kwargs in commands]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.commands = []
+
+class AsyncMemoryRedis:
+    # asyncio facade with the same call shapes as redis.asyncio.Redis
+    def __init__(self, client: MemoryRedis):
+        self.client = client
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+    def pipeline(self, transaction=True):
+        return AsyncMemoryPipeline(self.client)
+
+class AsyncMemoryPipeline(MemoryPipeline):
+    async def execute(self):
+        return MemoryPipeline.execute(self)
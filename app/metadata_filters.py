@@ -0,0 +1,96 @@
+import os
+import re
+import json
+import datetime
+
+# Attributes used to pre-filter candidates before the vector search: report
+# date (as a day ordinal), campus zone derived from the free-text location,
+# and a coarse item category derived from itemName. Missing values never
+# exclude a row.
+MATCH_DATE_WINDOW_DAYS = int(os.getenv("MATCH_DATE_WINDOW_DAYS", "60"))
+MATCH_FILTER_ZONE = os.getenv("MATCH_FILTER_ZONE", "0") == "1"
+MATCH_FILTER_CATEGORY = os.getenv("MATCH_FILTER_CATEGORY", "0") == "1"
+
+# Optional JSON file mapping zone name -> list of location keywords, e.g.
+# {"hostels": ["hostel", "hall"], "library": ["library", "reading room"]}
+LOCATION_ZONES_FILE = os.getenv("LOCATION_ZONES_FILE")
+
+ITEM_CATEGORIES = {
+    "phone": ["phone", "iphone", "mobile", "smartphone", "samsung", "pixel", "oneplus", "redmi"],
+    "wallet": ["wallet", "purse"],
+    "keys": ["key", "keys", "keychain"],
+    "bag": ["bag", "backpack", "handbag", "pouch", "sling"],
+    "bottle": ["bottle", "flask", "sipper", "tumbler"],
+    "id_card": ["id", "card", "icard", "identity"],
+    "laptop": ["laptop", "macbook", "tablet", "ipad"],
+    "audio": ["earphone", "earphones", "earbuds", "airpods", "headphone", "headphones", "headset"],
+    "watch": ["watch", "smartwatch"],
+    "eyewear": ["glasses", "spectacles", "sunglasses", "specs"],
+    "umbrella": ["umbrella"],
+    "charger": ["charger", "cable", "powerbank", "adapter"],
+    "book": ["book", "notebook", "diary", "register"],
+    "jewellery": ["ring", "necklace", "bracelet", "earring", "earrings", "chain"],
+    "clothing": ["jacket", "hoodie", "sweater", "sweatshirt", "cap", "hat", "scarf", "shirt"],
+    "calculator": ["calculator"],
+}
+_KEYWORD_TO_CATEGORY = {kw: cat for cat, kws in ITEM_CATEGORIES.items() for kw in kws}
+
+def _load_zones():
+    if not LOCATION_ZONES_FILE or not os.path.exists(LOCATION_ZONES_FILE):
+        return {}
+    with open(LOCATION_ZONES_FILE) as f:
+        zones = json.load(f)
+    return {zone: [kw.lower() for kw in kws] for zone, kws in zones.items()}
+
+_ZONES = _load_zones()
+
+def item_category(item_name):
+    if not item_name:
+        return None
+    for token in re.findall(r"[a-z]+", str(item_name).lower()):
+        if token in _KEYWORD_TO_CATEGORY:
+            return _KEYWORD_TO_CATEGORY[token]
+    return None
+
+def location_zone(location):
+    if not location:
+        return None
+    loc = str(location).strip().lower()
+    if not loc:
+        return None
+    for zone, keywords in _ZONES.items():
+        if any(kw in loc for kw in keywords):
+            return zone
+    # Without a configured zone, the normalised location is its own zone
+    return loc
+
+def day_ordinal(date=None, timestamp=None):
+    if date:
+        try:
+            return datetime.date.fromisoformat(str(date)[:10]).toordinal()
+        except ValueError:
+            pass
+    if timestamp:
+        try:
+            return datetime.date.fromtimestamp(float(timestamp)).toordinal()
+        except (TypeError, ValueError, OverflowError, OSError):
+            pass
+    return None
+
+def match_filters(job: dict) -> dict:
+    # Filters the worker applies when matching a new report, per the MATCH_* settings
+    filters = {}
+    if MATCH_DATE_WINDOW_DAYS > 0:
+        day = day_ordinal(job.get("date"), job.get("timestamp"))
+        if day is not None:
+            filters["day"] = day
+            filters["date_window_days"] = MATCH_DATE_WINDOW_DAYS
+    if MATCH_FILTER_ZONE:
+        zone = location_zone(job.get("location"))
+        if zone:
+            filters["zone"] = zone
+    if MATCH_FILTER_CATEGORY:
+        category = item_category(job.get("itemName"))
+        if category:
+            filters["category"] = category
+    return filters
@@ -0,0 +1,108 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+
+# Prometheus metrics shared by the API, the worker and the index service, plus
+# timing spans around each pipeline stage. Every process exposes its own
+# registry: the API at GET /metrics, the worker on WORKER_METRICS_PORT and the
+# index service at GET /metrics on its own port.
+#
+# Set METRICS_SPAN_LOG=1 to also print one JSON line per span, e.g.
+#   {"span": "embed", "ms": 812.4, "job_id": "..."}
+METRICS_SPAN_LOG = os.getenv("METRICS_SPAN_LOG", "0") == "1"
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram, start_http_server, generate_latest, CONTENT_TYPE_LATEST
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    # Metrics are optional: without prometheus_client everything below is a no-op
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+    class _NoopMetric:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def labels(self, *args, **kwargs):
+            return self
+
+        def observe(self, *args):
+            pass
+
+        def inc(self, *args):
+            pass
+
+        def set(self, *args):
+            pass
+
+    Counter = Gauge = Histogram = _NoopMetric
+
+    def start_http_server(*args, **kwargs):
+        pass
+
+    def generate_latest(*args):
+        return b""
+
+# Stages run from a few ms (Redis) to seconds (8-variant ResNet on CPU)
+_STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+_QUEUE_BUCKETS = (0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 900, 1800, 3600)
+
+STAGE_SECONDS = Histogram("lostandfound_stage_seconds", "Time spent in one pipeline stage", ["stage"], buckets=_STAGE_BUCKETS)
+JOB_SECONDS = Histogram("lostandfound_job_seconds", "Worker time per job, dequeue to ack", ["type", "status"], buckets=_STAGE_BUCKETS)
+QUEUE_WAIT_SECONDS = Histogram("lostandfound_queue_wait_seconds", "Time a job waited in its lane before a worker took it", ["lane"], buckets=_QUEUE_BUCKETS)
+JOBS_TOTAL = Counter("lostandfound_jobs_total", "Jobs finished by the worker", ["type", "status"])
+TTA_CASCADE = Counter("lostandfound_tta_cascade_total", "Cascade jobs settled on the upright view or escalated to all 8", ["outcome"])
+HTTP_SECONDS = Histogram("lostandfound_http_request_seconds", "API request latency", ["method", "route", "status"], buckets=_STAGE_BUCKETS)
+QUEUE_DEPTH = Gauge("lostandfound_queue_depth", "Jobs waiting or in flight per lane", ["lane"])
+QUEUE_LAG = Gauge("lostandfound_queue_lag_seconds", "Age of the oldest unfinished job per lane", ["lane"])
+INDEX_VECTORS = Gauge("lostandfound_index_vectors", "Vectors in the index", ["index"])
+INDEX_TOMBSTONES = Gauge("lostandfound_index_tombstones", "Soft-deleted rows still in the hot index")
+INDEX_JOBS = Gauge("lostandfound_index_jobs", "Live reports in the hot index")
+
+@contextmanager
+def span(stage: str, **fields):
+    """Time a block into lostandfound_stage_seconds{stage=...}."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage=stage).observe(elapsed)
+        if METRICS_SPAN_LOG:
+            print(json.dumps({"span": stage, "ms": round(elapsed * 1000.0, 2), **fields}, default=str))
+
+def observe_queue_wait(job: dict, lane: str):
+    # Stream ids start with the enqueue time in ms, so no extra field is needed
+    msg_id = job.get("_msg_id")
+    if not msg_id or job.get("_deliveries", 1) > 1:
+        return
+    try:
+        waited = time.time() - int(str(msg_id).split("-")[0]) / 1000.0
+    except ValueError:
+        return
+    QUEUE_WAIT_SECONDS.labels(lane=lane).observe(max(0.0, waited))
+
+def observe_job(job_type: str, status: str, seconds: float):
+    JOB_SECONDS.labels(type=job_type or "unknown", status=status).observe(seconds)
+    JOBS_TOTAL.labels(type=job_type or "unknown", status=status).inc()
+
+def update_queue_depth(lanes: dict):
+    for lane, s in lanes.items():
+        QUEUE_DEPTH.labels(lane=lane).set(s.get("depth", 0))
+        QUEUE_LAG.labels(lane=lane).set(s.get("lag_seconds", 0))
+
+def update_index_stats(stats: dict):
+    INDEX_VECTORS.labels(index="hot").set(stats.get("vectors", 0))
+    INDEX_VECTORS.labels(index="archive").set(stats.get("archive_vectors", 0))
+    INDEX_TOMBSTONES.set(stats.get("tombstones", 0))
+    INDEX_JOBS.set(stats.get("jobs", 0))
+
+def start_worker_server(port: int = WORKER_METRICS_PORT):
+    if port > 0 and PROMETHEUS_AVAILABLE:
+        start_http_server(port)
+        print(f"Worker metrics on :{port}/metrics")
+
+def render() -> bytes:
+    return generate_latest()
@@ -1,305 +1,378 @@
+from app import runtime
+runtime.configure("worker")
 import time
-from app.queue_config import dequeue_job, r
-from app.embedding import get_image_embedding_from_base64, get_image_embeddings_variants_from_base64
-from app.faiss_db import FaissImageDB
+from app.queue_config import dequeue_job, ack_job, dead_letter_job, enqueue_job, migrate_legacy_queue, queue_stats, JOB_MAX_DELIVERIES, LANE_BULK, LANE_STREAMS, r
+from app.embedding import get_image_embeddings_variants_from_bytes, get_image_embedding_single_from_bytes, get_image_embeddings_remaining_variants_from_bytes
+from app.faiss_db import get_best_matches, HIGH_CONFIDENCE, MEDIUM_CONFIDENCE
+from app.storage import read_image, thumbnail_url
+from app import thumbnails
+from app import index_client
+from app.metadata_filters import match_filters
+from app import metrics
+from app import profiling
+from app import results
+from app import versions
 import json
+import base64
 import traceback
 import os
 
-os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
+# Also match new reports against reports aged out into the archive index. Only
+# archived reports whose job: record still exists are kept (see _with_records),
+# so this matters when RETENTION_DAYS is shorter than the 30-day job TTL.
+MATCH_INCLUDE_ARCHIVE = os.getenv("MATCH_INCLUDE_ARCHIVE", "0") == "1"
+# How often the worker refreshes the queue depth gauges
+METRICS_REFRESH_S = float(os.getenv("METRICS_REFRESH_S", "15"))
+_LANE_OF_STREAM = {stream: lane for lane, stream in LANE_STREAMS.items()}
 
-DB_INDEX_PATH = "faiss.index"
-DB_METADATA_PATH = "metadata.pkl"
-db = FaissImageDB(dim=2048)
+# Test-time augmentation. "full" embeds all 8 rotation/flip views of every
+# upload. "cascade" embeds the upright view, searches with it, and only embeds
+# the other 7 views when the best score is within TTA_CASCADE_BAND of a
+# confidence threshold, i.e. when the extra views could change the outcome.
+# A settled report is indexed with the upright view only and an "index_views"
+# job on the bulk lane embeds and appends the other 7 later, so the 7-view
+# embedding is off the latency path of most jobs. Until that backfill runs, a
+# rotated photo uploaded in the meantime is searched against the upright vector
+# alone and can miss a report it would have matched (or land a tier lower);
+# reports that escalated are indexed with all 8 views straight away.
+TTA_MODE = os.getenv("TTA_MODE", "full")
+TTA_CASCADE_BAND = float(os.getenv("TTA_CASCADE_BAND", "0.05"))
 
-try:
-    db.load(DB_INDEX_PATH, DB_METADATA_PATH)
-    print("Loaded FAISS database.")
-except FileNotFoundError:
-    print("No existing FAISS DB found; starting new one.")
+def _index_metadata(job, job_type):
+    return {
+        "location": job.get("location"),
+        "date": job.get("date"),
+        "itemName": job.get("itemName", "Unnamed Item"),
+        "type": "lost_report" if job_type == "user_complaint" else "found_report",
+        "user_id": job.get("user_id"),
+        "user_name": job.get("user_name"),
+        "timestamp": job.get("timestamp", time.time()),
+    }
 
-while True:
-    try:
-        if r.get("faiss:reload") == "1":
-            try:
-                db.load(DB_INDEX_PATH, DB_METADATA_PATH)
-            except Exception:
-                pass
-            r.delete("faiss:reload")
-    except Exception:
-        pass
-    job = dequeue_job()
-    if not job:
-        time.sleep(2)
-        continue
+def _add_to_index(job, embeds):
+    # The index service skips jobs it already holds, so redeliveries are safe
+    with metrics.span("index_add", job_id=job["job_id"]):
+        index_client.add_report(job["job_id"], _index_metadata(job, job.get("type", "")), embeds)
 
-    print(f"\n🔹 Processing job: {job['job_id']} ({job['type']})")
+def _enqueue_view_backfill(job):
+    # Carries what the index needs to route the views to the report's shard;
+    # batch_id and the delivery bookkeeping stay with the upload job
+    backfill = {k: v for k, v in job.items() if not k.startswith("_") and k != "batch_id"}
+    backfill.update(type="index_views", report_type=job.get("type", ""))
+    enqueue_job(backfill, LANE_BULK)
 
+def _backfill_views(job):
+    # Appends views 1-7 to a report indexed upright by the cascade. A report
+    # deleted or archived since then has nothing to append to.
+    if not index_client.has_job(job["job_id"]):
+        return "skipped"
     try:
-        image_b64 = job["image_b64"]
-        location = job.get("location")
-        date = job.get("date")
-        itemName = job.get("itemName", "Unnamed Item")
-        job_type = job.get("type", "")
+        image_bytes = _load_job_image(job)
+    except FileNotFoundError:
+        return "skipped"
+    with metrics.span("embed_remaining", job_id=job["job_id"]):
+        embeds = list(get_image_embeddings_remaining_variants_from_bytes(image_bytes))
+    with metrics.span("index_add", job_id=job["job_id"]):
+        index_client.add_report(job["job_id"], _index_metadata(job, job.get("report_type", "")), embeds, first_exemplar=1)
+    return "indexed"
 
-        embeds = get_image_embeddings_variants_from_base64(image_b64)
-        print(f"Generated embeddings for job {job['job_id']}")
+def _load_job_image(job):
+    # Uploads are streamed to storage by the API and jobs carry the path, so the
+    # worker needs the same UPLOAD_DIR (app/storage.py). Only jobs queued before
+    # that change still carry base64.
+    if job.get("image_path"):
+        return read_image(job["image_path"])
+    return base64.b64decode(job["image_b64"])
 
-        if job_type == "user_complaint":
-            search_target_type = "found_report"
-        elif job_type == "admin_found":
-            search_target_type = "lost_report"
-        else:
-            search_target_type = None
+def _record_batch_progress(job, status):
+    batch_id = job.get("batch_id")
+    if not batch_id:
+        return
+    # The done-set makes this idempotent when a job is redelivered
+    if not r.sadd(f"batch:done:{batch_id}", job["job_id"]):
+        return
+    pipe = r.pipeline()
+    pipe.hincrby(f"batch:{batch_id}", "failed" if status == "error" else "processed", 1)
+    if status == "matched":
+        pipe.hincrby(f"batch:{batch_id}", "matched", 1)
+    pipe.expire(f"batch:done:{batch_id}", 60*60*24*30)
+    pipe.execute()
 
-        if search_target_type:
-            all_matches = []
-            for e in embeds:
-                m = db.query(e, search_type=search_target_type, k=5, query_location=location)
-                all_matches.extend(m)
-            collapsed = {}
-            for m in all_matches:
-                meta = m.get("meta", {})
-                jid = meta.get("job_id")
-                if not jid:
-                    continue
-                prev = collapsed.get(jid)
-                if not prev or m["score"] > prev["score"]:
-                    collapsed[jid] = m
-            matches = list(collapsed.values())
-            high_conf, med_conf = db.get_best_matches(matches)
-        else:
-            high_conf, med_conf = [], []
+def _mark_failed(job, error):
+    # Dead-letter the job and surface the failure on the user's dashboard
+    dead_letter_job(job, error)
+    job_id = job.get("job_id")
+    # A failed backfill leaves the upload's own result alone
+    if not job_id or job.get("type") == "index_views":
+        return
+    results.write(r, job_id, "error", message="We could not process this image. Please try uploading a different photo.")
+    versions.bump_job(r, job_id, job)
+    _record_batch_progress(job, "error")
 
-        
+def _search(job, embeds, search_target_type):
+    with metrics.span("faiss_search", job_id=job["job_id"]):
+        return index_client.search(
+            embeds, search_target_type, k=5, query_location=job.get("location"),
+            filters=match_filters(job), include_archive=MATCH_INCLUDE_ARCHIVE,
+        )
 
-        if high_conf:
-            result = {
-                "status": "matched",
-                "matches": high_conf,
-                "message": "Match found! Please report to Lost & Found department.",
-            }
-            # Still add to database even if matched
-            for idx, embedding in enumerate(embeds):
-                metadata = {
-                    "job_id": job["job_id"],
-                    "location": location,
-                    "date": date,
-                    "itemName": itemName,
-                    "type": "lost_report" if job_type == "user_complaint" else "found_report",
-                    "user_id": job.get("user_id"),
-                    "user_name": job.get("user_name"),
-                    "timestamp": job.get("timestamp", time.time()),
-                    "exemplar": idx,
-                }
-                db.add_embedding(embedding, metadata)
-            db.save(DB_INDEX_PATH, DB_METADATA_PATH)
-            # If this is a user complaint, propagate match to corresponding found items
-            if job_type == "user_complaint":
-                try:
-                    for m in high_conf:
-                        meta = m.get("meta", {})
-                        target_found_job_id = meta.get("job_id")
-                        if not target_found_job_id:
-                            continue
-                        found_job_info_str = r.get(f"job:{target_found_job_id}")
-                        if found_job_info_str:
-                            found_job_info = json.loads(found_job_info_str)
-                            found_job_info["status"] = "matched"
-                            found_job_info["message"] = "Matched with a lost complaint"
-                            r.set(f"job:{target_found_job_id}", json.dumps(found_job_info))
-                            r.expire(f"job:{target_found_job_id}", 60*60*24*30)
-                        found_result = {
-                            "status": "matched",
-                            "matches": [{
-                                "meta": {
-                                    "job_id": job["job_id"],
-                                    "type": "lost_report",
-                                    "location": location,
-                                    "date": date,
-                                    "itemName": itemName,
-                                },
-                                "score": m.get("score", 1.0)
-                            }],
-                            "message": "Match found with a user lost complaint."
-                        }
-                        r.set(f"result:{target_found_job_id}", json.dumps(found_result))
-                        r.expire(f"result:{target_found_job_id}", 60*60*24*30)
-                except Exception as redis_e:
-                    print(f"⚠️ Redis propagation error for user high_conf: {redis_e}")
-                    traceback.print_exc()
-            
-            # If this is an admin_found job, propagate 'matched' status to matched lost complaints
-            if job_type == "admin_found":
-                # Inner try/except block for Redis operations
-                try:
-                    for m in high_conf:
-                        meta = m.get("meta", {})
-                        target_job_id = meta.get("job_id")
-                        if not target_job_id:
-                            continue
-                        # Update target lost complaint job status
-                        target_job_info_str = r.get(f"job:{target_job_id}")
-                        if target_job_info_str:
-                            target_job_info = json.loads(target_job_info_str)
-                            target_job_info["status"] = "matched"
-                            target_job_info["message"] = "Matched with a found item"
-                            r.set(f"job:{target_job_id}", json.dumps(target_job_info))
-                            r.expire(f"job:{target_job_id}", 60*60*24*30)
-                        target_result = {
-                            "status": "matched",
-                            "matches": [{
-                                "meta": {
-                                    "job_id": job["job_id"],
-                                    "type": "admin_found",
-                                    "location": location,
-                                    "date": date,
-                                    "itemName": itemName,
-                                },
-                                "score": m.get("score", 1.0)
-                            }],
-                            "message": "Match found with an admin reported item."
-                        }
-                        r.set(f"result:{target_job_id}", json.dumps(target_result))
-                        r.expire(f"result:{target_job_id}", 60*60*24*30)
-                except Exception as redis_e:
-                    # Log internal Redis errors but don't fail the main processing loop
-                    print(f"⚠️ Redis propagation error for high_conf: {redis_e}")
-                    traceback.print_exc()
+def _with_records(matches):
+    # Results only reference jobs, and listings read their details from job:{id}.
+    # A match whose record is gone (expired and archived, or deleted but not yet
+    # purged from the index) could be neither shown nor notified, so drop it
+    # before tiering rather than store a "matched" result with nothing to show.
+    matches = [m for m in matches if m["score"] >= MEDIUM_CONFIDENCE]
+    if not matches:
+        return matches
+    pipe = r.pipeline(transaction=False)
+    for m in matches:
+        pipe.exists(f"job:{m['meta'].get('job_id')}")
+    return [m for m, exists in zip(matches, pipe.execute()) if exists]
 
-        elif med_conf:
-            result = {
-                "status": "matched",
-                "matches": med_conf,
-                "message": "Potential match found! Please check with Lost & Found department.",
-            }
-            # Still add to database even if matched
-            metadata = {
-                "job_id": job["job_id"],
-                "location": location,
-                "date": date,
-                "itemName": itemName,
-                "type": "lost_report" if job_type == "user_complaint" else "found_report",
-                "user_id": job.get("user_id"),
-                "user_name": job.get("user_name"),
-                "timestamp": job.get("timestamp", time.time())
-            }
-            db.add_embedding(embedding, metadata)
-            db.save(DB_INDEX_PATH, DB_METADATA_PATH)
-            # If this is a user complaint, propagate potential match to found items
-            if job_type == "user_complaint":
-                try:
-                    for m in med_conf:
-                        meta = m.get("meta", {})
-                        target_found_job_id = meta.get("job_id")
-                        if not target_found_job_id:
-                            continue
-                        found_job_info_str = r.get(f"job:{target_found_job_id}")
-                        if found_job_info_str:
-                            found_job_info = json.loads(found_job_info_str)
-                            found_job_info["status"] = "matched"
-                            found_job_info["message"] = "Potential match with a lost complaint"
-                            r.set(f"job:{target_found_job_id}", json.dumps(found_job_info))
-                            r.expire(f"job:{target_found_job_id}", 60*60*24*30)
-                        found_result = {
-                            "status": "matched",
-                            "matches": [{
-                                "meta": {
-                                    "job_id": job["job_id"],
-                                    "type": "lost_report",
-                                    "location": location,
-                                    "date": date,
-                                    "itemName": itemName,
-                                },
-                                "score": m.get("score", 0.8)
-                            }],
-                            "message": "Potential match found with a user lost complaint."
-                        }
-                        r.set(f"result:{target_found_job_id}", json.dumps(found_result))
-                        r.expire(f"result:{target_found_job_id}", 60*60*24*30)
-                except Exception as redis_e:
-                    print(f"⚠️ Redis propagation error for user med_conf: {redis_e}")
-                    traceback.print_exc()
-            
-            # Propagate medium confidence matches for admin_found as "matched" to user complaints
-            if job_type == "admin_found":
-                # Inner try/except block for Redis operations
-                try:
-                    for m in med_conf:
-                        meta = m.get("meta", {})
-                        target_job_id = meta.get("job_id")
-                        if not target_job_id:
-                            continue
-                        target_job_info_str = r.get(f"job:{target_job_id}")
-                        if target_job_info_str:
-                            target_job_info = json.loads(target_job_info_str)
-                            target_job_info["status"] = "matched"
-                            target_job_info["message"] = "Potential match with a found item"
-                            r.set(f"job:{target_job_id}", json.dumps(target_job_info))
-                            r.expire(f"job:{target_job_id}", 60*60*24*30)
-                        target_result = {
-                            "status": "matched",
-                            "matches": [{
-                                "meta": {
-                                    "job_id": job["job_id"],
-                                    "type": "admin_found",
-                                    "location": location,
-                                    "date": date,
-                                    "itemName": itemName,
-                                },
-                                "score": m.get("score", 0.8)
-                            }],
-                            "message": "Potential match found with an admin item."
-                        }
-                        r.set(f"result:{target_job_id}", json.dumps(target_result))
-                        r.expire(f"result:{target_job_id}", 60*60*24*30)
-                except Exception as redis_e:
-                    # Log internal Redis errors but don't fail the main processing loop
-                    print(f"⚠️ Redis propagation error for med_conf: {redis_e}")
-                    traceback.print_exc()
+def _is_ambiguous(score: float) -> bool:
+    return any(abs(score - t) <= TTA_CASCADE_BAND for t in (MEDIUM_CONFIDENCE, HIGH_CONFIDENCE))
 
-        else:
-            # Add the job as lost or found, depending on its type
-            for idx, embedding in enumerate(embeds):
-                metadata = {
-                    "job_id": job["job_id"],
-                    "location": location,
-                    "date": date,
-                    "itemName": itemName,
-                    "type": "lost_report" if job_type == "user_complaint" else "found_report",
-                    "user_id": job.get("user_id"),
-                    "user_name": job.get("user_name"),
-                    "timestamp": job.get("timestamp", time.time()),
-                    "exemplar": idx,
-                }
-                db.add_embedding(embedding, metadata)
-            db.save(DB_INDEX_PATH, DB_METADATA_PATH)
-            result = {
-                "status": "no_match",
-                "message": (
-                    "No match found; complaint has been added."
-                    if job_type == "user_complaint"
-                    else "No match found; found item has been added to the database."
-                ),
-            }
-        
+def _cascade_embed_and_search(job, image_bytes, search_target_type):
+    with metrics.span("embed", job_id=job["job_id"]), profiling.maybe_profile("worker-embed", job["job_id"]):
+        embeds = [get_image_embedding_single_from_bytes(image_bytes)]
+    matches = _search(job, embeds, search_target_type)
+    best = max((m["score"] for m in matches), default=0.0)
+    if not _is_ambiguous(best):
+        metrics.TTA_CASCADE.labels(outcome="settled").inc()
+        return embeds, matches
+    metrics.TTA_CASCADE.labels(outcome="escalated").inc()
+    with metrics.span("embed_remaining", job_id=job["job_id"]):
+        embeds = embeds + list(get_image_embeddings_remaining_variants_from_bytes(image_bytes))
+    return embeds, _search(job, embeds, search_target_type)
+
+def _make_thumbnail(job, image_bytes) -> bool:
+    # A missing thumbnail only costs the dashboard a picture; never fail the job
+    try:
+        with metrics.span("thumbnail", job_id=job["job_id"]):
+            thumbnails.make_thumbnail(job["job_id"], image_bytes)
+        return True
+    except Exception as e:
+        print(f"Thumbnail failed for job {job['job_id']}: {e}")
+        return False
+
+def process_job(job):
+    if job.get("type") == "index_views":
+        return _backfill_views(job)
+    with metrics.span("load_image", job_id=job["job_id"]):
+        image_bytes = _load_job_image(job)
+    has_thumbnail = _make_thumbnail(job, image_bytes)
+    job_type = job.get("type", "")
+
+    if job_type == "user_complaint":
+        search_target_type = "found_report"
+    elif job_type == "admin_found":
+        search_target_type = "lost_report"
+    else:
+        search_target_type = None
+
+    if search_target_type and TTA_MODE == "cascade":
+        embeds, matches = _cascade_embed_and_search(job, image_bytes, search_target_type)
+    else:
+        with metrics.span("embed", job_id=job["job_id"]), profiling.maybe_profile("worker-embed", job["job_id"]):
+            embeds = get_image_embeddings_variants_from_bytes(image_bytes)
+        matches = _search(job, embeds, search_target_type) if search_target_type else []
+    print(f"Generated {len(embeds)} embeddings for job {job['job_id']}")
+    high_conf, med_conf = get_best_matches(_with_records(matches))
+
+    
+
+    if high_conf:
+        result = {
+            "status": "matched",
+            "matches": high_conf,
+            "message": "Match found! Please report to Lost & Found department.",
+        }
+        # Still add to database even if matched
+        _add_to_index(job, embeds)
+        # If this is a user complaint, propagate match to corresponding found items
+        if job_type == "user_complaint":
+            try:
+                for m in high_conf:
+                    meta = m.get("meta", {})
+                    target_found_job_id = meta.get("job_id")
+                    if not target_found_job_id:
+                        continue
+                    found_job_info_str = r.get(f"job:{target_found_job_id}")
+                    if found_job_info_str:
+                        found_job_info = json.loads(found_job_info_str)
+                        found_job_info["status"] = "matched"
+                        found_job_info["message"] = "Matched with a lost complaint"
+                        r.set(f"job:{target_found_job_id}", json.dumps(found_job_info))
+                        r.expire(f"job:{target_found_job_id}", 60*60*24*30)
+                    # Only a reference to this job; listings read its details from job:{id}
+                    results.write(r, target_found_job_id, "matched", [{"meta": {"job_id": job["job_id"]}, "score": m.get("score", 1.0)}],
+                                  "Match found with a user lost complaint.")
+                    versions.bump_job(r, target_found_job_id, found_job_info if found_job_info_str else {})
+            except Exception as redis_e:
+                print(f"⚠️ Redis propagation error for user high_conf: {redis_e}")
+                traceback.print_exc()
         
+        # If this is an admin_found job, propagate 'matched' status to matched lost complaints
+        if job_type == "admin_found":
+            # Inner try/except block for Redis operations
+            try:
+                for m in high_conf:
+                    meta = m.get("meta", {})
+                    target_job_id = meta.get("job_id")
+                    if not target_job_id:
+                        continue
+                    # Update target lost complaint job status
+                    target_job_info_str = r.get(f"job:{target_job_id}")
+                    if target_job_info_str:
+                        target_job_info = json.loads(target_job_info_str)
+                        target_job_info["status"] = "matched"
+                        target_job_info["message"] = "Matched with a found item"
+                        r.set(f"job:{target_job_id}", json.dumps(target_job_info))
+                        r.expire(f"job:{target_job_id}", 60*60*24*30)
+                    # Only a reference to this job; listings read its details from job:{id}
+                    results.write(r, target_job_id, "matched", [{"meta": {"job_id": job["job_id"]}, "score": m.get("score", 1.0)}],
+                                  "Match found with an admin reported item.")
+                    versions.bump_job(r, target_job_id, target_job_info if target_job_info_str else {})
+            except Exception as redis_e:
+                # Log internal Redis errors but don't fail the main processing loop
+                print(f"⚠️ Redis propagation error for high_conf: {redis_e}")
+                traceback.print_exc()
+
+    elif med_conf:
+        result = {
+            "status": "matched",
+            "matches": med_conf,
+            "message": "Potential match found! Please check with Lost & Found department.",
+        }
+        # Still add to database even if matched
+        _add_to_index(job, embeds)
+        # If this is a user complaint, propagate potential match to found items
+        if job_type == "user_complaint":
+            try:
+                for m in med_conf:
+                    meta = m.get("meta", {})
+                    target_found_job_id = meta.get("job_id")
+                    if not target_found_job_id:
+                        continue
+                    found_job_info_str = r.get(f"job:{target_found_job_id}")
+                    if found_job_info_str:
+                        found_job_info = json.loads(found_job_info_str)
+                        found_job_info["status"] = "matched"
+                        found_job_info["message"] = "Potential match with a lost complaint"
+                        r.set(f"job:{target_found_job_id}", json.dumps(found_job_info))
+                        r.expire(f"job:{target_found_job_id}", 60*60*24*30)
+                    # Only a reference to this job; listings read its details from job:{id}
+                    results.write(r, target_found_job_id, "matched", [{"meta": {"job_id": job["job_id"]}, "score": m.get("score", 0.8)}],
+                                  "Potential match found with a user lost complaint.")
+                    versions.bump_job(r, target_found_job_id, found_job_info if found_job_info_str else {})
+            except Exception as redis_e:
+                print(f"⚠️ Redis propagation error for user med_conf: {redis_e}")
+                traceback.print_exc()
         
+        # Propagate medium confidence matches for admin_found as "matched" to user complaints
+        if job_type == "admin_found":
+            # Inner try/except block for Redis operations
+            try:
+                for m in med_conf:
+                    meta = m.get("meta", {})
+                    target_job_id = meta.get("job_id")
+                    if not target_job_id:
+                        continue
+                    target_job_info_str = r.get(f"job:{target_job_id}")
+                    if target_job_info_str:
+                        target_job_info = json.loads(target_job_info_str)
+                        target_job_info["status"] = "matched"
+                        target_job_info["message"] = "Potential match with a found item"
+                        r.set(f"job:{target_job_id}", json.dumps(target_job_info))
+                        r.expire(f"job:{target_job_id}", 60*60*24*30)
+                    # Only a reference to this job; listings read its details from job:{id}
+                    results.write(r, target_job_id, "matched", [{"meta": {"job_id": job["job_id"]}, "score": m.get("score", 0.8)}],
+                                  "Potential match found with an admin item.")
+                    versions.bump_job(r, target_job_id, target_job_info if target_job_info_str else {})
+            except Exception as redis_e:
+                # Log internal Redis errors but don't fail the main processing loop
+                print(f"⚠️ Redis propagation error for med_conf: {redis_e}")
+                traceback.print_exc()
+
+    else:
+        # Add the job as lost or found, depending on its type
+        _add_to_index(job, embeds)
+        result = {
+            "status": "no_match",
+            "message": results.no_match_message(job_type),
+        }
+    
+    
+    
+    with metrics.span("redis_write_back", job_id=job["job_id"]):
         # Update job status in Redis
         job_info_str = r.get(f"job:{job['job_id']}")
         if job_info_str:
             job_info = json.loads(job_info_str)
             job_info["status"] = result["status"]
             job_info["processed_at"] = time.time()
+            if has_thumbnail:
+                job_info["image_url"] = thumbnail_url(job["job_id"])
             r.set(f"job:{job['job_id']}", json.dumps(job_info))
             r.expire(f"job:{job['job_id']}", 60*60*24*30)
 
         # Save the result back to Redis
-        r.set(f"result:{job['job_id']}", json.dumps(result))
-        r.expire(f"result:{job['job_id']}", 60*60*24*30)
-        print(f"✅ Job {job['job_id']} processed and saved to Redis")
+        results.write(r, job["job_id"], result["status"], result.get("matches"), result["message"])
+        versions.bump_job(r, job["job_id"], job)
+        _record_batch_progress(job, result["status"])
+    if len(embeds) == 1:
+        # Settled in the cascade; only the upright view is indexed so far
+        _enqueue_view_backfill(job)
+    print(f"✅ Job {job['job_id']} processed and saved to Redis")
+    return result["status"]
 
-    except Exception as e:
-        # This catches errors during setup, embedding generation, or main processing
-        print(f"❌ Error processing job {job['job_id']}: {e}")
-        traceback.print_exc()
+
+def main():
+    moved = migrate_legacy_queue()
+    if moved:
+        print(f"Moved {moved} jobs from the legacy list queue to the stream.")
+
+    metrics.start_worker_server()
+    gauges_at = 0.0
+    while True:
+        if time.time() - gauges_at >= METRICS_REFRESH_S:
+            gauges_at = time.time()
+            try:
+                metrics.update_queue_depth(queue_stats())
+            except Exception as e:
+                print(f"Queue depth refresh failed: {e}")
+
+        job = dequeue_job()
+        if not job:
+            time.sleep(2)
+            continue
+
+        if not job.get("job_id") or job.get("_deliveries", 1) > JOB_MAX_DELIVERIES:
+            print(f"☠️ Dead-lettering job {job.get('job_id')} after {job.get('_deliveries')} deliveries")
+            _mark_failed(job, "exceeded max deliveries")
+            metrics.observe_job(job.get("type"), "dead_letter", 0.0)
+            continue
+
+        print(f"\n🔹 Processing job: {job['job_id']} ({job['type']})")
+        metrics.observe_queue_wait(job, _LANE_OF_STREAM.get(job.get("_stream"), "unknown"))
+
+        started = time.perf_counter()
+        try:
+            status = process_job(job)
+            # Only ack once the result has been written back to Redis
+            ack_job(job)
+            metrics.observe_job(job.get("type"), status, time.perf_counter() - started)
+        except Exception as e:
+            metrics.observe_job(job.get("type"), "error", time.perf_counter() - started)
+            # This catches errors during setup, embedding generation, or main processing
+            print(f"❌ Error processing job {job['job_id']}: {e}")
+            traceback.print_exc()
+            # Leave the message pending so it is retried via idle-claim, unless it keeps failing
+            if job.get("_deliveries", 1) >= JOB_MAX_DELIVERIES:
+                try:
+                    _mark_failed(job, e)
+                except Exception:
+                    traceback.print_exc()
+
+if __name__ == "__main__":
+    main()
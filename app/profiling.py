@@ -0,0 +1,105 @@
+import os
+import re
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+# Opt-in sampled profiling of the embedding forward pass, in the worker and in
+# the API's search path. A sampled call is recorded with cProfile (.prof, open
+# with snakeviz or flameprof) or torch.profiler (.json Chrome trace, open in
+# Perfetto) and written to PROFILE_DIR as <scope>-<job or request id>-<ts>.*
+#
+# Off by default. Turn it on with PROFILE_SAMPLE_RATE, or at runtime without a
+# redeploy via POST /api/admin/profiling, which stores an override in Redis that
+# every process picks up within PROFILE_CONFIG_REFRESH_S.
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_MODE = os.getenv("PROFILE_MODE", "cprofile")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_CONFIG_REFRESH_S = float(os.getenv("PROFILE_CONFIG_REFRESH_S", "10"))
+PROFILE_CONFIG_KEY = "profiling:config"
+PROFILE_MODES = ("cprofile", "torch")
+
+_config = {"sample_rate": PROFILE_SAMPLE_RATE, "mode": PROFILE_MODE}
+_config_read_at = 0.0
+_config_lock = threading.Lock()
+# cProfile can't nest, so only one sampled capture runs per process at a time
+_capture_lock = threading.Lock()
+
+def parse_config(raw: dict) -> dict:
+    rate = float(raw.get("sample_rate", PROFILE_SAMPLE_RATE))
+    mode = raw.get("mode") or PROFILE_MODE
+    return {"sample_rate": min(1.0, max(0.0, rate)), "mode": mode if mode in PROFILE_MODES else "cprofile"}
+
+def current_config() -> dict:
+    # Redis override if one is set (it expires with its duration), else the env defaults
+    global _config, _config_read_at
+    if time.time() - _config_read_at < PROFILE_CONFIG_REFRESH_S:
+        return _config
+    with _config_lock:
+        if time.time() - _config_read_at >= PROFILE_CONFIG_REFRESH_S:
+            try:
+                from app.queue_config import r
+                raw = r.hgetall(PROFILE_CONFIG_KEY)
+                _config = parse_config(raw or {})
+            except Exception as e:
+                print(f"Profiling config read failed: {e}")
+            _config_read_at = time.time()
+    return _config
+
+def _trace_path(scope: str, tag: str, ext: str) -> str:
+    safe_tag = re.sub(r"[^A-Za-z0-9_.-]", "_", str(tag))[:80]
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    return os.path.join(PROFILE_DIR, f"{scope}-{safe_tag}-{int(time.time() * 1000)}{ext}")
+
+@contextmanager
+def _cprofile(path: str):
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+@contextmanager
+def _torch_profile(path: str):
+    from torch.profiler import profile, ProfilerActivity
+    with profile(activities=[ProfilerActivity.CPU], record_shapes=True, with_stack=True) as prof:
+        yield
+    prof.export_chrome_trace(path)
+
+@contextmanager
+def maybe_profile(scope: str, tag: str):
+    """Profile the block for a sampled fraction of calls; otherwise a no-op."""
+    config = current_config()
+    if config["sample_rate"] <= 0 or random.random() >= config["sample_rate"]:
+        yield
+        return
+    if not _capture_lock.acquire(blocking=False):
+        yield
+        return
+    try:
+        if config["mode"] == "torch":
+            path = _trace_path(scope, tag, ".json")
+            capture = _torch_profile(path)
+        else:
+            path = _trace_path(scope, tag, ".prof")
+            capture = _cprofile(path)
+        with capture:
+            yield
+        print(f"Profile written to {path}")
+    finally:
+        _capture_lock.release()
+
+def recent_traces(limit: int = 50) -> list:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    entries = []
+    for name in os.listdir(PROFILE_DIR):
+        path = os.path.join(PROFILE_DIR, name)
+        if os.path.isfile(path):
+            entries.append({"file": name, "bytes": os.path.getsize(path), "created_at": os.path.getmtime(path)})
+    entries.sort(key=lambda e: e["created_at"], reverse=True)
+    return entries[:limit]
@@ -0,0 +1,120 @@
+from app import runtime
+runtime.configure("index")
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import faiss
+from app.faiss_db import FaissImageDB, make_index, index_storage
+
+# Measures what fp16 / sq8 storage would cost in match quality on our real
+# index before switching INDEX_STORAGE. Queries are stored reports held out of
+# the measured index (one view each; none of their 8 views stay indexed, or a
+# query would find itself and inflate recall). Each quantized index is compared
+# against the float32 baseline on:
+#   recall@k         overlap of the top-k rows with the fp32 top-k
+#   top1_agreement   fraction of queries whose best row is unchanged
+#   score drift      |inner product| difference on the fp32 top-k rows
+#   tier_flips       rows whose combined score crosses the 0.72/0.92 thresholds
+#   bytes            serialized index size
+#
+#   python -m app.quantization_report --index faiss.index --metadata metadata.pkl
+
+def _tiers(scores):
+    return np.where(scores >= 0.92, 2, np.where(scores >= 0.72, 1, 0))
+
+def _combined(ip):
+    # Same embedding term as FaissImageDB.query with a neutral location score
+    return np.clip(0.9 * (ip + 1) / 2 + 0.1 * 0.7, 0.0, 1.0)
+
+def evaluate(vectors: np.ndarray, queries: np.ndarray, k: int) -> dict:
+    base = make_index(vectors.shape[1], "fp32")
+    base.add(vectors)
+    started = time.perf_counter()
+    D0, I0 = base.search(queries, k)
+    report = {"fp32": {
+        "bytes": int(faiss.serialize_index(base).nbytes),
+        "search_ms_per_query": (time.perf_counter() - started) * 1000.0 / len(queries),
+    }}
+    for storage in ("fp16", "sq8"):
+        index = make_index(vectors.shape[1], storage)
+        if not index.is_trained:
+            index.train(vectors)
+        index.add(vectors)
+        started = time.perf_counter()
+        D, I = index.search(queries, k)
+        search_ms = (time.perf_counter() - started) * 1000.0 / len(queries)
+        recall = np.mean([len(set(I0[q]) & set(I[q])) / float(k) for q in range(len(queries))])
+        top1 = float(np.mean(I0[:, 0] == I[:, 0]))
+        # Score the fp32 top-k rows with the quantized vectors to isolate drift
+        recon = index.reconstruct_n(0, index.ntotal)
+        quantized_ip = np.einsum("qd,qkd->qk", queries, recon[I0])
+        drift = np.abs(quantized_ip - D0)
+        flips = np.mean(_tiers(_combined(D0)) != _tiers(_combined(quantized_ip)))
+        report[storage] = {
+            "bytes": int(faiss.serialize_index(index).nbytes),
+            "search_ms_per_query": search_ms,
+            f"recall@{k}": float(recall),
+            "top1_agreement": top1,
+            "score_drift_mean": float(drift.mean()),
+            "score_drift_p99": float(np.percentile(drift, 99)),
+            "score_drift_max": float(drift.max()),
+            "tier_flip_rate": float(flips),
+        }
+    for storage in ("fp16", "sq8"):
+        report[storage]["size_ratio"] = report["fp32"]["bytes"] / max(1, report[storage]["bytes"])
+    return report
+
+def _holdout(db: FaissImageDB, queries: int, seed: int):
+    """(all vectors, one query row per sampled report, rows of every other report)."""
+    vectors = db.index.reconstruct_n(0, db.index.ntotal).astype(np.float32)
+    rows_of = {}
+    for i, meta in enumerate(db.metadata):
+        if isinstance(meta, dict) and not meta.get("deleted"):
+            rows_of.setdefault(meta.get("job_id") or f"row-{i}", []).append(i)
+    jobs = sorted(rows_of)
+    rng = np.random.default_rng(seed)
+    # Keep at least one report indexed
+    held = set(rng.choice(len(jobs), size=min(queries, len(jobs) - 1), replace=False).tolist()) if len(jobs) > 1 else set()
+    query_rows = np.array([rows_of[jobs[j]][0] for j in sorted(held)], dtype=np.int64)
+    indexed_rows = np.array([i for j, job in enumerate(jobs) if j not in held for i in rows_of[job]], dtype=np.int64)
+    return vectors, query_rows, indexed_rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recall and score drift of fp16/sq8 index storage vs float32")
+    parser.add_argument("--index", default="faiss.index")
+    parser.add_argument("--metadata", default="metadata.pkl")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    db = FaissImageDB(storage="fp32")
+    db.load(args.index, args.metadata)
+    if db.index.ntotal == 0:
+        print("Index is empty; nothing to measure.")
+        return 1
+    vectors, query_rows, indexed_rows = _holdout(db, args.queries, args.seed)
+    if not len(query_rows) or not len(indexed_rows):
+        print("Need at least two live reports to hold queries out of the index.")
+        return 1
+    indexed = np.ascontiguousarray(vectors[indexed_rows])
+    report = {
+        "vectors": int(len(indexed)),
+        "dim": int(vectors.shape[1]),
+        "queries": int(len(query_rows)),
+        "source_storage": index_storage(faiss.read_index(args.index)),
+        **evaluate(indexed, np.ascontiguousarray(vectors[query_rows]), min(args.k, len(indexed))),
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,290 @@
 import redis
+import redis.asyncio as aioredis
 import os
 import json
+import socket
+import time
+import threading
 
 REDIS_HOST = os.getenv("REDIS_HOST", "redis-14696.c330.asia-south1-1.gce.redns.redis-cloud.com")
 REDIS_PORT = os.getenv("REDIS_PORT", "14696")
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", "6CWoI4fVTA1WVSDZibKXuqGgeW3RfxnT")
 
-r = redis.StrictRedis(
-    host=REDIS_HOST,
-    port=REDIS_PORT,
-    password=REDIS_PASSWORD,
-    decode_responses=True
-)
+# Jobs live in a Redis Stream read through a consumer group, so a message stays
+# pending until the worker acks it and a crashed worker's jobs can be reclaimed.
+LEGACY_QUEUE = "lostandfound_jobs"
+JOB_STREAM = "lostandfound_jobs:stream"
+BULK_JOB_STREAM = "lostandfound_jobs:bulk"
+JOB_GROUP = "lostandfound_workers"
+DEAD_LETTER_STREAM = "lostandfound_jobs:dead"
+CONSUMER_NAME = os.getenv("WORKER_NAME", f"{socket.gethostname()}-{os.getpid()}")
+JOB_CLAIM_IDLE_MS = int(os.getenv("JOB_CLAIM_IDLE_MS", "120000"))
+JOB_MAX_DELIVERIES = int(os.getenv("JOB_MAX_DELIVERIES", "3"))
 
-def enqueue_job(job_data: dict):
-    r.rpush("lostandfound_jobs", json.dumps(job_data))
+# Priority lanes, highest first: interactive user complaints are always served
+# before bulk admin uploads. Each lane has its own admission limit.
+LANE_INTERACTIVE = "interactive"
+LANE_BULK = "bulk"
+LANE_STREAMS = {
+    LANE_INTERACTIVE: JOB_STREAM,
+    LANE_BULK: BULK_JOB_STREAM,
+}
+LANE_ORDER = [LANE_INTERACTIVE, LANE_BULK]
+MAX_QUEUE_DEPTH = {
+    LANE_INTERACTIVE: int(os.getenv("MAX_QUEUE_DEPTH_INTERACTIVE", "500")),
+    LANE_BULK: int(os.getenv("MAX_QUEUE_DEPTH_BULK", "5000")),
+}
+QUEUE_RETRY_AFTER_S = int(os.getenv("QUEUE_RETRY_AFTER_S", "30"))
+REDIS_POOL_SIZE = int(os.getenv("REDIS_POOL_SIZE", "50"))
+
+# REDIS_BACKEND=memory swaps in the in-process stand-in (app/memory_redis.py)
+# for load tests on an isolated box: no server and no network, but also no
+# sharing between processes, so the API and the worker must run in one process
+# (python -m app.loadgen does that). For multi-process tests, keep the default
+# backend and point REDIS_HOST/REDIS_PORT/REDIS_PASSWORD at a local server.
+REDIS_BACKEND = os.getenv("REDIS_BACKEND", "redis")
+
+if REDIS_BACKEND == "memory":
+    from app.memory_redis import MemoryRedis, AsyncMemoryRedis
+    r = MemoryRedis()
+    ar = AsyncMemoryRedis(r)
+    rb = r.view(False)
+    arb = AsyncMemoryRedis(rb)
+else:
+    r = redis.StrictRedis(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        password=REDIS_PASSWORD,
+        decode_responses=True
+    )
+
+    # asyncio client for the FastAPI handlers. The pool is bounded and blocking,
+    # so a burst of requests waits for a free connection instead of opening one
+    # per request.
+    ar = aioredis.Redis(
+        connection_pool=aioredis.BlockingConnectionPool(
+            host=REDIS_HOST,
+            port=int(REDIS_PORT),
+            password=REDIS_PASSWORD,
+            decode_responses=True,
+            max_connections=REDIS_POOL_SIZE,
+            timeout=10,
+        )
+    )
+
+    # Binary-safe twins of r and ar for values that are not UTF-8 text, such as
+    # the msgpack result:{job_id} records (app/results.py)
+    rb = redis.StrictRedis(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        password=REDIS_PASSWORD,
+        decode_responses=False
+    )
+
+    arb = aioredis.Redis(
+        connection_pool=aioredis.BlockingConnectionPool(
+            host=REDIS_HOST,
+            port=int(REDIS_PORT),
+            password=REDIS_PASSWORD,
+            decode_responses=False,
+            max_connections=REDIS_POOL_SIZE,
+            timeout=10,
+        )
+    )
+
+_group_ready = False
+
+def ensure_job_group():
+    global _group_ready
+    if _group_ready:
+        return
+    for stream in LANE_STREAMS.values():
+        try:
+            r.xgroup_create(stream, JOB_GROUP, id="0", mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+    _group_ready = True
+
+# Pops one legacy job and adds it to the stream in a single atomic step, so a
+# crash can't drop a job between the two and concurrent workers can't race
+_MIGRATE_ONE = """
+local data = redis.call('LPOP', KEYS[1])
+if data then
+    redis.call('XADD', KEYS[2], '*', 'data', data)
+end
+return data
+"""
+
+def migrate_legacy_queue():
+    # Move jobs still sitting in the old RPUSH/BLPOP list onto the stream
+    moved = 0
+    if REDIS_BACKEND == "memory":
+        # No Lua here; nothing survives a crash and only this process sees the store
+        while (data := r.lpop(LEGACY_QUEUE)) is not None:
+            r.xadd(JOB_STREAM, {"data": data})
+            moved += 1
+        return moved
+    move_one = r.register_script(_MIGRATE_ONE)
+    while move_one(keys=[LEGACY_QUEUE, JOB_STREAM]) is not None:
+        moved += 1
+    return moved
+
+def lane_for_job_type(job_type: str) -> str:
+    return LANE_INTERACTIVE if job_type == "user_complaint" else LANE_BULK
+
+def enqueue_job(job_data: dict, lane: str = LANE_INTERACTIVE, pipe=None):
+    # Pass a pipeline to batch many enqueues into a single round-trip
+    (pipe or r).xadd(LANE_STREAMS[lane], {"data": json.dumps(job_data)})
+
+def _delivery_count(stream: str, msg_id: str) -> int:
+    try:
+        pending = r.xpending_range(stream, JOB_GROUP, min=msg_id, max=msg_id, count=1)
+        if pending:
+            return int(pending[0].get("times_delivered", 1))
+    except Exception:
+        pass
+    return 1
+
+def _to_job(stream: str, msg_id: str, fields: dict, deliveries: int):
+    try:
+        job = json.loads(fields["data"])
+    except Exception:
+        # Unparseable payloads can never succeed; hand them back for dead-lettering
+        job = {"job_id": None, "raw": fields}
+    job["_stream"] = stream
+    job["_msg_id"] = msg_id
+    job["_deliveries"] = deliveries
+    return job
+
+# Messages already delivered to this consumer by a multi-lane read, not yet handed out
+_delivered = []
+_delivered_lock = threading.Lock()
+_LANE_RANK = {LANE_STREAMS[lane]: rank for rank, lane in enumerate(LANE_ORDER)}
+
+def _claim_stale_job(stream: str):
+    # Take over one message another consumer has held for longer than JOB_CLAIM_IDLE_MS
+    try:
+        resp = r.xautoclaim(stream, JOB_GROUP, CONSUMER_NAME, JOB_CLAIM_IDLE_MS, start_id="0-0", count=1)
+    except redis.exceptions.ResponseError:
+        return None
+    messages = resp[1] if resp and len(resp) > 1 else []
+    for msg_id, fields in messages:
+        if not fields:
+            # Entry was trimmed from the stream while pending
+            r.xack(stream, JOB_GROUP, msg_id)
+            continue
+        return _to_job(stream, msg_id, fields, _delivery_count(stream, msg_id))
+    return None
+
+def _read_new(streams: dict, block=None):
+    # COUNT applies per stream, so a read over several lanes can deliver one
+    # message from each. They are all pending on this consumer now: hand back
+    # the first and keep the rest for the next dequeue_job call, rather than
+    # leaving them for idle-claim to redeliver minutes later.
+    resp = r.xreadgroup(JOB_GROUP, CONSUMER_NAME, streams, count=1, block=block)
+    jobs = [_to_job(stream, msg_id, fields, 1)
+            for stream, messages in resp or [] for msg_id, fields in messages]
+    if not jobs:
+        return None
+    with _delivered_lock:
+        _delivered.extend(jobs[1:])
+    return jobs[0]
+
+def _take_delivered():
+    with _delivered_lock:
+        if not _delivered:
+            return None
+        # Serve the buffer in lane priority order too
+        job = min(_delivered, key=lambda j: _LANE_RANK.get(j["_stream"], len(LANE_ORDER)))
+        _delivered.remove(job)
+        return job
 
 def dequeue_job():
-    job = r.blpop("lostandfound_jobs", timeout=5)
+    ensure_job_group()
+    job = _take_delivered()
     if job:
-        _, data = job
-        return json.loads(data)
-    return None
+        return job
+    for lane in LANE_ORDER:
+        job = _claim_stale_job(LANE_STREAMS[lane])
+        if job:
+            return job
+    # Drain lanes strictly in priority order before blocking on all of them
+    for lane in LANE_ORDER:
+        job = _read_new({LANE_STREAMS[lane]: ">"})
+        if job:
+            return job
+    return _read_new({LANE_STREAMS[lane]: ">" for lane in LANE_ORDER}, block=5000)
+
+def ack_job(job: dict):
+    msg_id = job.get("_msg_id")
+    if not msg_id:
+        return
+    stream = job.get("_stream", JOB_STREAM)
+    pipe = r.pipeline()
+    pipe.xack(stream, JOB_GROUP, msg_id)
+    pipe.xdel(stream, msg_id)
+    pipe.execute()
+
+def dead_letter_job(job: dict, error: str):
+    # Park a poison job on the dead-letter stream and drop it from the live queue
+    payload = {k: v for k, v in job.items() if not k.startswith("_")}
+    r.xadd(DEAD_LETTER_STREAM, {
+        "data": json.dumps(payload),
+        "error": str(error),
+        "stream": job.get("_stream") or "",
+        "msg_id": job.get("_msg_id") or "",
+        "deliveries": job.get("_deliveries", 1),
+    })
+    ack_job(job)
+
+def _lane_stats(lane: str, depth, oldest, now_ms: int) -> dict:
+    lag_s = 0.0
+    if oldest:
+        oldest_ms = int(oldest[0][0].split("-")[0])
+        lag_s = max(0.0, (now_ms - oldest_ms) / 1000.0)
+    return {
+        "depth": int(depth or 0),
+        "lag_seconds": round(lag_s, 3),
+        "max_depth": MAX_QUEUE_DEPTH[lane],
+    }
+
+def queue_stats() -> dict:
+    # Acked messages are deleted, so XLEN is exactly the backlog (waiting + in flight)
+    now_ms = int(time.time() * 1000)
+    pipe = r.pipeline()
+    for lane in LANE_ORDER:
+        pipe.xlen(LANE_STREAMS[lane])
+        pipe.xrange(LANE_STREAMS[lane], "-", "+", count=1)
+    replies = pipe.execute()
+    return {lane: _lane_stats(lane, replies[2 * i], replies[2 * i + 1], now_ms) for i, lane in enumerate(LANE_ORDER)}
+
+def _retry_after(lane: str, depth, incoming: int):
+    if (depth or 0) + incoming <= MAX_QUEUE_DEPTH[lane]:
+        return None
+    return QUEUE_RETRY_AFTER_S
+
+def admission_retry_after(lane: str, incoming: int = 1):
+    # Returns a Retry-After value in seconds if the lane can't take `incoming` more jobs, else None
+    return _retry_after(lane, r.xlen(LANE_STREAMS[lane]), incoming)
+
+# asyncio counterparts used by the API
+
+async def enqueue_job_async(job_data: dict, lane: str = LANE_INTERACTIVE, pipe=None):
+    # With a pipeline the XADD is only queued; the caller executes it
+    if pipe is not None:
+        pipe.xadd(LANE_STREAMS[lane], {"data": json.dumps(job_data)})
+        return
+    await ar.xadd(LANE_STREAMS[lane], {"data": json.dumps(job_data)})
+
+async def queue_stats_async() -> dict:
+    now_ms = int(time.time() * 1000)
+    pipe = ar.pipeline(transaction=False)
+    for lane in LANE_ORDER:
+        pipe.xlen(LANE_STREAMS[lane])
+        pipe.xrange(LANE_STREAMS[lane], "-", "+", count=1)
+    replies = await pipe.execute()
+    return {lane: _lane_stats(lane, replies[2 * i], replies[2 * i + 1], now_ms) for i, lane in enumerate(LANE_ORDER)}
+
+async def admission_retry_after_async(lane: str, incoming: int = 1):
+    return _retry_after(lane, await ar.xlen(LANE_STREAMS[lane]), incoming)
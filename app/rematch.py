@@ -0,0 +1,291 @@
+from app import runtime
+runtime.configure("index")
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from app.queue_config import r, rb
+from app import index_client
+from app import results
+from app import versions
+from app import metrics
+from app.results import HIGH_CONFIDENCE, MEDIUM_CONFIDENCE
+from app.metadata_filters import MATCH_DATE_WINDOW_DAYS, MATCH_FILTER_ZONE, MATCH_FILTER_CATEGORY, day_ordinal, location_zone, item_category
+
+# Bulk re-match of every live lost report against every live found report.
+# The worker only matches a report once, against whatever was indexed at that
+# moment; this re-checks the whole backlog after a threshold or model change,
+# or simply to catch pairs whose second half arrived while the first was
+# still queued.
+#
+# All vectors are pulled from the index service (index_client.export, so the
+# sharded and in-process modes work too), and similarities are computed as
+# dense matrix products in blocks of at most REMATCH_BLOCK_ROWS x
+# REMATCH_BLOCK_ROWS rows, so memory stays bounded however large the backlog.
+# Scoring is the same as FaissImageDB.query_batch: best cosine over all TTA
+# views of both reports, location weighting, the MATCH_* metadata filters and
+# the top REMATCH_K per report in each direction.
+#
+# Only results whose set of matched jobs (or their confidence tier) changed
+# are written, all in one pipeline. With --prune, reports that no longer have
+# any match are reset to no_match; without it they are left alone, since their
+# stored matches may point into the archive index.
+#
+#   python -m app.rematch --dry-run
+#   python -m app.rematch --every 3600
+REMATCH_BLOCK_ROWS = int(os.getenv("REMATCH_BLOCK_ROWS", "4096"))
+REMATCH_K = int(os.getenv("REMATCH_K", "5"))
+EXPORT_BATCH = 200
+MGET_BATCH = 1000
+# Weights used by FaissImageDB.query_batch
+W_EMBED = 0.9
+W_LOC = 0.1
+
+_MESSAGES = {
+    results.TIER_HIGH: "Match found! Please report to Lost & Found department.",
+    results.TIER_MEDIUM: "Potential match found! Please check with Lost & Found department.",
+}
+_NO_MATCH = {
+    "user_complaint": "No match found; complaint has been added.",
+    "admin_found": "No match found; found item has been added to the database.",
+}
+
+def _location_key(loc):
+    if not loc:
+        return None
+    return str(loc).strip().lower() or None
+
+class Side:
+    """Every live report of one type as a row matrix; each job's rows are contiguous."""
+    def __init__(self, reports: list, vocab: dict):
+        seen = set()
+        job_ids, metas, blocks = [], [], []
+        for report in reports:
+            # A report mid-rebalance can come back from two shards
+            if report["job_id"] in seen or len(report["vectors"]) == 0:
+                continue
+            seen.add(report["job_id"])
+            job_ids.append(report["job_id"])
+            metas.append(report["meta"])
+            blocks.append(np.asarray(report["vectors"], dtype=np.float32))
+        self.job_ids = job_ids
+        self.counts = np.array([len(b) for b in blocks], dtype=np.int64)
+        self.starts = np.concatenate([[0], np.cumsum(self.counts)[:-1]]).astype(np.int64)
+        dim = blocks[0].shape[1] if blocks else 0
+        vectors = np.vstack(blocks) if blocks else np.zeros((0, dim), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.vectors = np.ascontiguousarray(vectors / norms, dtype=np.float32)
+
+        # Integer codes shared with the other side (-1 = unknown), for vectorized
+        # location weighting and filtering
+        def code(attr, key):
+            return -1 if key is None else vocab.setdefault(attr, {}).setdefault(key, len(vocab[attr]))
+        self.loc = np.array([code("loc", _location_key(m.get("location"))) for m in metas], dtype=np.int32)
+        self.zone = np.array([code("zone", location_zone(m.get("location"))) for m in metas], dtype=np.int32)
+        self.cat = np.array([code("cat", item_category(m.get("itemName"))) for m in metas], dtype=np.int32)
+        days = [day_ordinal(m.get("date"), m.get("timestamp")) for m in metas]
+        self.day = np.array([-1 if d is None else d for d in days], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.job_ids)
+
+    def blocks(self, max_rows: int):
+        """(first job, last job + 1) spans of whole jobs with at most max_rows rows (or one job)."""
+        start = 0
+        while start < len(self):
+            end = start + 1
+            rows = int(self.counts[start])
+            while end < len(self) and rows + self.counts[end] <= max_rows:
+                rows += int(self.counts[end])
+                end += 1
+            yield start, end
+            start = end
+
+    def rows(self, start: int, end: int):
+        first = int(self.starts[start])
+        last = int(self.starts[end - 1] + self.counts[end - 1])
+        return self.vectors[first:last], self.starts[start:end] - first
+
+def load_side(report_type: str, vocab: dict) -> Side:
+    job_ids = [m["job_id"] for m in index_client.list_reports(report_type) if m.get("job_id")]
+    reports = []
+    for i in range(0, len(job_ids), EXPORT_BATCH):
+        reports.extend(index_client.export(job_ids[i:i + EXPORT_BATCH]))
+    return Side(reports, vocab)
+
+def _allowed(a: Side, b: Side, ai, bi):
+    # Pairs passing the MATCH_* filters, mirroring FaissImageDB.candidate_mask;
+    # an unknown value on either side never excludes
+    ok = np.ones((len(ai), len(bi)), dtype=bool)
+    if MATCH_DATE_WINDOW_DAYS > 0:
+        da, db = a.day[ai][:, None], b.day[bi][None, :]
+        ok &= (da < 0) | (db < 0) | (np.abs(da - db) <= MATCH_DATE_WINDOW_DAYS)
+    for enabled, attr in ((MATCH_FILTER_ZONE, "zone"), (MATCH_FILTER_CATEGORY, "cat")):
+        if enabled:
+            ca, cb = getattr(a, attr)[ai][:, None], getattr(b, attr)[bi][None, :]
+            ok &= (ca < 0) | (cb < 0) | (ca == cb)
+    return ok
+
+def score_block(lost: Side, found: Side, lspan, fspan) -> np.ndarray:
+    """Combined scores (lost jobs x found jobs) for two spans; below MEDIUM_CONFIDENCE is -1."""
+    lrows, lstarts = lost.rows(*lspan)
+    frows, fstarts = found.rows(*fspan)
+    sims = lrows @ frows.T
+    # Best view pair per job pair: rows of one job are contiguous
+    sims = np.maximum.reduceat(sims, lstarts, axis=0)
+    sims = np.maximum.reduceat(sims, fstarts, axis=1)
+    li = np.arange(*lspan)
+    fi = np.arange(*fspan)
+    lloc, floc = lost.loc[li][:, None], found.loc[fi][None, :]
+    loc_score = np.where((lloc >= 0) & (lloc == floc), 1.0, 0.7).astype(np.float32)
+    scores = np.clip(W_EMBED * (sims + 1) / 2 + W_LOC * loc_score, 0.0, 1.0)
+    scores[~_allowed(lost, found, li, fi) | (scores < MEDIUM_CONFIDENCE)] = -1.0
+    return scores
+
+def _merge_topk(best_s, best_i, block, offset: int, k: int):
+    cand_s = np.concatenate([best_s, block], axis=1)
+    cand_i = np.concatenate([best_i, np.broadcast_to(np.arange(offset, offset + block.shape[1]), block.shape)], axis=1)
+    if cand_s.shape[1] > k:
+        keep = np.argpartition(-cand_s, k - 1, axis=1)[:, :k]
+        cand_s = np.take_along_axis(cand_s, keep, axis=1)
+        cand_i = np.take_along_axis(cand_i, keep, axis=1)
+    return cand_s, cand_i
+
+def match_all(lost: Side, found: Side, k: int = REMATCH_K, block_rows: int = REMATCH_BLOCK_ROWS) -> dict:
+    """{(lost index, found index): score} for every pair in either report's top k.
+
+    Both directions are kept, as the worker does: a lost report's own top k,
+    and the lost reports that would have been in each found report's top k.
+    """
+    def empty(n):
+        return np.full((n, 0), -1.0, dtype=np.float32), np.zeros((n, 0), dtype=np.int64)
+    found_spans = list(found.blocks(block_rows))
+    found_tops = [empty(f1 - f0) for f0, f1 in found_spans]
+    pairs = {}
+
+    def collect(span, tops, as_pair):
+        for row, (scores, idx) in enumerate(zip(*tops)):
+            for s, j in zip(scores, idx):
+                if s >= 0:
+                    pairs[as_pair(span[0] + row, int(j))] = float(s)
+
+    for lspan in lost.blocks(block_rows):
+        lost_top = empty(lspan[1] - lspan[0])
+        for b, fspan in enumerate(found_spans):
+            block = score_block(lost, found, lspan, fspan)
+            lost_top = _merge_topk(*lost_top, block, fspan[0], k)
+            found_tops[b] = _merge_topk(*found_tops[b], block.T, lspan[0], k)
+        collect(lspan, lost_top, lambda i, j: (i, j))
+    for fspan, top in zip(found_spans, found_tops):
+        collect(fspan, top, lambda j, i: (i, j))
+    return pairs
+
+def _mget(client, keys: list) -> list:
+    pipe = client.pipeline(transaction=False)
+    for i in range(0, len(keys), MGET_BATCH):
+        pipe.mget(keys[i:i + MGET_BATCH])
+    return [value for chunk in pipe.execute() for value in chunk] if keys else []
+
+def _desired(refs: list) -> list:
+    # Same selection as get_best_matches: the high-confidence matches if any, else the medium ones
+    refs = sorted(refs, key=lambda ref: ref[1], reverse=True)
+    high = [ref for ref in refs if ref[1] >= HIGH_CONFIDENCE]
+    return high or refs
+
+def plan_writes(lost: Side, found: Side, pairs: dict, prune: bool = False) -> dict:
+    """job_id -> (job record, new status, [(matched job_id, score)]) for results that change."""
+    job_ids = lost.job_ids + found.job_ids
+    records = {}
+    for job_id, raw in zip(job_ids, _mget(r, [f"job:{j}" for j in job_ids])):
+        if raw:
+            records[job_id] = json.loads(raw)
+    refs = {}
+    for (i, j), score in pairs.items():
+        lid, fid = lost.job_ids[i], found.job_ids[j]
+        # Reports deleted from Redis but not yet from the index are skipped both ways
+        if lid in records and fid in records:
+            refs.setdefault(lid, []).append((fid, score))
+            refs.setdefault(fid, []).append((lid, score))
+    stored = dict(zip(job_ids, (results.decode(raw) for raw in _mget(rb, [f"result:{j}" for j in job_ids]))))
+    writes = {}
+    for job_id in job_ids:
+        if job_id not in records:
+            continue
+        current = stored.get(job_id)
+        if job_id in refs:
+            matches = _desired(refs[job_id])
+            wanted = {(ref_id, results.tier(score)) for ref_id, score in matches}
+            if current and current["status"] == "matched" and wanted == {(ref[0], ref[2]) for ref in current["refs"]}:
+                continue
+            writes[job_id] = (records[job_id], "matched", matches)
+        elif prune and current and current["status"] == "matched":
+            writes[job_id] = (records[job_id], "no_match", [])
+    return writes
+
+def apply_writes(writes: dict):
+    pipe = r.pipeline(transaction=False)
+    for job_id, (job_info, status, matches) in writes.items():
+        if status == "matched":
+            message = _MESSAGES[results.tier(matches[0][1])]
+        else:
+            message = _NO_MATCH.get(job_info.get("type"), "No match found.")
+        results.write(pipe, job_id, status, [{"meta": {"job_id": ref_id}, "score": score} for ref_id, score in matches], message)
+        job_info["status"] = status
+        pipe.set(f"job:{job_id}", json.dumps(job_info), keepttl=True)
+        versions.bump_job(pipe, job_id, job_info)
+    if writes:
+        pipe.execute()
+
+def run(dry_run: bool = False, prune: bool = False, k: int = REMATCH_K, block_rows: int = REMATCH_BLOCK_ROWS) -> dict:
+    report = {}
+    started = time.perf_counter()
+    with metrics.span("rematch_load"):
+        vocab = {}
+        lost = load_side("lost_report", vocab)
+        found = load_side("found_report", vocab)
+    report["lost_jobs"], report["found_jobs"] = len(lost), len(found)
+    report["lost_rows"], report["found_rows"] = len(lost.vectors), len(found.vectors)
+    report["load_s"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    with metrics.span("rematch_score"):
+        pairs = match_all(lost, found, k=k, block_rows=block_rows)
+    report["pairs"] = len(pairs)
+    report["score_s"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    writes = plan_writes(lost, found, pairs, prune=prune)
+    report["changed"] = sum(1 for _, status, _ in writes.values() if status == "matched")
+    report["pruned"] = len(writes) - report["changed"]
+    report["sample"] = list(writes)[:20]
+    if not dry_run:
+        with metrics.span("rematch_write"):
+            apply_writes(writes)
+    report["write_s"] = round(time.perf_counter() - started, 3)
+    report["applied"] = not dry_run
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-match every lost report against every found report")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    parser.add_argument("--prune", action="store_true", help="reset reports that no longer match anything to no_match")
+    parser.add_argument("--k", type=int, default=REMATCH_K, help="matches kept per report in each direction")
+    parser.add_argument("--block-rows", type=int, default=REMATCH_BLOCK_ROWS, help="rows per side of each similarity block")
+    parser.add_argument("--every", type=float, default=0, help="repeat every N seconds instead of running once")
+    args = parser.parse_args(argv)
+    while True:
+        try:
+            print(json.dumps(run(args.dry_run, args.prune, args.k, args.block_rows), indent=2))
+        except Exception as e:
+            if not args.every:
+                raise
+            print(f"Rematch failed: {e}")
+        if not args.every:
+            return 0
+        time.sleep(args.every)
+
+if __name__ == "__main__":
+    sys.exit(main())
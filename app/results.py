@@ -0,0 +1,112 @@
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# result:{job_id} records hold references, not copies: status, message and a
+# list of [matched job_id, score, tier]. Match metadata (item name, location,
+# date) is read from the matched job's own job: record when a result is shown,
+# with one MGET for a whole listing, so it is stored once and never goes stale.
+#
+# Records are msgpack, so they must be read with the binary Redis clients
+# (queue_config.rb / arb). Older JSON records with inlined metadata are still
+# read; they are rewritten in the new format the next time they change.
+RESULT_TTL_S = 60*60*24*30
+
+# Combined-score thresholds for a confident and a possible match. Kept here
+# rather than in faiss_db so the API can tier scores without loading FAISS.
+HIGH_CONFIDENCE = 0.92
+MEDIUM_CONFIDENCE = 0.72
+TIER_NONE, TIER_MEDIUM, TIER_HIGH = 0, 1, 2
+
+def tier(score: float) -> int:
+    if score >= HIGH_CONFIDENCE:
+        return TIER_HIGH
+    if score >= MEDIUM_CONFIDENCE:
+        return TIER_MEDIUM
+    return TIER_NONE
+
+def compact(status: str, matches=None, message: str = "") -> dict:
+    """A record from matches shaped like index search results ({"meta": {"job_id"}, "score"})."""
+    refs = []
+    for m in matches or []:
+        job_id = (m.get("meta") or {}).get("job_id")
+        if job_id:
+            score = round(float(m.get("score", 0.0)), 4)
+            refs.append((job_id, score, tier(score)))
+    return {"status": status, "message": message, "refs": refs}
+
+def encode(record: dict) -> bytes:
+    packed = {"s": record["status"], "msg": record["message"], "m": [list(ref) for ref in record["refs"]]}
+    if msgpack is not None:
+        return msgpack.packb(packed, use_bin_type=True, use_single_float=True)
+    return json.dumps(packed, separators=(",", ":")).encode("utf-8")
+
+def write(client, job_id: str, status: str, matches=None, message: str = "", ttl: int = RESULT_TTL_S):
+    # Any client (or pipeline) can write bytes; only reads need a binary client
+    client.set(f"result:{job_id}", encode(compact(status, matches, message)), ex=ttl)
+
+def decode(raw):
+    """A stored result as {"status", "message", "refs": [(job_id, score, tier)]}, or None."""
+    if raw is None:
+        return None
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+    if raw[:1] == b"{":
+        data = json.loads(raw)
+    elif msgpack is not None:
+        data = msgpack.unpackb(raw, raw=False)
+    else:
+        raise ValueError("msgpack is required to read this result record")
+    if "s" in data:
+        return {"status": data["s"], "message": data.get("msg", ""), "refs": [(job_id, round(score, 4), t) for job_id, score, t in data.get("m") or []]}
+    # Pre-compact JSON record with each match's metadata inlined
+    return compact(data.get("status", "pending"), data.get("matches"), data.get("message", ""))
+
+def is_legacy(raw) -> bool:
+    # Pre-compact JSON carries "status"; the compact JSON fallback carries "s"
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+    return raw[:1] == b"{" and "s" not in json.loads(raw)
+
+def no_match_message(job_type: str) -> str:
+    if job_type == "admin_found":
+        return "No match found; found item has been added to the database."
+    return "No match found; complaint has been added."
+
+def without(record: dict, job_ids, job_type: str) -> dict:
+    """record minus references to job_ids. A match left with no references
+    becomes no_match, with the message for the owning job's type."""
+    out = {**record, "refs": [ref for ref in record["refs"] if ref[0] not in job_ids]}
+    if not out["refs"] and out["status"] == "matched":
+        out["status"] = "no_match"
+        out["message"] = no_match_message(job_type)
+    return out
+
+def referenced_ids(records) -> set:
+    return {ref[0] for rec in records if rec for ref in rec["refs"]}
+
+def meta_from_job(job_id: str, job_info: dict) -> dict:
+    # The fields listings show for a match, from the matched job's own record
+    return {
+        "job_id": job_id,
+        "type": "lost_report" if job_info.get("type") == "user_complaint" else "found_report",
+        "location": job_info.get("location"),
+        "date": job_info.get("date"),
+        "itemName": job_info.get("itemName"),
+    }
+
+def expand(record: dict, metas: dict) -> dict:
+    """The API shape, {"status", "message", "matches": [{"meta", "score"}]}.
+
+    metas maps job_id -> meta for the referenced jobs that still exist;
+    references to deleted jobs are left out.
+    """
+    matches = []
+    for job_id, score, _tier in record["refs"]:
+        meta = metas.get(job_id)
+        if meta is not None:
+            matches.append({"meta": meta, "score": score})
+    return {"status": record["status"], "message": record["message"], "matches": matches}
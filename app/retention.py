@@ -0,0 +1,87 @@
+import os
+import time
+import datetime
+from app.faiss_db import FaissImageDB
+
+# Retention for the vector index. Reports filed more than RETENTION_DAYS ago (by
+# ingest timestamp, not the user-entered date) move from the hot index to a cold
+# archive index, which is only searched when a caller asks for it. Tombstoned
+# rows are compacted away, and hot rows whose job: record is gone from Redis are
+# purged, so the index tracks the same lifetime as the Redis keys.
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "30"))
+RETENTION_INTERVAL_S = int(os.getenv("RETENTION_INTERVAL_S", "3600"))
+ARCHIVE_INDEX_PATH = os.getenv("ARCHIVE_INDEX_PATH", "archive.index")
+ARCHIVE_METADATA_PATH = os.getenv("ARCHIVE_METADATA_PATH", "archive_metadata.pkl")
+# Drop archived reports after this many days; 0 keeps them forever
+ARCHIVE_MAX_DAYS = int(os.getenv("ARCHIVE_MAX_DAYS", "0"))
+ORPHAN_CHECK_BATCH = 500
+
+def load_archive(dim: int = 2048) -> FaissImageDB:
+    archive = FaissImageDB(dim=dim)
+    try:
+        archive.load(ARCHIVE_INDEX_PATH, ARCHIVE_METADATA_PATH)
+    except FileNotFoundError:
+        pass
+    return archive
+
+def save_archive(archive: FaissImageDB):
+    archive.save(ARCHIVE_INDEX_PATH, ARCHIVE_METADATA_PATH)
+
+def find_orphans(job_ids, redis_client) -> set:
+    # Pipelined EXISTS in batches so a large index doesn't mean one huge round-trip
+    orphans = set()
+    job_ids = list(job_ids)
+    for start in range(0, len(job_ids), ORPHAN_CHECK_BATCH):
+        batch = job_ids[start:start + ORPHAN_CHECK_BATCH]
+        pipe = redis_client.pipeline(transaction=False)
+        for job_id in batch:
+            pipe.exists(f"job:{job_id}")
+        for job_id, exists in zip(batch, pipe.execute()):
+            if not exists:
+                orphans.add(job_id)
+    return orphans
+
+def _job_ids_of(db: FaissImageDB, rows) -> set:
+    return {db.metadata[int(i)].get("job_id") for i in rows if isinstance(db.metadata[int(i)], dict)} - {None}
+
+def apply_retention(hot: FaissImageDB, archive: FaissImageDB, redis_client=None, today=None) -> dict:
+    """Run one retention pass in place. Callers must hold the index lock."""
+    today = today or datetime.date.today().toordinal()
+    report = {"archived_jobs": 0, "archived_rows": 0, "compacted_rows": 0, "orphan_jobs": 0, "orphan_rows": 0, "expired_archive_rows": 0}
+
+    # Age out whole reports: every exemplar of a job moves together
+    if RETENTION_DAYS > 0:
+        stale_jobs = _job_ids_of(hot, hot.rows_older_than(today - RETENTION_DAYS))
+        if stale_jobs:
+            rows = hot.rows_for_job_ids(stale_jobs)
+            live = [int(i) for i in rows if not hot.metadata[int(i)].get("deleted")]
+            vectors, metas = hot.take_rows(live)
+            archive.add_rows(vectors, metas)
+            hot.remove_rows(rows)
+            report["archived_jobs"] = len(stale_jobs)
+            report["archived_rows"] = len(live)
+
+    # Compact soft-deleted rows that every search would otherwise still scan
+    report["compacted_rows"] = hot.remove_rows(hot.tombstone_rows())
+
+    # Purge hot rows whose Redis job record no longer exists
+    if redis_client is not None:
+        orphans = find_orphans(hot.live_job_ids(), redis_client)
+        if orphans:
+            report["orphan_jobs"] = len(orphans)
+            report["orphan_rows"] = hot.remove_rows(hot.rows_for_job_ids(orphans))
+
+    archive.remove_rows(archive.tombstone_rows())
+    if ARCHIVE_MAX_DAYS > 0:
+        report["expired_archive_rows"] = archive.remove_rows(archive.rows_older_than(today - ARCHIVE_MAX_DAYS))
+    return report
+
+def report_changed(report: dict) -> bool:
+    return any(v for v in report.values())
+
+if __name__ == "__main__":
+    # Ask the running index service to do a pass now; it owns both indexes
+    from app import index_client
+    started = time.time()
+    print(index_client.run_retention())
+    print(f"Retention pass took {time.time() - started:.2f}s")
@@ -1,14 +1,26 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Header
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Header, Response
 from uuid import uuid4
 import time
-from app.queue_config import enqueue_job, r
+from app.queue_config import enqueue_job, enqueue_job_async, queue_stats_async, admission_retry_after_async, LANE_INTERACTIVE, LANE_BULK, ar, arb
 import json
 import base64
-from typing import Optional
+from typing import Optional, List
 import typing
 import os
+import re
+import zipfile
+import asyncio
 from fastapi.responses import FileResponse
-from app.faiss_db import FaissImageDB
+from starlette.concurrency import run_in_threadpool
+from app import index_client
+from app import search as photo_search
+from app import profiling
+from app import results
+from app import versions
+from app import thumbnails
+from app.storage import save_upload, save_stream, read_upload, delete_image, delete_job_images, UploadTooLarge, InvalidImageType, MAX_UPLOAD_BYTES
+
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "1000"))
 
 def _get_user_id_from_auth(authorization: typing.Optional[str]) -> typing.Optional[str]:
     try:
@@ -34,8 +46,31 @@ def _get_user_id_from_auth(authorization: typing.Optional[str]) -> typing.Option
     except Exception:
         return None
 
+async def _check_admission(lane: str, incoming: int = 1):
+    # Shed load with 429 instead of queueing work the worker won't reach for hours
+    retry_after = await admission_retry_after_async(lane, incoming)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=429,
+            detail="The matching queue is busy. Please try again shortly.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+async def _store_upload(file: UploadFile, job_id: str) -> str:
+    # Stream the upload to storage so the request never holds more than one chunk
+    try:
+        return await save_upload(file, job_id)
+    except InvalidImageType as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
 router = APIRouter()
 
+_search_slots = asyncio.Semaphore(photo_search.SEARCH_MAX_CONCURRENCY)
+# Job ids end up in file paths; anything else is refused before touching disk
+_JOB_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
  
 
 @router.post("/user/complaint")
@@ -51,20 +86,14 @@ async def upload_user_complaint(
     try:
         auth_user_id = _get_user_id_from_auth(authorization)
         user_id = auth_user_id or userId
+        await _check_admission(LANE_INTERACTIVE)
         
-        image_bytes = await file.read()
-        if file.content_type not in ("image/jpeg", "image/png"):
-            raise HTTPException(status_code=400, detail="Invalid image type. Use JPEG or PNG.")
-        if len(image_bytes) > 10 * 1024 * 1024:
-            raise HTTPException(status_code=413, detail="Image too large (max 10MB)")
-        # Encode as base64 string for safe JSON transport
-        image_b64 = base64.b64encode(image_bytes).decode('utf-8')
-
         job_id = str(uuid4())
+        image_path = await _store_upload(file, job_id)
         job = {
             "job_id": job_id,
             "type": "user_complaint",
-            "image_b64": image_b64,
+            "image_path": image_path,
             "location": location,
             "date": date,
             "itemName": itemName,
@@ -72,7 +101,6 @@ async def upload_user_complaint(
             "user_id": user_id,
             "user_name": userName
         }
-        enqueue_job(job)
         # Store job info in Redis for user tracking
         job_info = {
             "job_id": job_id,
@@ -85,13 +113,17 @@ async def upload_user_complaint(
             "user_id": user_id,
             "user_name": userName,
         }
-        r.set(f"job:{job_id}", json.dumps(job_info))
-        r.expire(f"job:{job_id}", 60*60*24*30)
-        
+        pipe = ar.pipeline(transaction=False)
+        pipe.set(f"job:{job_id}", json.dumps(job_info), ex=60*60*24*30)
         if user_id:
-            r.sadd(f"user:jobs:{user_id}", job_id)
+            pipe.sadd(f"user:jobs:{user_id}", job_id)
         # Track globally for admin visibility
-        r.sadd("jobs:lost_all", job_id)
+        pipe.sadd("jobs:lost_all", job_id)
+        versions.bump_job(pipe, job_id, job_info)
+        # Enqueued last in the same round-trip, so the worker never sees a job
+        # whose record isn't written yet
+        await enqueue_job_async(job, LANE_INTERACTIVE, pipe=pipe)
+        await pipe.execute()
         
         print(f"Job queued: {job_id}")
 
@@ -100,6 +132,8 @@ async def upload_user_complaint(
             "message": "Your complaint has been submitted and will be processed shortly.",
             "job_id": job_id,
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in /user/complaint: {e}")
         raise HTTPException(status_code=500, detail=f"Error: {e}")
@@ -112,25 +146,18 @@ async def upload_admin_found(
     itemName: str = Form(...)
 ):
     try:
-        image_bytes = await file.read()
-        if file.content_type not in ("image/jpeg", "image/png"):
-            raise HTTPException(status_code=400, detail="Invalid image type. Use JPEG or PNG.")
-        if len(image_bytes) > 10 * 1024 * 1024:
-            raise HTTPException(status_code=413, detail="Image too large (max 10MB)")
-        # Encode as base64 string
-        image_b64 = base64.b64encode(image_bytes).decode('utf-8')
-
+        await _check_admission(LANE_BULK)
         job_id = str(uuid4())
+        image_path = await _store_upload(file, job_id)
         job = {
             "job_id": job_id,
             "type": "admin_found",
-            "image_b64": image_b64,
+            "image_path": image_path,
             "location": location,
             "date": date,
             "itemName": itemName,
             "timestamp": time.time()
         }
-        enqueue_job(job)
         # Store job info in Redis for tracking
         job_info = {
             "job_id": job_id,
@@ -141,9 +168,12 @@ async def upload_admin_found(
             "timestamp": time.time(),
             "status": "pending",
         }
-        r.set(f"job:{job_id}", json.dumps(job_info))
-        r.expire(f"job:{job_id}", 60*60*24*30)
-        r.sadd("jobs:all", job_id)
+        pipe = ar.pipeline(transaction=False)
+        pipe.set(f"job:{job_id}", json.dumps(job_info), ex=60*60*24*30)
+        pipe.sadd("jobs:all", job_id)
+        versions.bump_job(pipe, job_id, job_info)
+        await enqueue_job_async(job, LANE_BULK, pipe=pipe)
+        await pipe.execute()
         
         print(f"Job queued: {job_id}")
 
@@ -152,17 +182,272 @@ async def upload_admin_found(
             "message": "Found report submitted and will be processed shortly.",
             "job_id": job_id,
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in /admin/found: {e}")
         raise HTTPException(status_code=500, detail=f"Error: {e}")
 
+def _parse_manifest(manifest) -> dict:
+    # Manifest is a JSON list of {"filename", "location", "date", "itemName"}; keyed by basename
+    if not manifest:
+        return {}
+    entries = json.loads(manifest) if isinstance(manifest, (str, bytes)) else manifest
+    if not isinstance(entries, list):
+        raise HTTPException(status_code=400, detail="Manifest must be a JSON list")
+    by_name = {}
+    for e in entries:
+        if isinstance(e, dict) and e.get("filename"):
+            by_name[os.path.basename(e["filename"])] = e
+    return by_name
+
+def _archive_members(zf: zipfile.ZipFile):
+    members = []
+    for info in zf.infolist():
+        name = info.filename
+        base = os.path.basename(name)
+        if info.is_dir() or not base or name.startswith("__MACOSX/") or base.startswith("."):
+            continue
+        if base == "manifest.json":
+            continue
+        members.append(info)
+    return members
+
+def _extract_archive(fileobj, items: list, rejected: list):
+    # Streams each zip member straight to storage; never holds the archive in memory
+    with zipfile.ZipFile(fileobj) as zf:
+        for info in _archive_members(zf):
+            base = os.path.basename(info.filename)
+            if info.file_size > MAX_UPLOAD_BYTES:
+                rejected.append({"filename": base, "reason": "Image too large (max 10MB)"})
+                continue
+            job_id = str(uuid4())
+            try:
+                with zf.open(info) as src:
+                    path = save_stream(src, job_id)
+            except (UploadTooLarge, InvalidImageType) as e:
+                rejected.append({"filename": base, "reason": str(e)})
+                continue
+            items.append({"filename": base, "job_id": job_id, "image_path": path})
+
+def _read_archive_manifest(fileobj):
+    with zipfile.ZipFile(fileobj) as zf:
+        count = len(_archive_members(zf))
+        for name in zf.namelist():
+            if os.path.basename(name) == "manifest.json" and not name.startswith("__MACOSX/"):
+                with zf.open(name) as f:
+                    return count, json.loads(f.read().decode("utf-8"))
+    return count, None
+
+@router.post("/admin/found/bulk")
+async def upload_admin_found_bulk(
+    files: List[UploadFile] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    manifest: Optional[str] = Form(None),
+    location: Optional[str] = Form(None),
+    date: Optional[str] = Form(None),
+    itemName: Optional[str] = Form(None)
+):
+    """
+    Submit many found items in one request, as repeated `files` parts and/or a zip `archive`.
+    `manifest` is a JSON list of {"filename", "location", "date", "itemName"} entries (a zip
+    may carry its own manifest.json); `location`/`date`/`itemName` fill in missing fields.
+    Returns a batch id whose progress is available from GET /admin/found/bulk/{batch_id}.
+    """
+    try:
+        files = files or []
+        entries = _parse_manifest(manifest)
+        incoming = len(files)
+        if archive is not None:
+            count, archive_manifest = await run_in_threadpool(_read_archive_manifest, archive.file)
+            incoming += count
+            if archive_manifest and not manifest:
+                entries = _parse_manifest(archive_manifest)
+        if incoming == 0:
+            raise HTTPException(status_code=400, detail="No images provided")
+        if incoming > BULK_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"Too many items (max {BULK_MAX_ITEMS} per batch)")
+        await _check_admission(LANE_BULK, incoming)
+
+        items = []
+        rejected = []
+        for f in files:
+            job_id = str(uuid4())
+            try:
+                path = await save_upload(f, job_id)
+            except (UploadTooLarge, InvalidImageType) as e:
+                rejected.append({"filename": f.filename, "reason": str(e)})
+                continue
+            items.append({"filename": os.path.basename(f.filename or ""), "job_id": job_id, "image_path": path})
+        if archive is not None:
+            await run_in_threadpool(archive.file.seek, 0)
+            await run_in_threadpool(_extract_archive, archive.file, items, rejected)
+
+        batch_id = str(uuid4())
+        now = time.time()
+        job_ids = []
+        jobs = []
+        pipe = ar.pipeline(transaction=False)
+        for item in items:
+            entry = entries.get(item["filename"], {})
+            item_location = entry.get("location") or location
+            item_name = entry.get("itemName") or itemName
+            item_date = entry.get("date") or date
+            if not item_location or not item_name:
+                rejected.append({"filename": item["filename"], "reason": "Missing location or itemName"})
+                delete_image(item["image_path"])
+                continue
+            job_id = item["job_id"]
+            job = {
+                "job_id": job_id,
+                "type": "admin_found",
+                "image_path": item["image_path"],
+                "location": item_location,
+                "date": item_date,
+                "itemName": item_name,
+                "timestamp": now,
+                "batch_id": batch_id,
+            }
+            job_info = {
+                "job_id": job_id,
+                "type": "admin_found",
+                "location": item_location,
+                "date": item_date,
+                "itemName": item_name,
+                "timestamp": now,
+                "status": "pending",
+                "batch_id": batch_id,
+            }
+            pipe.set(f"job:{job_id}", json.dumps(job_info), ex=60*60*24*30)
+            pipe.sadd("jobs:all", job_id)
+            pipe.sadd(f"batch:jobs:{batch_id}", job_id)
+            jobs.append(job)
+            job_ids.append(job_id)
+        if job_ids:
+            pipe.hset(f"batch:{batch_id}", mapping={
+                "batch_id": batch_id,
+                "total": len(job_ids),
+                "processed": 0,
+                "matched": 0,
+                "failed": 0,
+                "created_at": now,
+            })
+            pipe.expire(f"batch:{batch_id}", 60*60*24*30)
+            pipe.expire(f"batch:jobs:{batch_id}", 60*60*24*30)
+            versions.bump(pipe, ["jobs:all"])
+            # Enqueued after the job records and the batch counters, so the
+            # worker never processes a job before they exist
+            for job in jobs:
+                enqueue_job(job, LANE_BULK, pipe=pipe)
+            await pipe.execute()
+
+        print(f"Batch queued: {batch_id} ({len(job_ids)} items, {len(rejected)} rejected)")
+
+        return {
+            "status": "queued" if job_ids else "rejected",
+            "message": f"{len(job_ids)} found items submitted and will be processed shortly.",
+            "batch_id": batch_id if job_ids else None,
+            "total": len(job_ids),
+            "job_ids": job_ids,
+            "rejected": rejected,
+        }
+    except HTTPException:
+        raise
+    except (ValueError, zipfile.BadZipFile) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid bulk upload: {e}")
+    except Exception as e:
+        print(f"Error in /admin/found/bulk: {e}")
+        raise HTTPException(status_code=500, detail=f"Error: {e}")
+
+@router.get("/admin/found/bulk/{batch_id}")
+async def get_bulk_progress(batch_id: str):
+    try:
+        batch = await ar.hgetall(f"batch:{batch_id}")
+        if not batch:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        total = int(batch.get("total", 0))
+        processed = int(batch.get("processed", 0))
+        failed = int(batch.get("failed", 0))
+        return {
+            "batch_id": batch_id,
+            "total": total,
+            "processed": processed,
+            "matched": int(batch.get("matched", 0)),
+            "failed": failed,
+            "pending": max(0, total - processed - failed),
+            "done": processed + failed >= total,
+            "created_at": float(batch.get("created_at", 0)),
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in /admin/found/bulk/{batch_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Error: {e}")
+
+async def _match_metas(records, known: dict) -> dict:
+    # Results only reference matched jobs; read their details in one MGET,
+    # skipping jobs the caller already fetched
+    metas = {}
+    missing = []
+    for ref_id in results.referenced_ids(records):
+        if ref_id in known:
+            if known[ref_id]:
+                metas[ref_id] = results.meta_from_job(ref_id, json.loads(known[ref_id]))
+        else:
+            missing.append(ref_id)
+    if missing:
+        for ref_id, raw in zip(missing, await arb.mget([f"job:{j}" for j in missing])):
+            if raw:
+                metas[ref_id] = results.meta_from_job(ref_id, json.loads(raw))
+    return metas
+
+async def _fetch_jobs(job_ids, hydrate: bool = True):
+    """(job_id, job record JSON, result) for each id, in two round-trips in all.
+
+    The result is None when not ready yet, otherwise the API shape
+    {"status", "message", "matches"}; with hydrate=False it is the stored
+    record (results.decode) instead.
+    """
+    job_ids = list(job_ids)
+    if not job_ids:
+        return []
+    pipe = arb.pipeline(transaction=False)
+    pipe.mget([f"job:{j}" for j in job_ids])
+    pipe.mget([f"result:{j}" for j in job_ids])
+    job_strs, result_raws = await pipe.execute()
+    records = [results.decode(raw) for raw in result_raws]
+    if not hydrate:
+        return list(zip(job_ids, job_strs, records))
+    metas = await _match_metas(records, dict(zip(job_ids, job_strs)))
+    return [
+        (job_id, job_str, results.expand(record, metas) if record else None)
+        for job_id, job_str, record in zip(job_ids, job_strs, records)
+    ]
+
+async def _conditional(names, if_none_match, response: Response):
+    """304 response when the client's ETag is current, else None after setting the validators.
+
+    Versions are read before the data, so a change landing in between only
+    leaves the ETag older than the body and the next poll fetches again.
+    """
+    etag, modified = versions.tag(names, await ar.hmget(versions.VERSIONS_KEY, versions.fields(names)))
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if modified:
+        headers["Last-Modified"] = modified
+    if versions.not_modified(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
 @router.get("/admin/lost-items")
-async def admin_list_lost_items():
+async def admin_list_lost_items(response: Response, if_none_match: Optional[str] = Header(None)):
     try:
+        cached = await _conditional(["jobs:lost_all"], if_none_match, response)
+        if cached:
+            return cached
         complaints = []
-        job_ids = r.smembers("jobs:lost_all")
-        for job_id in job_ids:
-            job_info_str = r.get(f"job:{job_id}")
+        job_ids = await ar.smembers("jobs:lost_all")
+        for job_id, job_info_str, result in await _fetch_jobs(job_ids):
             if not job_info_str:
                 continue
             job_info = json.loads(job_info_str)
@@ -171,12 +456,10 @@ async def admin_list_lost_items():
                 job_info["image_available"] = True
             else:
                 job_info["image_available"] = False
-            result_str = r.get(f"result:{job_id}")
-            if result_str:
-                result = json.loads(result_str)
-                job_info["status"] = result.get("status", "pending")
-                job_info["matches"] = result.get("matches", [])
-                job_info["message"] = result.get("message", "")
+            if result:
+                job_info["status"] = result["status"]
+                job_info["matches"] = result["matches"]
+                job_info["message"] = result["message"]
             else:
                 job_info["status"] = "pending"
                 job_info["matches"] = []
@@ -189,23 +472,23 @@ async def admin_list_lost_items():
         raise HTTPException(status_code=500, detail=f"Error: {e}")
 
 @router.get("/admin/found-items")
-async def admin_list_found_items():
+async def admin_list_found_items(response: Response, if_none_match: Optional[str] = Header(None)):
     try:
+        cached = await _conditional(["jobs:all"], if_none_match, response)
+        if cached:
+            return cached
         items = []
-        job_ids = r.smembers("jobs:all")
-        for job_id in job_ids:
-            job_info_str = r.get(f"job:{job_id}")
+        job_ids = await ar.smembers("jobs:all")
+        for job_id, job_info_str, result in await _fetch_jobs(job_ids):
             if not job_info_str:
                 continue
             job_info = json.loads(job_info_str)
             if job_info.get("type") != "admin_found":
                 continue
-            result_str = r.get(f"result:{job_id}")
-            if result_str:
-                result = json.loads(result_str)
-                job_info["status"] = result.get("status", job_info.get("status", "pending"))
-                job_info["matches"] = result.get("matches", [])
-                job_info["message"] = result.get("message", "")
+            if result:
+                job_info["status"] = result["status"]
+                job_info["matches"] = result["matches"]
+                job_info["message"] = result["message"]
             else:
                 job_info["status"] = job_info.get("status", "pending")
                 job_info["matches"] = []
@@ -218,85 +501,59 @@ async def admin_list_found_items():
         raise HTTPException(status_code=500, detail=f"Error: {e}")
 
 @router.get("/admin/lost-items-faiss")
-async def admin_list_lost_items_faiss():
+async def admin_list_lost_items_faiss(response: Response, if_none_match: Optional[str] = Header(None)):
     try:
-        import pickle
+        # Lost reports plus the found results that reconcile them. Index-only
+        # changes (retention) bump nothing and show up with the hourly rollover.
+        cached = await _conditional(["jobs:lost_all", "jobs:all"], if_none_match, response)
+        if cached:
+            return cached
         metas = []
-        meta_path = "metadata.pkl"
-        if not os.path.exists(meta_path):
-            return {"lost_items": []}
         # Build a map of lost job_ids that are matched via admin_found results
         matched_lost_ids = set()
         try:
-            admin_job_ids = r.smembers("jobs:all")
-            for aj in admin_job_ids:
-                job_info_str = r.get(f"job:{aj}")
-                if not job_info_str:
+            admin_job_ids = await ar.smembers("jobs:all")
+            for aj, job_info_str, record in await _fetch_jobs(admin_job_ids, hydrate=False):
+                if not job_info_str or not record:
                     continue
                 job_info = json.loads(job_info_str)
                 if job_info.get("type") != "admin_found":
                     continue
-                result_str = r.get(f"result:{aj}")
-                if not result_str:
-                    continue
-                result = json.loads(result_str)
-                matches = result.get("matches", []) or []
-                for m in matches:
-                    meta = m.get("meta", {})
-                    tid = meta.get("job_id")
-                    if tid:
-                        matched_lost_ids.add(tid)
+                matched_lost_ids |= results.referenced_ids([record])
         except Exception:
             matched_lost_ids = set()
-        with open(meta_path, "rb") as f:
-            metadata = pickle.load(f)
-        seen = set()
-        for m in metadata:
-            if not isinstance(m, dict):
-                continue
-            if m.get("type") != "lost_report":
-                continue
-            job_id = m.get("job_id")
-            if job_id in seen:
-                continue
-            seen.add(job_id)
-            job_info_str = r.get(f"job:{job_id}") if job_id else None
+        reports = await run_in_threadpool(index_client.list_reports, "lost_report")
+        lost_rows = {m["job_id"]: m for m in reports if m.get("job_id")}
+        reconcile = ar.pipeline(transaction=False)
+        reconciled = False
+        for job_id, job_info_str, result in await _fetch_jobs(lost_rows.keys()):
+            m = lost_rows[job_id]
             if not job_info_str:
                 # Skip entries that have been removed from Redis
                 continue
             job_info = json.loads(job_info_str) if job_info_str else {}
             image_url = job_info.get("image_url")
-            result_str = r.get(f"result:{job_id}") if job_id else None
             status = "pending"
             message = "Processing..."
             matches = []
-            if result_str:
-                result = json.loads(result_str)
-                status = result.get("status", status)
-                message = result.get("message", message)
-                matches = result.get("matches", [])
+            if result:
+                status = result["status"]
+                message = result["message"]
+                matches = result["matches"]
             # Reconcile: if this lost job_id appears in admin_found matches, mark matched
-            if job_id and job_id in matched_lost_ids:
+            if job_id in matched_lost_ids:
+                changed = status != "matched" or message != "Matched with an admin reported item."
                 status = "matched"
                 message = "Matched with an admin reported item."
-                try:
-                    # Update Redis result for user dashboard visibility
-                    reconciled_result = {
-                        "status": "matched",
-                        "matches": matches or [],
-                        "message": message,
-                    }
-                    r.set(f"result:{job_id}", json.dumps(reconciled_result))
-                    r.expire(f"result:{job_id}", 60*60*24*30)
-                    job_info_str2 = r.get(f"job:{job_id}")
-                    if job_info_str2:
-                        job_info2 = json.loads(job_info_str2)
-                        job_info2["status"] = "matched"
-                        job_info2["message"] = message
-                        r.set(f"job:{job_id}", json.dumps(job_info2))
-                        r.expire(f"job:{job_id}", 60*60*24*30)
-                except Exception:
-                    pass
+                # Update Redis result for user dashboard visibility; skip when
+                # already reconciled so the job's ETag stays valid
+                if changed:
+                    results.write(reconcile, job_id, "matched", matches, message)
+                    job_info["status"] = "matched"
+                    job_info["message"] = message
+                    reconcile.set(f"job:{job_id}", json.dumps(job_info), ex=60*60*24*30)
+                    versions.bump_job(reconcile, job_id, job_info)
+                    reconciled = True
             metas.append({
                 "job_id": job_id,
                 "itemName": m.get("itemName"),
@@ -310,23 +567,153 @@ async def admin_list_lost_items_faiss():
                 "user_id": m.get("user_id"),
                 "user_name": m.get("user_name"),
             })
+        if reconciled:
+            try:
+                await reconcile.execute()
+            except Exception:
+                pass
         metas.sort(key=lambda x: x.get("timestamp", 0) or 0, reverse=True)
         return {"lost_items": metas}
     except Exception as e:
         print(f"Error in /admin/lost-items-faiss: {e}")
         raise HTTPException(status_code=500, detail=f"Error: {e}")
 
- 
+@router.post("/search")
+async def search_by_photo(
+    file: UploadFile = File(...),
+    location: Optional[str] = Form(None),
+    limit: int = Form(5),
+    include_archive: bool = Form(False)
+):
+    """
+    Read-only "was anything like this found?" lookup. Embeds the photo with a single
+    forward pass and returns matching found reports; nothing is queued or stored.
+    """
+    if not photo_search.SEARCH_ENABLED:
+        raise HTTPException(status_code=404, detail="Search is disabled")
+    try:
+        image_bytes = await read_upload(file)
+    except InvalidImageType as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    # Fail fast rather than queue behind a burst of searches
+    try:
+        await asyncio.wait_for(_search_slots.acquire(), timeout=photo_search.SEARCH_QUEUE_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Search is busy. Please try again.", headers={"Retry-After": "1"})
+    try:
+        started = time.perf_counter()
+        matches = await run_in_threadpool(
+            photo_search.search_by_photo, image_bytes, location, max(1, min(limit, 20)), include_archive
+        )
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        photo_search.latency.record(elapsed_ms)
+        return {
+            "status": "matched" if matches else "no_match",
+            "matches": matches,
+            "latency_ms": round(elapsed_ms, 1),
+        }
+    except Exception as e:
+        print(f"Error in /search: {e}")
+        raise HTTPException(status_code=500, detail=f"Error: {e}")
+    finally:
+        _search_slots.release()
+
+@router.get("/search/stats")
+async def search_stats():
+    return {**photo_search.latency.snapshot(), "max_concurrency": photo_search.SEARCH_MAX_CONCURRENCY}
+
+@router.get("/admin/profiling")
+async def get_profiling():
+    """Active profiling settings and the most recent traces on this API host."""
+    raw = await ar.hgetall(profiling.PROFILE_CONFIG_KEY)
+    return {
+        "config": profiling.parse_config(raw or {}),
+        "override": bool(raw),
+        "expires_in_s": await ar.ttl(profiling.PROFILE_CONFIG_KEY) if raw else None,
+        "traces": await run_in_threadpool(profiling.recent_traces),
+    }
+
+@router.post("/admin/profiling")
+async def set_profiling(
+    sample_rate: float = Form(...),
+    mode: str = Form("cprofile"),
+    duration_s: int = Form(600)
+):
+    """
+    Sample this fraction of worker jobs and search requests for profiling, for
+    duration_s seconds. sample_rate=0 clears the override.
+    """
+    if mode not in profiling.PROFILE_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(profiling.PROFILE_MODES)}")
+    if not 0 <= sample_rate <= 1:
+        raise HTTPException(status_code=400, detail="sample_rate must be between 0 and 1")
+    if sample_rate == 0:
+        await ar.delete(profiling.PROFILE_CONFIG_KEY)
+        return {"config": profiling.parse_config({}), "override": False}
+    duration_s = max(1, min(duration_s, 24 * 3600))
+    pipe = ar.pipeline(transaction=True)
+    pipe.delete(profiling.PROFILE_CONFIG_KEY)
+    pipe.hset(profiling.PROFILE_CONFIG_KEY, mapping={"sample_rate": sample_rate, "mode": mode})
+    pipe.expire(profiling.PROFILE_CONFIG_KEY, duration_s)
+    await pipe.execute()
+    return {"config": profiling.parse_config({"sample_rate": sample_rate, "mode": mode}), "override": True, "expires_in_s": duration_s}
+
+@router.get("/queue/stats")
+async def get_queue_stats():
+    """Per-lane queue depth and lag (age of the oldest unfinished job)."""
+    try:
+        return {"lanes": await queue_stats_async()}
+    except Exception as e:
+        print(f"Error in /queue/stats: {e}")
+        raise HTTPException(status_code=500, detail=f"Error: {e}")
+
+@router.get("/images/{job_id}/thumb")
+async def get_thumbnail(job_id: str):
+    """
+    Fixed-size thumbnail of a report's photo. A job's image never changes, so
+    it is cacheable for a year; FileResponse answers Range requests itself.
+    """
+    if not _JOB_ID_RE.match(job_id):
+        raise HTTPException(status_code=404, detail="Image not found")
+    try:
+        found = await run_in_threadpool(thumbnails.thumbnail_for, job_id)
+    except Exception as e:
+        print(f"Error in /images/{job_id}/thumb: {e}")
+        found = None
+    if not found:
+        raise HTTPException(status_code=404, detail="Image not found")
+    path, media_type = found
+    return FileResponse(path, media_type=media_type, headers={"Cache-Control": "public, max-age=31536000, immutable"})
 
 @router.get("/results/{job_id}")
-async def get_result(job_id: str):
-    result = r.get(f"result:{job_id}")
-    if not result:
+async def get_result(job_id: str, response: Response, if_none_match: Optional[str] = Header(None)):
+    cached = await _conditional([versions.job_scope(job_id)], if_none_match, response)
+    if cached:
+        return cached
+    record = results.decode(await arb.get(f"result:{job_id}"))
+    if not record:
         return {"status": "pending", "message": "Result not yet ready, check back soon."}
-    return json.loads(result)
+    return results.expand(record, await _match_metas([record], {}))
+
+def _merge_result(job_info: dict, result):
+    if result:
+        job_info["status"] = result["status"]
+        job_info["matches"] = result["matches"]
+        msg = result["message"]
+        if job_info["status"] != "matched" and msg.lower().startswith("matched"):
+            msg = "No match found; complaint has been added."
+        job_info["message"] = msg
+    else:
+        job_info["status"] = "pending"
+        job_info["matches"] = []
+        job_info["message"] = "Processing..."
+    return job_info
 
 @router.get("/user/complaints")
-async def get_user_complaints(authorization: Optional[str] = Header(None), userId: Optional[str] = None):
+async def get_user_complaints(response: Response, authorization: Optional[str] = Header(None), userId: Optional[str] = None,
+                              if_none_match: Optional[str] = Header(None)):
     """
     Get all complaints for the current user.
     Returns list of complaints with their status from FAISS processing.
@@ -336,29 +723,15 @@ async def get_user_complaints(authorization: Optional[str] = Header(None), userI
         complaints = []
         if not user_id:
             return {"complaints": complaints}
-        job_ids = r.smembers(f"user:jobs:{user_id}")
+        cached = await _conditional([f"user:jobs:{user_id}"], if_none_match, response)
+        if cached:
+            return cached
+        job_ids = await ar.smembers(f"user:jobs:{user_id}")
         
-        for job_id in job_ids:
-            job_info_str = r.get(f"job:{job_id}")
+        for job_id, job_info_str, result in await _fetch_jobs(job_ids):
             if job_info_str:
                 job_info = json.loads(job_info_str)
-                
-                # Get result status from Redis
-                result_str = r.get(f"result:{job_id}")
-                if result_str:
-                    result = json.loads(result_str)
-                    job_info["status"] = result.get("status", "pending")
-                    job_info["matches"] = result.get("matches", [])
-                    msg = result.get("message", "")
-                    if job_info["status"] != "matched" and msg.lower().startswith("matched"):
-                        msg = "No match found; complaint has been added."
-                    job_info["message"] = msg
-                else:
-                    job_info["status"] = "pending"
-                    job_info["matches"] = []
-                    job_info["message"] = "Processing..."
-                
-                complaints.append(job_info)
+                complaints.append(_merge_result(job_info, result))
         
         # Sort by timestamp (newest first)
         complaints.sort(key=lambda x: x.get("timestamp", 0), reverse=True)
@@ -369,43 +742,51 @@ async def get_user_complaints(authorization: Optional[str] = Header(None), userI
         raise HTTPException(status_code=500, detail=f"Error: {e}")
 
 @router.get("/user/complaints/{job_id}")
-async def get_complaint_by_id(job_id: str):
+async def get_complaint_by_id(job_id: str, response: Response, if_none_match: Optional[str] = Header(None)):
     """Get a specific complaint by job_id"""
     try:
-        job_info_str = r.get(f"job:{job_id}")
+        cached = await _conditional([versions.job_scope(job_id)], if_none_match, response)
+        if cached:
+            return cached
+        entries = await _fetch_jobs([job_id])
+        _, job_info_str, result = entries[0]
         if not job_info_str:
             raise HTTPException(status_code=404, detail="Complaint not found")
         
         job_info = json.loads(job_info_str)
-        
-        # Get result status
-        result_str = r.get(f"result:{job_id}")
-        if result_str:
-            result = json.loads(result_str)
-            job_info["status"] = result.get("status", "pending")
-            job_info["matches"] = result.get("matches", [])
-            msg = result.get("message", "")
-            if job_info["status"] != "matched" and msg.lower().startswith("matched"):
-                msg = "No match found; complaint has been added."
-            job_info["message"] = msg
-        else:
-            job_info["status"] = "pending"
-            job_info["matches"] = []
-            job_info["message"] = "Processing..."
-        
-        return job_info
+        return _merge_result(job_info, result)
     except HTTPException:
         raise
     except Exception as e:
         print(f"Error in /user/complaints/{job_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Error: {e}")
 
+async def _remove_match_references(job_id: str, set_names):
+    # Drop matches pointing at a deleted job from every result in the given sets
+    ids = set()
+    for s in set_names:
+        ids |= await ar.smembers(s) or set()
+    pipe = ar.pipeline(transaction=False)
+    changed_any = False
+    for tid, ji, record in await _fetch_jobs(ids, hydrate=False):
+        if not record:
+            continue
+        owner = json.loads(ji) if ji else {}
+        data = results.without(record, {job_id}, owner.get("type"))
+        if len(data["refs"]) == len(record["refs"]):
+            continue
+        versions.bump_job(pipe, tid, owner)
+        pipe.set(f"result:{tid}", results.encode(data), ex=results.RESULT_TTL_S)
+        changed_any = True
+    if changed_any:
+        await pipe.execute()
+
 @router.delete("/user/complaints/{job_id}")
 async def delete_user_complaint(job_id: str, authorization: Optional[str] = Header(None), userId: Optional[str] = None):
     try:
         user_id = _get_user_id_from_auth(authorization) or userId
 
-        job_info_str = r.get(f"job:{job_id}")
+        job_info_str = await ar.get(f"job:{job_id}")
         if not job_info_str:
             raise HTTPException(status_code=404, detail="Complaint not found")
         job_info = json.loads(job_info_str)
@@ -414,59 +795,26 @@ async def delete_user_complaint(job_id: str, authorization: Optional[str] = Head
         if user_id and job_info.get("user_id") and job_info.get("user_id") != user_id:
             raise HTTPException(status_code=403, detail="Not authorized to delete this complaint")
 
-        # Remove job data and result
-        r.delete(f"job:{job_id}")
-        r.delete(f"result:{job_id}")
-
-        
-
-        # Remove from user set if we know user_id
+        # Remove job data and result, and drop it from the user and global sets
+        pipe = ar.pipeline(transaction=False)
+        pipe.delete(f"job:{job_id}", f"result:{job_id}")
         uid = job_info.get("user_id") or user_id
         if uid:
-            r.srem(f"user:jobs:{uid}", job_id)
-
-        # Also remove from global set if present
-        r.srem("jobs:all", job_id)
-        r.srem("jobs:lost_all", job_id)
+            pipe.srem(f"user:jobs:{uid}", job_id)
+        pipe.srem("jobs:all", job_id)
+        pipe.srem("jobs:lost_all", job_id)
+        versions.bump(pipe, versions.collections({**job_info, "user_id": uid}))
+        versions.forget_job(pipe, job_id)
+        await pipe.execute()
+        await run_in_threadpool(delete_job_images, job_id)
 
         try:
-            db = FaissImageDB(dim=2048)
-            db.load("faiss.index", "metadata.pkl")
-            changed = db.purge_by_job_id(job_id)
-            if not changed:
-                changed = db.remove_by_job_id(job_id)
-            if changed:
-                db.save("faiss.index", "metadata.pkl")
-                r.set("faiss:reload", "1")
+            await run_in_threadpool(index_client.delete, job_id)
         except Exception:
             pass
 
         try:
-            ids = r.smembers("jobs:all") or []
-            for fid in ids:
-                res = r.get(f"result:{fid}")
-                if not res:
-                    continue
-                data = json.loads(res)
-                matches = data.get("matches") or []
-                filtered = []
-                for m in matches:
-                    meta = m.get("meta") or {}
-                    if meta.get("job_id") != job_id:
-                        filtered.append(m)
-                if len(filtered) != len(matches):
-                    data["matches"] = filtered
-                    if not filtered and data.get("status") == "matched":
-                        data["status"] = "no_match"
-                        ji = r.get(f"job:{fid}")
-                        if ji:
-                            j = json.loads(ji)
-                            if j.get("type") == "admin_found":
-                                data["message"] = "No match found; found item has been added to the database."
-                            else:
-                                data["message"] = "No match found; complaint has been added."
-                    r.set(f"result:{fid}", json.dumps(data))
-                    r.expire(f"result:{fid}", 60*60*24*30)
+            await _remove_match_references(job_id, ["jobs:all"])
         except Exception:
             pass
 
@@ -484,63 +832,28 @@ async def delete_user_complaint_post(job_id: str, authorization: Optional[str] =
 @router.delete("/admin/found/{job_id}")
 async def delete_admin_found(job_id: str):
     try:
-        job_info_str = r.get(f"job:{job_id}")
+        job_info_str = await ar.get(f"job:{job_id}")
         if not job_info_str:
             raise HTTPException(status_code=404, detail="Found item not found")
         job_info = json.loads(job_info_str)
         if job_info.get("type") != "admin_found":
             raise HTTPException(status_code=400, detail="Not an admin found item")
 
-        r.delete(f"job:{job_id}")
-        r.delete(f"result:{job_id}")
-
-        
-
-        r.srem("jobs:all", job_id)
+        pipe = ar.pipeline(transaction=False)
+        pipe.delete(f"job:{job_id}", f"result:{job_id}")
+        pipe.srem("jobs:all", job_id)
+        versions.bump(pipe, versions.collections(job_info))
+        versions.forget_job(pipe, job_id)
+        await pipe.execute()
+        await run_in_threadpool(delete_job_images, job_id)
 
         try:
-            db = FaissImageDB(dim=2048)
-            db.load("faiss.index", "metadata.pkl")
-            changed = db.purge_by_job_id(job_id)
-            if not changed:
-                changed = db.remove_by_job_id(job_id)
-            if changed:
-                db.save("faiss.index", "metadata.pkl")
-                r.set("faiss:reload", "1")
+            await run_in_threadpool(index_client.delete, job_id)
         except Exception:
             pass
 
         try:
-            sets = ["jobs:all", "jobs:lost_all"]
-            for s in sets:
-                ids = r.smembers(s) or []
-                for tid in ids:
-                    res = r.get(f"result:{tid}")
-                    if not res:
-                        continue
-                    data = json.loads(res)
-                    matches = data.get("matches") or []
-                    filtered = []
-                    changed_any = False
-                    for m in matches:
-                        meta = m.get("meta") or {}
-                        if meta.get("job_id") != job_id:
-                            filtered.append(m)
-                        else:
-                            changed_any = True
-                    if changed_any:
-                        data["matches"] = filtered
-                        if not filtered and data.get("status") == "matched":
-                            data["status"] = "no_match"
-                            ji = r.get(f"job:{tid}")
-                            if ji:
-                                j = json.loads(ji)
-                                if j.get("type") == "admin_found":
-                                    data["message"] = "No match found; found item has been added to the database."
-                                else:
-                                    data["message"] = "No match found; complaint has been added."
-                        r.set(f"result:{tid}", json.dumps(data))
-                        r.expire(f"result:{tid}", 60*60*24*30)
+            await _remove_match_references(job_id, ["jobs:all", "jobs:lost_all"])
         except Exception:
             pass
 
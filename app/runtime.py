@@ -0,0 +1,229 @@
+import os
+import sys
+import json
+import math
+import time
+import argparse
+
+# CPU threading for torch, OpenMP (FAISS) and BLAS, sized to the CPUs this
+# process may actually use rather than the host's core count. Inside a
+# container with a cgroup quota of 2 CPUs on a 32-core host, the libraries
+# would otherwise each start 32 threads and thrash.
+#
+# Every entry point calls configure(role) before importing numpy, torch or
+# faiss, because OMP_NUM_THREADS / MKL_NUM_THREADS are only read when those
+# libraries load. Roles:
+#   api      serves requests; torch only for /search, kept small so request
+#            handling keeps a core (SEARCH_TORCH_THREADS, default 2)
+#   worker   ResNet embedding is the whole job: all CPUs to torch
+#   index    FAISS search: all CPUs to OpenMP, no torch
+#
+# Per-role choices can be pinned with RUNTIME_TORCH_THREADS,
+# RUNTIME_TORCH_INTEROP_THREADS and RUNTIME_OMP_THREADS, or measured on this
+# hardware and saved to RUNTIME_THREADS_FILE with:
+#   python -m app.runtime calibrate --role worker
+#   python -m app.runtime show
+RUNTIME_THREADS_FILE = os.getenv("RUNTIME_THREADS_FILE", "runtime_threads.json")
+ROLES = ("api", "worker", "index")
+
+# torch and faiss wheels can each bundle their own OpenMP runtime; loading both
+# into one process aborts unless this is set. Only processes that load both
+# (the worker, and anything running the index in-process) get it.
+ALLOW_DUPLICATE_OPENMP = os.getenv("RUNTIME_ALLOW_DUPLICATE_OPENMP", "1") == "1"
+
+_role = None
+_threads = None
+
+def _cgroup_quota():
+    # cgroup v2: "max 100000" or "<quota> <period>"
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    # cgroup v1
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+def effective_cpus() -> int:
+    """CPUs usable by this process: affinity mask, capped by any cgroup quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_quota()
+    if quota:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return max(1, cpus)
+
+def role_defaults(role: str, cpus: int) -> dict:
+    if role == "api":
+        search = max(1, min(cpus, int(os.getenv("SEARCH_TORCH_THREADS", "2"))))
+        return {"torch_intra": search, "torch_inter": 1, "omp": search}
+    if role == "index":
+        return {"torch_intra": 1, "torch_inter": 1, "omp": cpus}
+    return {"torch_intra": cpus, "torch_inter": 1, "omp": cpus}
+
+def _calibrated(role: str, cpus: int):
+    try:
+        with open(RUNTIME_THREADS_FILE) as f:
+            saved = json.load(f).get(role)
+    except (OSError, ValueError):
+        return None
+    # A calibration only applies to the CPU budget it was measured with
+    if saved and saved.get("cpus") == cpus:
+        return saved.get("threads")
+    return None
+
+def plan(role: str) -> dict:
+    cpus = effective_cpus()
+    threads = role_defaults(role, cpus)
+    threads.update(_calibrated(role, cpus) or {})
+    for key, env in (("torch_intra", "RUNTIME_TORCH_THREADS"), ("torch_inter", "RUNTIME_TORCH_INTEROP_THREADS"), ("omp", "RUNTIME_OMP_THREADS")):
+        if os.getenv(env):
+            threads[key] = max(1, int(os.environ[env]))
+    threads["cpus"] = cpus
+    return threads
+
+def configure(role: str) -> dict:
+    """Set thread pools for this process. Call before numpy/torch/faiss are imported."""
+    global _role, _threads
+    if role not in ROLES:
+        raise ValueError(f"Unknown runtime role: {role}")
+    _role = role
+    _threads = plan(role)
+    omp = str(_threads["omp"])
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS"):
+        os.environ.setdefault(var, omp)
+    in_process_index = os.getenv("INDEX_SERVICE_URL") == "local"
+    if ALLOW_DUPLICATE_OPENMP and (role == "worker" or in_process_index):
+        os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
+    # Libraries already imported (e.g. configure called late) are set directly
+    if "torch" in sys.modules:
+        apply_torch()
+    if "faiss" in sys.modules:
+        apply_faiss()
+    return _threads
+
+def threads() -> dict:
+    return _threads or plan(_role or "worker")
+
+def apply_torch():
+    """Called right after torch is imported."""
+    import torch
+    t = threads()
+    torch.set_num_threads(t["torch_intra"])
+    try:
+        torch.set_num_interop_threads(t["torch_inter"])
+    except RuntimeError:
+        # Only settable before the first parallel op; keep whatever is in place
+        pass
+
+def apply_faiss():
+    """Called right after faiss is imported."""
+    import faiss
+    faiss.omp_set_num_threads(threads()["omp"])
+
+# -- calibration ------------------------------------------------------------
+
+def _candidates(cpus: int) -> list:
+    values = sorted({1, 2, 4, 8, 16, 32, cpus})
+    return [v for v in values if v <= cpus]
+
+def _time_it(fn, repeats: int) -> float:
+    fn()  # warm-up
+    started = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - started) * 1000.0 / repeats
+
+def calibrate_torch(cpus: int, repeats: int) -> list:
+    import torch
+    from app.benchmark import synthetic_image, encode_jpeg
+    from app.embedding import get_image_embeddings_variants_from_bytes, get_image_embedding_single_from_bytes
+    image = encode_jpeg(synthetic_image(0))
+    results = []
+    for intra in _candidates(cpus):
+        torch.set_num_threads(intra)
+        results.append({
+            "threads": {"torch_intra": intra, "omp": intra},
+            "embed_8_ms": _time_it(lambda: get_image_embeddings_variants_from_bytes(image), repeats),
+            "embed_1_ms": _time_it(lambda: get_image_embedding_single_from_bytes(image), repeats),
+        })
+    return results
+
+def calibrate_faiss(cpus: int, repeats: int, rows: int) -> list:
+    import faiss
+    from app.faiss_db import FaissImageDB
+    from app.benchmark import random_unit_vectors, synthetic_metas
+    db = FaissImageDB(dim=2048)
+    db.add_rows(random_unit_vectors(rows, 2048), synthetic_metas(rows))
+    queries = random_unit_vectors(8, 2048, seed=1)
+    results = []
+    for omp in _candidates(cpus):
+        faiss.omp_set_num_threads(omp)
+        results.append({
+            "threads": {"omp": omp},
+            "search_8_ms": _time_it(lambda: db.query_batch(queries, "found_report", k=5), repeats),
+        })
+    return results
+
+def calibrate(role: str, repeats: int = 5, rows: int = 50000) -> dict:
+    cpus = effective_cpus()
+    if role == "index":
+        results = calibrate_faiss(cpus, repeats, rows)
+        key = "search_8_ms"
+    else:
+        results = calibrate_torch(cpus, repeats)
+        # The API embeds one view per search; the worker embeds eight per job
+        key = "embed_1_ms" if role == "api" else "embed_8_ms"
+    best = min(results, key=lambda r: r[key])
+    threads = dict(role_defaults(role, cpus))
+    threads.update(best["threads"])
+    return {"cpus": cpus, "threads": threads, "metric": key, "best_ms": best[key], "results": results}
+
+def save_calibration(role: str, result: dict):
+    try:
+        with open(RUNTIME_THREADS_FILE) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        saved = {}
+    saved[role] = {"cpus": result["cpus"], "threads": result["threads"], "best_ms": result["best_ms"], "calibrated_at": time.time()}
+    with open(RUNTIME_THREADS_FILE, "w") as f:
+        json.dump(saved, f, indent=2)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CPU thread settings per role")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_cal = sub.add_parser("calibrate", help="time each thread count on this machine and save the fastest")
+    p_cal.add_argument("--role", choices=ROLES, required=True)
+    p_cal.add_argument("--repeats", type=int, default=5)
+    p_cal.add_argument("--rows", type=int, default=50000, help="index size for --role index")
+    p_cal.add_argument("--dry-run", action="store_true", help="print results without saving")
+    sub.add_parser("show", help="effective CPUs and the thread plan for every role")
+    args = parser.parse_args(argv)
+
+    if args.command == "show":
+        print(json.dumps({"effective_cpus": effective_cpus(), "cgroup_quota": _cgroup_quota(),
+                          "roles": {role: plan(role) for role in ROLES}}, indent=2))
+        return 0
+    configure(args.role)
+    result = calibrate(args.role, repeats=args.repeats, rows=args.rows)
+    print(json.dumps(result, indent=2))
+    if not args.dry_run:
+        save_calibration(args.role, result)
+        print(f"Saved {args.role} thread settings to {RUNTIME_THREADS_FILE}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
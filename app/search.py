@@ -0,0 +1,91 @@
+import os
+import threading
+from collections import deque
+from app import index_client
+from app import metrics
+from app import profiling
+from app.results import HIGH_CONFIDENCE, MEDIUM_CONFIDENCE
+from uuid import uuid4
+
+# Interactive "search by photo": one upright forward pass on a model kept warm in
+# the API process, then a read-only query against found reports. Nothing is
+# queued or stored. A semaphore caps concurrent searches so they can't take over
+# the CPU the worker needs.
+SEARCH_ENABLED = os.getenv("SEARCH_ENABLED", "1") == "1"
+SEARCH_MAX_CONCURRENCY = int(os.getenv("SEARCH_MAX_CONCURRENCY", "2"))
+SEARCH_QUEUE_TIMEOUT_S = float(os.getenv("SEARCH_QUEUE_TIMEOUT_S", "2"))
+SEARCH_P95_TARGET_MS = float(os.getenv("SEARCH_P95_TARGET_MS", "500"))
+# Same tiers the worker stores, so a search never disagrees with a match result
+SEARCH_MIN_SCORE = MEDIUM_CONFIDENCE
+
+_embed = None
+_embed_lock = threading.Lock()
+
+def _embedder():
+    # Importing app.embedding loads ResNet50, so do it once and keep it
+    global _embed
+    if _embed is None:
+        with _embed_lock:
+            if _embed is None:
+                from app.embedding import get_image_embedding_single_from_bytes
+                _embed = get_image_embedding_single_from_bytes
+    return _embed
+
+def warm_up():
+    # Load the model and run one forward pass so the first search isn't cold
+    from io import BytesIO
+    from PIL import Image
+    buf = BytesIO()
+    Image.new("RGB", (224, 224), (128, 128, 128)).save(buf, format="PNG")
+    _embedder()(buf.getvalue())
+
+class LatencyTracker:
+    # Rolling window of recent latencies for p50/p95 reporting
+    def __init__(self, size: int = 1000):
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+        self.over_target = 0
+        self.count = 0
+
+    def record(self, ms: float):
+        with self.lock:
+            self.samples.append(ms)
+            self.count += 1
+            if ms > SEARCH_P95_TARGET_MS:
+                self.over_target += 1
+
+    def percentile(self, p: float):
+        with self.lock:
+            if not self.samples:
+                return None
+            ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+        return ordered[idx]
+
+    def snapshot(self) -> dict:
+        p95 = self.percentile(95)
+        return {
+            "count": self.count,
+            "p50_ms": self.percentile(50),
+            "p95_ms": p95,
+            "p95_target_ms": SEARCH_P95_TARGET_MS,
+            "within_target": p95 is None or p95 <= SEARCH_P95_TARGET_MS,
+            "over_target": self.over_target,
+        }
+
+latency = LatencyTracker()
+
+def search_by_photo(image_bytes, location=None, limit: int = 5, include_archive: bool = False) -> list:
+    with metrics.span("search_embed"), profiling.maybe_profile("search-embed", uuid4().hex[:12]):
+        embedding = _embedder()(image_bytes)
+    with metrics.span("search_query"):
+        matches = index_client.search(
+            [embedding], "found_report", k=max(limit * 8, 10), query_location=location, include_archive=include_archive,
+            # Nothing is stored, so a result from the healthy shards beats an error
+            partial_ok=True,
+        )
+    matches = [m for m in matches if m["score"] >= SEARCH_MIN_SCORE]
+    matches.sort(key=lambda m: m["score"], reverse=True)
+    for m in matches:
+        m["confidence"] = "high" if m["score"] >= HIGH_CONFIDENCE else "medium"
+    return matches[:limit]
@@ -0,0 +1,159 @@
+import os
+from uuid import uuid4
+
+# Uploaded images are written to a directory shared by the API and the worker
+# (the same way faiss.index/metadata.pkl are shared), and jobs carry the path.
+# Both processes must therefore see the same UPLOAD_DIR: one host, or a volume
+# mounted at the same path in each container.
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+}
+
+class UploadTooLarge(Exception):
+    pass
+
+class InvalidImageType(Exception):
+    pass
+
+def sniff_image_type(head: bytes):
+    # Trust the magic bytes, not the client-supplied Content-Type
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    return None
+
+def image_path_for(job_id: str, ext: str) -> str:
+    return os.path.join(UPLOAD_DIR, f"{job_id}{ext}")
+
+def find_image(job_id: str):
+    for ext in _EXTENSIONS.values():
+        path = image_path_for(job_id, ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+# Dashboard thumbnails live next to the originals, one per job, written by the
+# worker (app/thumbnails.py) and served by GET /images/{job_id}/thumb
+THUMB_TYPES = {
+    ".webp": "image/webp",
+    ".jpg": "image/jpeg",
+}
+
+def thumbnail_dir() -> str:
+    return os.path.join(UPLOAD_DIR, "thumbs")
+
+def thumbnail_path_for(job_id: str, ext: str) -> str:
+    return os.path.join(thumbnail_dir(), f"{job_id}{ext}")
+
+def thumbnail_url(job_id: str) -> str:
+    # Server-relative, including the /api prefix the router is mounted under (main.py)
+    return f"/api/images/{job_id}/thumb"
+
+def find_thumbnail(job_id: str):
+    # (path, media type) of the job's thumbnail, or None
+    for ext, media_type in THUMB_TYPES.items():
+        path = thumbnail_path_for(job_id, ext)
+        if os.path.exists(path):
+            return path, media_type
+    return None
+
+class _UploadWriter:
+    # Writes chunks to a temp file, sniffing the type from the first bytes and
+    # aborting as soon as the size cap is passed, then renames into place.
+    def __init__(self, job_id: str, max_bytes: int):
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        self.job_id = job_id
+        self.max_bytes = max_bytes
+        self.tmp = os.path.join(UPLOAD_DIR, f"{job_id}.{uuid4().hex}.part")
+        self.out = open(self.tmp, "wb")
+        self.written = 0
+        self.head = b""
+        self.content_type = None
+
+    def write(self, chunk: bytes):
+        if self.content_type is None:
+            self.head += chunk[:8]
+            if len(self.head) >= 8:
+                self.content_type = sniff_image_type(self.head)
+                if self.content_type is None:
+                    raise InvalidImageType("Invalid image type. Use JPEG or PNG.")
+        self.written += len(chunk)
+        if self.written > self.max_bytes:
+            raise UploadTooLarge(f"Image too large (max {self.max_bytes // (1024 * 1024)}MB)")
+        self.out.write(chunk)
+
+    def commit(self) -> str:
+        self.out.close()
+        if self.content_type is None:
+            raise InvalidImageType("Invalid image type. Use JPEG or PNG.")
+        path = image_path_for(self.job_id, _EXTENSIONS[self.content_type])
+        os.replace(self.tmp, path)
+        return path
+
+    def abort(self):
+        self.out.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+def save_stream(src, job_id: str, max_bytes: int = MAX_UPLOAD_BYTES) -> str:
+    # Copy a readable binary file object to storage chunk by chunk; only one
+    # chunk is ever in memory and oversize uploads are never fully read.
+    writer = _UploadWriter(job_id, max_bytes)
+    try:
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            writer.write(chunk)
+        return writer.commit()
+    except BaseException:
+        writer.abort()
+        raise
+
+async def save_upload(upload, job_id: str, max_bytes: int = MAX_UPLOAD_BYTES) -> str:
+    # Same as save_stream for a FastAPI UploadFile. The multipart parser has
+    # already spooled the body, so the copy, the rename and any cleanup are all
+    # file I/O; run them off the event loop in one threadpool hop.
+    from starlette.concurrency import run_in_threadpool
+    return await run_in_threadpool(save_stream, upload.file, job_id, max_bytes)
+
+async def read_upload(upload, max_bytes: int = MAX_UPLOAD_BYTES) -> bytearray:
+    # For uploads that are used once and not stored: read into a single buffer
+    # with the same early size cap and magic-byte check
+    buf = bytearray()
+    while True:
+        chunk = await upload.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        buf += chunk
+        if len(buf) > max_bytes:
+            raise UploadTooLarge(f"Image too large (max {max_bytes // (1024 * 1024)}MB)")
+        if len(buf) == len(chunk) and len(buf) >= 8 and sniff_image_type(bytes(buf[:8])) is None:
+            # Refuse non-images after the first chunk instead of reading the rest
+            raise InvalidImageType("Invalid image type. Use JPEG or PNG.")
+    if sniff_image_type(bytes(buf[:8])) is None:
+        raise InvalidImageType("Invalid image type. Use JPEG or PNG.")
+    return buf
+
+def read_image(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+def delete_image(path: str):
+    try:
+        if path and os.path.exists(path):
+            os.remove(path)
+    except OSError:
+        pass
+
+def delete_job_images(job_id: str):
+    for ext in _EXTENSIONS.values():
+        delete_image(image_path_for(job_id, ext))
+    for ext in THUMB_TYPES:
+        delete_image(thumbnail_path_for(job_id, ext))
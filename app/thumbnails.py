@@ -0,0 +1,54 @@
+import os
+from io import BytesIO
+from uuid import uuid4
+from PIL import Image, ImageOps, features
+from app import storage
+
+# Fixed-size thumbnails for the dashboards, so listings never pull the
+# full-size upload (up to 10 MB). The worker makes one per job while it has the
+# image bytes in hand; GET /images/{job_id}/thumb serves it with long-lived
+# cache headers and falls back to making one for jobs uploaded before this.
+THUMB_SIZE = int(os.getenv("THUMB_SIZE", "320"))
+# "webp" (smaller) or "jpeg"; webp falls back to jpeg if Pillow lacks libwebp
+THUMB_FORMAT = os.getenv("THUMB_FORMAT", "webp")
+THUMB_QUALITY = int(os.getenv("THUMB_QUALITY", "80"))
+
+def _output_format():
+    if THUMB_FORMAT == "webp" and features.check("webp"):
+        return "WEBP", ".webp"
+    return "JPEG", ".jpg"
+
+def render(image_bytes: bytes, size: int = THUMB_SIZE):
+    """(thumbnail bytes, file extension) for an uploaded JPEG/PNG."""
+    img = Image.open(BytesIO(image_bytes))
+    # JPEGs are decoded at 1/2, 1/4 or 1/8 scale when that still covers the
+    # target, so a 12 MP photo is never decoded at full size
+    img.draft("RGB", (size, size))
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    img.thumbnail((size, size), Image.LANCZOS)
+    fmt, ext = _output_format()
+    buf = BytesIO()
+    img.save(buf, fmt, quality=THUMB_QUALITY)
+    return buf.getvalue(), ext
+
+def make_thumbnail(job_id: str, image_bytes: bytes) -> str:
+    data, ext = render(image_bytes)
+    os.makedirs(storage.thumbnail_dir(), exist_ok=True)
+    path = storage.thumbnail_path_for(job_id, ext)
+    # Written aside and renamed, so the endpoint never serves a partial file
+    tmp = f"{path}.{uuid4().hex}.part"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return path
+
+def thumbnail_for(job_id: str):
+    """(path, media type) of the job's thumbnail, made from the original if missing."""
+    found = storage.find_thumbnail(job_id)
+    if found:
+        return found
+    original = storage.find_image(job_id)
+    if not original:
+        return None
+    make_thumbnail(job_id, storage.read_image(original))
+    return storage.find_thumbnail(job_id)
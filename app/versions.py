@@ -0,0 +1,81 @@
+import time
+import hashlib
+from email.utils import formatdate
+
+# Version counters behind the ETags on the result and listing endpoints. One
+# Redis hash holds a counter and a last-changed time per scope:
+#
+#   job:{job_id}          the job's record or result changed
+#   jobs:lost_all         a lost complaint was added, processed or deleted
+#   jobs:all              the same for found items
+#   user:jobs:{user_id}   the same for one user's complaints
+#   epoch                 bulk maintenance (clean_redis --apply) touched anything
+#
+# Whatever writes a job record or result (uploads, the worker, delete handlers)
+# bumps the job and the collections it is listed in, in the same pipeline as
+# the write. A conditional GET then costs one HMGET instead of reading and
+# hydrating every job in the listing. Delete handlers drop a job's fields;
+# those of jobs that expired by TTL are pruned by clean_redis (stale_versions).
+VERSIONS_KEY = "versions"
+EPOCH = "epoch"
+# Part of every ETag, so a listing is rebuilt at least this often and jobs
+# dropped by their 30-day TTL (which bump nothing) eventually disappear
+VERSION_MAX_AGE_S = 3600
+
+def job_scope(job_id: str) -> str:
+    return f"job:{job_id}"
+
+def collections(job_info: dict) -> list:
+    # The listing sets a job is a member of, as created by the upload routes
+    if job_info.get("type") == "user_complaint":
+        names = ["jobs:lost_all"]
+        if job_info.get("user_id"):
+            names.append(f"user:jobs:{job_info['user_id']}")
+        return names
+    if job_info.get("type") == "admin_found":
+        return ["jobs:all"]
+    return []
+
+def bump(pipe, names):
+    """Queue version bumps on a pipeline (sync or async); the caller executes it."""
+    if not names:
+        return
+    for name in names:
+        pipe.hincrby(VERSIONS_KEY, name, 1)
+    now = time.time()
+    pipe.hset(VERSIONS_KEY, mapping={f"{name}:t": now for name in names})
+
+def bump_job(pipe, job_id: str, job_info: dict):
+    bump(pipe, [job_scope(job_id)] + collections(job_info or {}))
+
+def forget_job(pipe, job_id: str):
+    pipe.hdel(VERSIONS_KEY, job_scope(job_id), f"{job_scope(job_id)}:t")
+
+def job_of_field(field: str):
+    """The job id a job:{id} or job:{id}:t field belongs to, else None."""
+    if not field.startswith("job:"):
+        return None
+    return field[len("job:"):].removesuffix(":t")
+
+def fields(names) -> list:
+    """HMGET fields for tag(): the epoch, then each counter and its timestamp."""
+    return [EPOCH, f"{EPOCH}:t"] + [f for name in names for f in (name, f"{name}:t")]
+
+def tag(names, values, now: float = None):
+    """(ETag, Last-Modified or None) from the HMGET reply for fields(names)."""
+    now = time.time() if now is None else now
+    counters = [v or "0" for v in values[0::2]]
+    stamps = [float(v) for v in values[1::2] if v]
+    seed = "|".join(list(names) + counters + [str(int(now // VERSION_MAX_AGE_S))])
+    etag = 'W/"' + hashlib.sha1(seed.encode("utf-8")).hexdigest()[:20] + '"'
+    modified = formatdate(max(stamps), usegmt=True) if stamps else None
+    return etag, modified
+
+def not_modified(if_none_match, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: a W/ prefix on either side is ignored
+    wanted = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    return etag.removeprefix("W/") in wanted
@@ -44,7 +44,7 @@ const LostItemsTable = ({ searchQuery }: LostItemsTableProps) => {
         dateReported: c.date || new Date(c.timestamp * 1000).toISOString().split('T')[0],
         location: c.location || "",
         status: c.status || "searching",
-        imageUrl: c.job_id ? ((c as any).image_url || fastApiService.getImageUrl(c.job_id)) : undefined,
+        imageUrl: c.job_id ? fastApiService.getImageUrl(c.job_id) : undefined,
       }));
       setItems(mapped);
       mapped.forEach((it) => {
@@ -206,7 +206,7 @@ export const fastApiService = {
     }
   },
   getImageUrl: (jobId: string): string => {
-    return `${FASTAPI_URL}/image/${jobId}`;
+    return `${FASTAPI_URL}/images/${jobId}/thumb`;
   },
 };
 
@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Configuration is read at import time, so point every app module at the
+# in-process Redis stand-in, the fake embedder and throwaway index files first
+_WORKDIR = tempfile.mkdtemp(prefix="lostandfound-tests-")
+os.environ.update(
+    REDIS_BACKEND="memory",
+    EMBEDDER="fake",
+    INDEX_SERVICE_URL="local",
+    UPLOAD_DIR=os.path.join(_WORKDIR, "uploads"),
+    INDEX_PATH=os.path.join(_WORKDIR, "faiss.index"),
+    METADATA_PATH=os.path.join(_WORKDIR, "metadata.pkl"),
+    ARCHIVE_INDEX_PATH=os.path.join(_WORKDIR, "archive.index"),
+    ARCHIVE_METADATA_PATH=os.path.join(_WORKDIR, "archive_metadata.pkl"),
+)
+os.makedirs(os.environ["UPLOAD_DIR"], exist_ok=True)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(autouse=True)
+def redis_store():
+    from app import queue_config
+    queue_config.r.flushall()
+    queue_config._group_ready = False
+    with queue_config._delivered_lock:
+        queue_config._delivered.clear()
+    yield queue_config.r
@@ -0,0 +1,107 @@
+import json
+import asyncio
+
+from app import queue_config as q
+
+
+def _job(job_id, job_type="user_complaint"):
+    return {"job_id": job_id, "type": job_type}
+
+def test_lane_for_job_type():
+    assert q.lane_for_job_type("user_complaint") == q.LANE_INTERACTIVE
+    assert q.lane_for_job_type("admin_found") == q.LANE_BULK
+
+def test_interactive_lane_is_served_first():
+    q.enqueue_job(_job("bulk-1", "admin_found"), q.LANE_BULK)
+    q.enqueue_job(_job("bulk-2", "admin_found"), q.LANE_BULK)
+    q.enqueue_job(_job("user-1"), q.LANE_INTERACTIVE)
+    order = []
+    for _ in range(3):
+        job = q.dequeue_job()
+        order.append(job["job_id"])
+        q.ack_job(job)
+    assert order == ["user-1", "bulk-1", "bulk-2"]
+
+def test_ack_removes_the_message_from_the_backlog():
+    q.enqueue_job(_job("a"))
+    assert q.queue_stats()[q.LANE_INTERACTIVE]["depth"] == 1
+    job = q.dequeue_job()
+    assert job["_stream"] == q.JOB_STREAM and job["_deliveries"] == 1
+    # Pending until acked
+    assert q.queue_stats()[q.LANE_INTERACTIVE]["depth"] == 1
+    q.ack_job(job)
+    assert q.queue_stats()[q.LANE_INTERACTIVE]["depth"] == 0
+
+def test_multi_lane_read_buffers_the_extra_message():
+    q.ensure_job_group()
+    q.enqueue_job(_job("bulk-1", "admin_found"), q.LANE_BULK)
+    q.enqueue_job(_job("user-1"), q.LANE_INTERACTIVE)
+    first = q._read_new({q.JOB_STREAM: ">", q.BULK_JOB_STREAM: ">"})
+    # One message per lane was delivered; the other is kept, not left for idle-claim
+    assert len(q._delivered) == 1
+    second = q.dequeue_job()
+    assert {first["job_id"], second["job_id"]} == {"bulk-1", "user-1"}
+    assert not q._delivered
+
+def test_buffer_is_served_in_lane_order():
+    q._delivered.extend([
+        {"job_id": "bulk", "_stream": q.BULK_JOB_STREAM},
+        {"job_id": "user", "_stream": q.JOB_STREAM},
+    ])
+    assert q._take_delivered()["job_id"] == "user"
+    assert q._take_delivered()["job_id"] == "bulk"
+    assert q._take_delivered() is None
+
+def test_unparseable_payload_comes_back_without_a_job_id(redis_store):
+    q.ensure_job_group()
+    redis_store.xadd(q.JOB_STREAM, {"data": "not json"})
+    job = q.dequeue_job()
+    assert job["job_id"] is None and job["raw"] == {"data": "not json"}
+
+def test_dead_letter_parks_the_job_and_drops_it_from_the_lane(redis_store):
+    q.enqueue_job(_job("poison"))
+    job = q.dequeue_job()
+    q.dead_letter_job(job, "boom")
+    assert q.queue_stats()[q.LANE_INTERACTIVE]["depth"] == 0
+    [(_, fields)] = redis_store.xrange(q.DEAD_LETTER_STREAM)
+    assert json.loads(fields["data"]) == _job("poison")
+    assert fields["error"] == "boom"
+    assert fields["stream"] == q.JOB_STREAM
+
+def test_migrate_legacy_queue_keeps_order(redis_store):
+    for i in range(3):
+        redis_store.rpush(q.LEGACY_QUEUE, json.dumps(_job(f"old-{i}")))
+    assert q.migrate_legacy_queue() == 3
+    assert redis_store.lpop(q.LEGACY_QUEUE) is None
+    assert q.migrate_legacy_queue() == 0
+    ids = []
+    for _ in range(3):
+        job = q.dequeue_job()
+        ids.append(job["job_id"])
+        q.ack_job(job)
+    assert ids == ["old-0", "old-1", "old-2"]
+
+def test_enqueue_on_a_pipeline_waits_for_execute(redis_store):
+    pipe = redis_store.pipeline()
+    pipe.set("job:a", "{}")
+    q.enqueue_job(_job("a"), q.LANE_INTERACTIVE, pipe=pipe)
+    assert redis_store.xlen(q.JOB_STREAM) == 0
+    pipe.execute()
+    assert redis_store.xlen(q.JOB_STREAM) == 1
+
+def test_async_enqueue_on_a_pipeline_waits_for_execute(redis_store):
+    async def run():
+        pipe = q.ar.pipeline()
+        await q.enqueue_job_async(_job("a"), q.LANE_BULK, pipe=pipe)
+        assert redis_store.xlen(q.BULK_JOB_STREAM) == 0
+        await pipe.execute()
+    asyncio.run(run())
+    assert redis_store.xlen(q.BULK_JOB_STREAM) == 1
+
+def test_admission_limit(monkeypatch):
+    monkeypatch.setitem(q.MAX_QUEUE_DEPTH, q.LANE_INTERACTIVE, 2)
+    q.enqueue_job(_job("a"))
+    assert q.admission_retry_after(q.LANE_INTERACTIVE) is None
+    assert q.admission_retry_after(q.LANE_INTERACTIVE, incoming=2) == q.QUEUE_RETRY_AFTER_S
+    q.enqueue_job(_job("b"))
+    assert q.admission_retry_after(q.LANE_INTERACTIVE) == q.QUEUE_RETRY_AFTER_S
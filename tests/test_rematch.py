@@ -0,0 +1,108 @@
+import json
+
+import numpy as np
+import pytest
+
+from app import rematch, results
+from app.queue_config import rb
+
+DIM = 16
+
+
+@pytest.fixture(autouse=True)
+def no_filters(monkeypatch):
+    monkeypatch.setattr(rematch, "MATCH_DATE_WINDOW_DAYS", 0)
+    monkeypatch.setattr(rematch, "MATCH_FILTER_ZONE", False)
+    monkeypatch.setattr(rematch, "MATCH_FILTER_CATEGORY", False)
+
+def _sides(n_lost=12, n_found=9, seed=0):
+    # Noisy photographs of a few items, so most reports have more candidates
+    # above MEDIUM_CONFIDENCE than k; view counts vary per report
+    rng = np.random.default_rng(seed)
+    bases = rng.standard_normal((3, DIM))
+    locations = ["Library", "Gym", None]
+
+    def report(prefix, i, base, job_type):
+        views = base + 0.35 * rng.standard_normal((int(rng.integers(1, 4)), DIM))
+        meta = {"job_id": f"{prefix}{i}", "location": locations[i % 3], "itemName": "Bag", "type": job_type}
+        return {"job_id": meta["job_id"], "meta": meta, "vectors": views.astype(np.float32)}
+
+    found = [report("f", i, bases[i % len(bases)], "found_report") for i in range(n_found)]
+    lost = [report("l", i, bases[int(rng.integers(len(bases)))], "lost_report") for i in range(n_lost)]
+    vocab = {}
+    return lost, found, rematch.Side(lost, vocab), rematch.Side(found, vocab)
+
+def _brute_force(lost, found, k):
+    def score(a, b):
+        va = a["vectors"] / np.linalg.norm(a["vectors"], axis=1, keepdims=True)
+        vb = b["vectors"] / np.linalg.norm(b["vectors"], axis=1, keepdims=True)
+        same = a["meta"]["location"] and a["meta"]["location"] == b["meta"]["location"]
+        return min(1.0, rematch.W_EMBED * (float((va @ vb.T).max()) + 1) / 2 + rematch.W_LOC * (1.0 if same else 0.7))
+    scores = np.array([[score(a, b) for b in found] for a in lost])
+    pairs = {}
+    for i in range(len(lost)):
+        for j in np.argsort(-scores[i])[:k]:
+            if scores[i, j] >= results.MEDIUM_CONFIDENCE:
+                pairs[(i, int(j))] = scores[i, j]
+    for j in range(len(found)):
+        for i in np.argsort(-scores[:, j])[:k]:
+            if scores[i, j] >= results.MEDIUM_CONFIDENCE:
+                pairs[(int(i), j)] = scores[i, j]
+    return pairs
+
+@pytest.mark.parametrize("block_rows", [1, 5, 4096])
+def test_match_all_agrees_with_brute_force(block_rows):
+    lost, found, lost_side, found_side = _sides()
+    pairs = rematch.match_all(lost_side, found_side, k=2, block_rows=block_rows)
+    expected = _brute_force(lost, found, k=2)
+    # Otherwise the top-k cut is not exercised
+    assert 0 < len(expected) < len(_brute_force(lost, found, k=len(found)))
+    assert set(pairs) == set(expected)
+    for pair, score in pairs.items():
+        assert score == pytest.approx(expected[pair], abs=1e-5)
+
+def test_side_skips_duplicates_and_empty_reports():
+    lost, _, _, _ = _sides()
+    empty = {"job_id": "empty", "meta": {}, "vectors": np.zeros((0, DIM), dtype=np.float32)}
+    side = rematch.Side([lost[0], lost[0], empty, lost[1]], {})
+    assert side.job_ids == ["l0", "l1"]
+    assert len(side.vectors) == len(lost[0]["vectors"]) + len(lost[1]["vectors"])
+
+def _store_jobs(redis_store, lost, found):
+    for report in lost:
+        redis_store.set(f"job:{report['job_id']}", json.dumps({"type": "user_complaint", "user_id": "u1"}))
+    for report in found:
+        redis_store.set(f"job:{report['job_id']}", json.dumps({"type": "admin_found"}))
+
+def test_plan_writes_is_idempotent(redis_store):
+    lost, found, lost_side, found_side = _sides()
+    _store_jobs(redis_store, lost, found)
+    pairs = rematch.match_all(lost_side, found_side, k=3)
+
+    writes = rematch.plan_writes(lost_side, found_side, pairs)
+    assert writes and all(status == "matched" for _, status, _ in writes.values())
+    rematch.apply_writes(writes)
+    record = results.decode(rb.get(f"result:{next(iter(writes))}"))
+    assert record["status"] == "matched" and record["refs"]
+
+    assert rematch.plan_writes(lost_side, found_side, pairs) == {}
+
+def test_plan_writes_skips_jobs_gone_from_redis(redis_store):
+    lost, found, lost_side, found_side = _sides()
+    _store_jobs(redis_store, lost, found)
+    pairs = rematch.match_all(lost_side, found_side, k=3)
+    gone = lost_side.job_ids[next(iter(pairs))[0]]
+    redis_store.delete(f"job:{gone}")
+
+    writes = rematch.plan_writes(lost_side, found_side, pairs)
+    assert gone not in writes
+    assert all(ref_id != gone for _, _, matches in writes.values() for ref_id, _ in matches)
+
+def test_prune_resets_reports_that_no_longer_match(redis_store):
+    lost, found, lost_side, found_side = _sides()
+    _store_jobs(redis_store, lost, found)
+    results.write(redis_store, "l0", "matched", [{"meta": {"job_id": "f0"}, "score": 0.95}], "Match")
+
+    assert "l0" not in rematch.plan_writes(lost_side, found_side, {})
+    writes = rematch.plan_writes(lost_side, found_side, {}, prune=True)
+    assert writes == {"l0": (json.loads(redis_store.get("job:l0")), "no_match", [])}
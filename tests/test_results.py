@@ -0,0 +1,72 @@
+import json
+
+from app import results
+from app.queue_config import rb
+
+
+def _matches(*pairs):
+    return [{"meta": {"job_id": job_id, "itemName": "Bag"}, "score": score} for job_id, score in pairs]
+
+def test_tier():
+    assert results.tier(results.HIGH_CONFIDENCE) == results.TIER_HIGH
+    assert results.tier(results.MEDIUM_CONFIDENCE) == results.TIER_MEDIUM
+    assert results.tier(results.MEDIUM_CONFIDENCE - 0.01) == results.TIER_NONE
+
+def test_compact_keeps_only_references():
+    record = results.compact("matched", _matches(("a", 0.951234), ("b", 0.8)) + [{"meta": {}, "score": 0.99}], "Match")
+    assert record == {
+        "status": "matched",
+        "message": "Match",
+        "refs": [("a", 0.9512, results.TIER_HIGH), ("b", 0.8, results.TIER_MEDIUM)],
+    }
+
+def test_encode_decode_round_trip():
+    record = results.compact("matched", _matches(("a", 0.95), ("b", 0.75)), "Match")
+    raw = results.encode(record)
+    assert not results.is_legacy(raw)
+    assert results.decode(raw) == record
+
+def test_decode_missing_is_none():
+    assert results.decode(None) is None
+
+def test_write_sets_a_ttl(redis_store):
+    results.write(redis_store, "j1", "no_match", message="None")
+    assert 0 < redis_store.ttl("result:j1") <= results.RESULT_TTL_S
+    assert results.decode(rb.get("result:j1"))["status"] == "no_match"
+
+def test_legacy_json_record_is_read():
+    raw = json.dumps({"status": "matched", "matches": _matches(("a", 0.93)), "message": "Old"})
+    assert results.is_legacy(raw)
+    assert results.decode(raw) == {"status": "matched", "message": "Old", "refs": [("a", 0.93, results.TIER_HIGH)]}
+
+def test_without_keeps_a_match_with_references_left():
+    record = results.compact("matched", _matches(("a", 0.95), ("b", 0.8)), "Match")
+    out = results.without(record, {"a"}, "user_complaint")
+    assert out["status"] == "matched" and out["message"] == "Match"
+    assert [ref[0] for ref in out["refs"]] == ["b"]
+    # The input record is not modified
+    assert len(record["refs"]) == 2
+
+def test_without_resets_a_match_with_no_references_left():
+    record = results.compact("matched", _matches(("a", 0.95)), "Match")
+    out = results.without(record, {"a"}, "admin_found")
+    assert out == {"status": "no_match", "message": results.no_match_message("admin_found"), "refs": []}
+    assert results.without(record, {"a"}, "user_complaint")["message"] == results.no_match_message("user_complaint")
+
+def test_without_leaves_other_statuses_alone():
+    record = results.compact("error", [], "Failed")
+    assert results.without(record, {"a"}, "user_complaint") == record
+
+def test_referenced_ids():
+    records = [results.compact("matched", _matches(("a", 0.9), ("b", 0.8))), None, results.compact("matched", _matches(("c", 0.9)))]
+    assert results.referenced_ids(records) == {"a", "b", "c"}
+
+def test_expand_reads_metadata_and_skips_deleted_jobs():
+    record = results.compact("matched", _matches(("a", 0.95), ("gone", 0.9)), "Match")
+    meta = results.meta_from_job("a", {"type": "admin_found", "location": "Library", "date": "2024-01-02", "itemName": "Bag"})
+    assert meta["type"] == "found_report"
+    assert results.expand(record, {"a": meta}) == {
+        "status": "matched",
+        "message": "Match",
+        "matches": [{"meta": meta, "score": 0.95}],
+    }
@@ -0,0 +1,81 @@
+import time
+import datetime
+
+import numpy as np
+
+from app import retention
+from app.faiss_db import FaissImageDB
+
+DIM = 8
+DAY_S = 24 * 3600
+
+
+def _add(db, job_id, age_days, views=2, date=None):
+    now = time.time()
+    rng = np.random.default_rng(len(db.metadata))
+    for exemplar in range(views):
+        db.add_embedding(rng.standard_normal(DIM).astype(np.float32), {
+            "job_id": job_id, "exemplar": exemplar, "type": "lost_report", "location": "Library",
+            "date": date, "timestamp": now - age_days * DAY_S,
+        })
+
+def _jobs(db):
+    return sorted(db.live_job_ids())
+
+def test_reports_age_out_by_ingest_time_with_every_view(monkeypatch):
+    monkeypatch.setattr(retention, "RETENTION_DAYS", 30)
+    hot, archive = FaissImageDB(dim=DIM), FaissImageDB(dim=DIM)
+    recent_date = datetime.date.today().isoformat()
+    # Filed long ago about a recent loss, and filed today about an old one
+    _add(hot, "old", age_days=40, views=3, date=recent_date)
+    _add(hot, "new", age_days=1, date="2001-01-01")
+
+    report = retention.apply_retention(hot, archive)
+
+    assert report["archived_jobs"] == 1 and report["archived_rows"] == 3
+    assert _jobs(hot) == ["new"] and hot.index.ntotal == 2
+    assert _jobs(archive) == ["old"] and archive.index.ntotal == 3
+    assert sorted(m["exemplar"] for m in archive.metadata) == [0, 1, 2]
+    # A second pass has nothing to do
+    assert not retention.report_changed(retention.apply_retention(hot, archive))
+
+def test_tombstones_are_compacted_not_archived(monkeypatch):
+    monkeypatch.setattr(retention, "RETENTION_DAYS", 30)
+    hot, archive = FaissImageDB(dim=DIM), FaissImageDB(dim=DIM)
+    _add(hot, "deleted-old", age_days=40)
+    _add(hot, "deleted-new", age_days=1)
+    hot.remove_by_job_id("deleted-old")
+    hot.remove_by_job_id("deleted-new")
+
+    report = retention.apply_retention(hot, archive)
+
+    assert report["archived_jobs"] == 0 and report["compacted_rows"] == 4
+    assert hot.index.ntotal == 0 and archive.index.ntotal == 0
+
+def test_orphans_are_purged_from_the_hot_index(redis_store):
+    hot, archive = FaissImageDB(dim=DIM), FaissImageDB(dim=DIM)
+    _add(hot, "kept", age_days=1)
+    _add(hot, "orphan", age_days=1)
+    redis_store.set("job:kept", "{}")
+
+    report = retention.apply_retention(hot, archive, redis_client=redis_store)
+
+    assert report["orphan_jobs"] == 1 and report["orphan_rows"] == 2
+    assert _jobs(hot) == ["kept"]
+
+def test_find_orphans_batches(redis_store, monkeypatch):
+    monkeypatch.setattr(retention, "ORPHAN_CHECK_BATCH", 2)
+    for job_id in ("a", "c"):
+        redis_store.set(f"job:{job_id}", "{}")
+    assert retention.find_orphans(["a", "b", "c", "d", "e"], redis_store) == {"b", "d", "e"}
+
+def test_archive_rows_expire_after_archive_max_days(monkeypatch):
+    monkeypatch.setattr(retention, "ARCHIVE_MAX_DAYS", 365)
+    hot, archive = FaissImageDB(dim=DIM), FaissImageDB(dim=DIM)
+    _add(archive, "ancient", age_days=400)
+    _add(archive, "archived", age_days=100)
+
+    report = retention.apply_retention(hot, archive)
+
+    assert report["expired_archive_rows"] == 2
+    assert _jobs(archive) == ["archived"]
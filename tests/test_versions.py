@@ -0,0 +1,76 @@
+from app import versions
+from app.clean_redis import Audit
+
+
+def _tag(client, names, now=0.0):
+    return versions.tag(names, client.hmget(versions.VERSIONS_KEY, versions.fields(names)), now=now)
+
+def test_collections():
+    assert versions.collections({"type": "user_complaint", "user_id": "u1"}) == ["jobs:lost_all", "user:jobs:u1"]
+    assert versions.collections({"type": "user_complaint"}) == ["jobs:lost_all"]
+    assert versions.collections({"type": "admin_found"}) == ["jobs:all"]
+    assert versions.collections({}) == []
+
+def test_tag_is_weak_and_stable(redis_store):
+    etag, modified = _tag(redis_store, ["jobs:all"])
+    assert etag.startswith('W/"')
+    assert modified is None
+    assert _tag(redis_store, ["jobs:all"])[0] == etag
+
+def test_bump_changes_only_the_scopes_it_touches(redis_store):
+    lost, found = _tag(redis_store, ["jobs:lost_all"])[0], _tag(redis_store, ["jobs:all"])[0]
+    pipe = redis_store.pipeline()
+    versions.bump_job(pipe, "j1", {"type": "user_complaint", "user_id": "u1"})
+    pipe.execute()
+    assert _tag(redis_store, ["jobs:lost_all"])[0] != lost
+    assert _tag(redis_store, ["jobs:all"])[0] == found
+    assert _tag(redis_store, [versions.job_scope("j1")])[1] is not None
+
+def test_epoch_bump_invalidates_every_tag(redis_store):
+    before = _tag(redis_store, ["jobs:all"])[0]
+    pipe = redis_store.pipeline()
+    versions.bump(pipe, [versions.EPOCH])
+    pipe.execute()
+    assert _tag(redis_store, ["jobs:all"])[0] != before
+
+def test_tag_rolls_over_with_age(redis_store):
+    assert _tag(redis_store, ["jobs:all"], now=0.0)[0] != _tag(redis_store, ["jobs:all"], now=versions.VERSION_MAX_AGE_S)[0]
+
+def test_not_modified():
+    etag = 'W/"abc"'
+    assert versions.not_modified('W/"abc"', etag)
+    assert versions.not_modified('"abc"', etag)
+    assert versions.not_modified('"x", W/"abc"', etag)
+    assert versions.not_modified("*", etag)
+    assert not versions.not_modified('"x"', etag)
+    assert not versions.not_modified(None, etag)
+
+def test_job_of_field():
+    assert versions.job_of_field("job:abc") == "abc"
+    assert versions.job_of_field("job:abc:t") == "abc"
+    assert versions.job_of_field("jobs:all") is None
+    assert versions.job_of_field("user:jobs:u1") is None
+
+def test_forget_job(redis_store):
+    pipe = redis_store.pipeline()
+    versions.bump_job(pipe, "j1", {})
+    versions.forget_job(pipe, "j1")
+    pipe.execute()
+    assert redis_store.hgetall(versions.VERSIONS_KEY) == {}
+
+def test_clean_redis_prunes_versions_of_expired_jobs(redis_store):
+    redis_store.set("job:live", "{}")
+    pipe = redis_store.pipeline()
+    versions.bump_job(pipe, "live", {"type": "admin_found"})
+    versions.bump_job(pipe, "gone", {"type": "admin_found"})
+    pipe.execute()
+
+    report = Audit().run(["versions"])
+    assert report["findings"]["stale_versions"]["count"] == 2
+    assert "job:gone" in redis_store.hgetall(versions.VERSIONS_KEY)
+
+    Audit(apply=True).run(["versions"])
+    fields = redis_store.hgetall(versions.VERSIONS_KEY)
+    assert "job:gone" not in fields and "job:gone:t" not in fields
+    # The live job's counters and the listing counter stay
+    assert {"job:live", "job:live:t", "jobs:all", "jobs:all:t"} <= set(fields)